@@ -2,18 +2,26 @@ import os
 import json
 import re
 import logging
-import time
 import markdown
 import tempfile
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Fix the imports for the prompts module
 try:
-    from prompts import EVALUATION_PROMPT, get_professors
+    from prompts import (EVALUATION_PROMPT, SINGLE_CALL_EVALUATION_PROMPT, BATCH_EVALUATION_PROMPT,
+                         BATCH_QUESTION_TEMPLATE, get_professors, persona_fields)
 except ImportError:
     try:
-        from .prompts import EVALUATION_PROMPT, get_professors
+        from .prompts import (EVALUATION_PROMPT, SINGLE_CALL_EVALUATION_PROMPT, BATCH_EVALUATION_PROMPT,
+                              BATCH_QUESTION_TEMPLATE, get_professors, persona_fields)
     except ImportError:
         EVALUATION_PROMPT = "Evaluate the student's answers to the following questions."
+        SINGLE_CALL_EVALUATION_PROMPT = None
+        BATCH_EVALUATION_PROMPT = None
+        BATCH_QUESTION_TEMPLATE = None
+        persona_fields = None
         def get_professors(question_paper_text=None):
             return [
                 {
@@ -27,7 +35,9 @@ except ImportError:
             ]
 
 from dotenv import load_dotenv
-import google.generativeai as genai
+import llm_backend
+from mapper import extract_json_from_text
+from result_cache import ResultCache, make_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,13 +51,41 @@ logging.getLogger().addHandler(file_handler)
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise Exception("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=api_key)
+# Number of questions evaluated concurrently; each runs its three persona calls in parallel
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", 3))
+# "multi_agent": three persona calls and a consensus call per question
+# "single_call": one structured-JSON call per question, rendered to the same markdown locally
+# "batched": like single_call, but several questions share a call up to a token budget
+EVAL_MODE = os.getenv("EVAL_MODE", "multi_agent")
+EVAL_MODES = ("multi_agent", "single_call", "batched")
+# Attempts at getting parseable JSON in single_call mode before falling back to multi_agent
+SINGLE_CALL_ATTEMPTS = 2
+# Estimated prompt plus response tokens allowed per batched request
+EVAL_BATCH_TOKEN_BUDGET = int(os.getenv("EVAL_BATCH_TOKEN_BUDGET", 6000))
+EVAL_BATCH_MAX_QUESTIONS = int(os.getenv("EVAL_BATCH_MAX_QUESTIONS", 10))
+# Expected response tokens for one question's JSON result
+BATCH_OUTPUT_TOKENS_PER_QUESTION = 250
 
-def evaluate_answers(extracted_text, file_name, question_paper_text=None):
+# Per-question evaluation cache, so re-evaluating the same sheet makes no model calls
+EVAL_CACHE_ENABLED = os.getenv("EVAL_CACHE_ENABLED", "true").lower() == "true"
+
+evaluation_cache = ResultCache(
+    "evaluations",
+    path=os.getenv("EVAL_CACHE_PATH"),
+    max_entries=int(os.getenv("EVAL_CACHE_MAX_ENTRIES", 20000)),
+    max_bytes=int(os.getenv("EVAL_CACHE_MAX_MB", 100)) * 1024 * 1024,
+    ttl_seconds=int(os.getenv("EVAL_CACHE_TTL_DAYS", 30)) * 86400,
+)
+
+# Result of evaluating one question. ``complete`` is False when any model
+# call failed or the mode fell back to another prompt, in which case the
+# result is not cached.
+QuestionResult = namedtuple("QuestionResult", ["section", "score", "consensus_text", "complete"])
+
+# The "## Question N: ..." heading of a consensus section
+QUESTION_HEADING = re.compile(r"^#{1,6}[ \t]*Question\b[^\n]*\n?", re.MULTILINE | re.IGNORECASE)
+
+def evaluate_answers(extracted_text, file_name, question_paper_text=None, on_question=None):
 
     logging.info(f"Starting evaluation for file: {file_name}")
     logging.debug(f"Answer text: {extracted_text}")
@@ -92,7 +130,7 @@ def evaluate_answers(extracted_text, file_name, question_paper_text=None):
         raise Exception("Failed to evaluate - could not match questions with answers")
     
     # Evaluate using the multi-agent system (fallback mode removed)
-    evaluation_output = multi_agent_evaluate_answers(qa_mapping, question_paper_text)
+    evaluation_output = multi_agent_evaluate_answers(qa_mapping, question_paper_text, on_question)
     with open(markdown_file_path, 'w', encoding='utf-8') as f:
         f.write(evaluation_output)
     
@@ -100,51 +138,18 @@ def evaluate_answers(extracted_text, file_name, question_paper_text=None):
 
 def get_gemini_model():
 
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key:
+    if not llm_backend.is_configured():
         raise Exception("GEMINI_API_KEY not found in environment variables")
     
-    # Use the specified Gemini model
-    model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21')
+    # Use the specified Gemini model (or the configured llm_backend stand-in)
+    model = llm_backend.get_model()
     logging.info("Gemini model initialized successfully")
     return model
 
-def multi_agent_evaluate_answers(qa_mapping, question_paper_text=None):
+EVALUATOR_KEYS = ["Theoretical_Evaluator", "Practical_Evaluator", "Holistic_Evaluator"]
 
-    logging.info("Starting multi-agent evaluation of answers")
-    
-    # Get the model
-    try:
-        model = get_gemini_model()
-    except Exception as e:
-        logging.error(f"Error initializing Gemini model: {e}")
-        raise Exception(f"Error initializing Gemini model: {e}")
-    
-    # Initialize professor personas from prompts
-    professors = get_professors(question_paper_text)
-    
-    # Create an evaluation report
-    markdown_report = "# Student Answer Evaluation\n\n"
-    total_marks = 0
-    max_total_marks = 0
-    
-    for item in qa_mapping:
-        question_num = item['questionNumber']
-        question_text = item['questionText']
-        max_marks = item['maxMarks']
-        max_total_marks += max_marks
-        answer = item['answer']
-        
-        logging.info(f"Evaluating question {question_num}")
-        
-        # Step 1: Individual Evaluations
-        evaluations = {}
-        
-        for evaluator_key in ["Theoretical_Evaluator", "Practical_Evaluator", "Holistic_Evaluator"]:
-            evaluator = professors[evaluator_key]
-            
-            # Create evaluation prompt for each persona
-            eval_prompt = f"""
+def _persona_prompt(evaluator, question_num, question_text, answer, max_marks):
+    return f"""
             You are {evaluator['name']}, evaluating a student's answer on Object-Oriented Programming.
             
             QUESTION {question_num} [{max_marks} marks]:
@@ -173,54 +178,11 @@ def multi_agent_evaluate_answers(qa_mapping, question_paper_text=None):
             
             **Proposed Grade:** [X] out of {max_marks}
             """
-            
-            try:
-                response = model.generate_content(eval_prompt)
-                if hasattr(response, 'text'):
-                    evaluations[evaluator_key] = response.text
-                    logging.info(f"Completed {evaluator_key} evaluation for question {question_num}")
-                else:
-                    evaluations[evaluator_key] = f"## {evaluator['name']} Evaluation\n\n**Error:** Unable to generate evaluation.\n\n**Proposed Grade:** 0 out of {max_marks}"
-                    logging.error(f"Empty response from Gemini for {evaluator_key} evaluation")
-                
-                # Add a 5-second sleep to prevent resource exhaustion
-                time.sleep(2)
-                
-            except Exception as e:
-                evaluations[evaluator_key] = f"## {evaluator['name']} Evaluation\n\n**Error:** {str(e)}\n\n**Proposed Grade:** 0 out of {max_marks}"
-                logging.error(f"Error in {evaluator_key} evaluation: {e}")
-        
-        # Step 2 & 3: Group Discussion and Consensus
-        consensus_evaluator = professors["Consensus_Evaluator"]
-        
-        # Extract scores from each evaluator for inclusion in the final output
-        theoretical_score = "N/A"
-        practical_score = "N/A"
-        holistic_score = "N/A"
-        
-        try:
-            theoretical_score_match = re.search(r"\*\*Proposed Grade:\*\* (\d+(?:\.\d+)?)", evaluations["Theoretical_Evaluator"])
-            if theoretical_score_match:
-                theoretical_score = theoretical_score_match.group(1)
-        except:
-            pass
-            
-        try:
-            practical_score_match = re.search(r"\*\*Proposed Grade:\*\* (\d+(?:\.\d+)?)", evaluations["Practical_Evaluator"])
-            if practical_score_match:
-                practical_score = practical_score_match.group(1)
-        except:
-            pass
-            
-        try:
-            holistic_score_match = re.search(r"\*\*Proposed Grade:\*\* (\d+(?:\.\d+)?)", evaluations["Holistic_Evaluator"])
-            if holistic_score_match:
-                holistic_score = holistic_score_match.group(1)
-        except:
-            pass
-        
-        consensus_prompt = f"""
-        You are {consensus_evaluator['name']}, facilitating a final consensus evaluation.
+
+def _consensus_prompt(evaluator, question_num, question_text, answer, max_marks, evaluations,
+                      theoretical_score, practical_score, holistic_score):
+    return f"""
+        You are {evaluator['name']}, facilitating a final consensus evaluation.
         
         QUESTION {question_num} [{max_marks} marks]:
         {question_text}
@@ -261,32 +223,501 @@ def multi_agent_evaluate_answers(qa_mapping, question_paper_text=None):
         **Areas for Improvement:**
         - [bullet point areas for improvement]
         """
+
+def _run_persona(model, evaluator_key, evaluator, question_num, question_text, answer, max_marks):
+    """Run one evaluator persona and return (markdown evaluation, succeeded)."""
+    eval_prompt = _persona_prompt(evaluator, question_num, question_text, answer, max_marks)
+    try:
+        response = model.generate_content(eval_prompt)
+        if hasattr(response, 'text'):
+            logging.info(f"Completed {evaluator_key} evaluation for question {question_num}")
+            return response.text, True
+        logging.error(f"Empty response from Gemini for {evaluator_key} evaluation")
+        return f"## {evaluator['name']} Evaluation\n\n**Error:** Unable to generate evaluation.\n\n**Proposed Grade:** 0 out of {max_marks}", False
+    except Exception as e:
+        logging.error(f"Error in {evaluator_key} evaluation: {e}")
+        return f"## {evaluator['name']} Evaluation\n\n**Error:** {str(e)}\n\n**Proposed Grade:** 0 out of {max_marks}", False
+
+def _proposed_grade(evaluation):
+    """Extract the proposed grade from a persona evaluation, or "N/A"."""
+    try:
+        match = re.search(r"\*\*Proposed Grade:\*\* (\d+(?:\.\d+)?)", evaluation)
+        if match:
+            return match.group(1)
+    except:
+        pass
+    return "N/A"
+
+def _evaluate_question(model, professors, item, persona_pool):
+    """
+    Evaluate one question: three personas in parallel, then the consensus call.
+    
+    Args:
+        model: Model handle from get_gemini_model
+        professors (dict): Evaluator personas from get_professors
+        item (dict): questionNumber, questionText, maxMarks and answer
+        persona_pool (ThreadPoolExecutor): Pool running the persona calls
+        
+    Returns:
+        QuestionResult: Report section, score (None if it could not be extracted)
+        and consensus text
+    """
+    question_num = item['questionNumber']
+    question_text = item['questionText']
+    max_marks = item['maxMarks']
+    answer = item['answer']
+    
+    logging.info(f"Evaluating question {question_num}")
+    
+    # Step 1: Individual Evaluations, all three personas at once
+    futures = {
+        evaluator_key: persona_pool.submit(
+            _run_persona, model, evaluator_key, professors[evaluator_key],
+            question_num, question_text, answer, max_marks
+        )
+        for evaluator_key in EVALUATOR_KEYS
+    }
+    evaluations = {}
+    personas_ok = True
+    for evaluator_key, future in futures.items():
+        evaluations[evaluator_key], ok = future.result()
+        personas_ok = personas_ok and ok
+    
+    # Step 2 & 3: Group Discussion and Consensus
+    consensus_evaluator = professors["Consensus_Evaluator"]
+    
+    # Extract scores from each evaluator for inclusion in the final output
+    theoretical_score = _proposed_grade(evaluations["Theoretical_Evaluator"])
+    practical_score = _proposed_grade(evaluations["Practical_Evaluator"])
+    holistic_score = _proposed_grade(evaluations["Holistic_Evaluator"])
+    
+    consensus_prompt = _consensus_prompt(
+        consensus_evaluator, question_num, question_text, answer, max_marks, evaluations,
+        theoretical_score, practical_score, holistic_score
+    )
+    
+    section = ""
+    score = None
+    consensus_text = ""
+    try:
+        consensus_response = model.generate_content(consensus_prompt)
+        if hasattr(consensus_response, 'text'):
+            consensus_text = consensus_response.text
+            section = consensus_text + "\n\n"
+            
+            # Try to extract the score
+            try:
+                score_line = [line for line in consensus_text.split('\n') if '**Score:**' in line][0]
+                score_str = score_line.split('**Score:**')[1].strip().split(' ')[0]
+                score = float(score_str)
+                logging.info(f"Score for question {question_num}: {score} out of {max_marks}")
+            except Exception as e:
+                logging.warning(f"Could not extract score for question {question_num}: {e}")
+        else:
+            section += f"## Question {question_num}\n\n"
+            section += f"**Score:** 0 out of {max_marks}\n\n"
+            section += "**Feedback:**\nUnable to generate consensus evaluation.\n\n"
+            logging.error(f"Empty consensus response for question {question_num}")
+    except Exception as e:
+        section += f"## Question {question_num}\n\n"
+        section += f"**Score:** 0 out of {max_marks}\n\n"
+        section += f"**Feedback:**\nError in consensus evaluation: {str(e)}\n\n"
+        logging.error(f"Error in consensus evaluation for question {question_num}: {e}")
+    
+    return QuestionResult(section, score, consensus_text, personas_ok and score is not None)
+
+PERSPECTIVES = [("theoretical", "Theoretical"), ("practical", "Practical"), ("holistic", "Holistic")]
+
+def _validate_result(result):
+    """Check a structured result and coerce its scores to float; None if unusable."""
+    if not isinstance(result, dict):
+        return None
+    try:
+        for key in [key for key, _ in PERSPECTIVES] + ["consensus"]:
+            section = result[key]
+            section["score"] = float(section["score"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return result
+
+def _parse_single_call(text):
+    """
+    Parse and validate a single-call evaluation response.
+    
+    Returns:
+        dict or None: The parsed result with numeric scores, or None if the
+        response is not usable
+    """
+    return _validate_result(extract_json_from_text(text))
+
+def _format_number(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+def render_single_call_section(question_num, question_text, max_marks, result):
+    """
+    Render a single-call JSON result as the markdown the consensus step produces.
+    
+    Args:
+        question_num: Question number
+        question_text (str): Question text
+        max_marks: Marks available for the question
+        result (dict): Parsed response from _parse_single_call
         
+    Returns:
+        str: Markdown section for the question
+    """
+    consensus = result["consensus"]
+    lines = [
+        f"## Question {question_num}: {question_text}",
+        "",
+        f"**Score:** {_format_number(consensus['score'])} out of {max_marks}",
+        "",
+        "**Individual Scores:**",
+    ]
+    for key, label in PERSPECTIVES:
+        lines.append(f"- {label} Perspective: {_format_number(result[key]['score'])} out of {max_marks}")
+    lines += ["", "**Consensus Feedback:**", str(consensus.get("feedback", "")).strip(), "", "**Strengths:**"]
+    lines += [f"- {point}" for point in consensus.get("strengths") or []]
+    lines += ["", "**Areas for Improvement:**"]
+    lines += [f"- {point}" for point in consensus.get("improvements") or []]
+    return "\n".join(lines)
+
+def _evaluate_question_single_call(model, professors, item, persona_pool):
+    """
+    Evaluate one question with a single structured-JSON call.
+    
+    Takes the same arguments and returns a QuestionResult like
+    _evaluate_question, which it falls back to if the response
+    cannot be parsed after SINGLE_CALL_ATTEMPTS tries. A fallback
+    result is marked incomplete so it is not cached.
+    """
+    question_num = item['questionNumber']
+    max_marks = item['maxMarks']
+    prompt = SINGLE_CALL_EVALUATION_PROMPT.format(
+        **persona_fields(professors),
+        question_num=question_num,
+        max_marks=max_marks,
+        question_text=item['questionText'],
+        answer=item['answer'],
+    )
+    
+    logging.info(f"Evaluating question {question_num} (single call)")
+    for attempt in range(1, SINGLE_CALL_ATTEMPTS + 1):
         try:
-            consensus_response = model.generate_content(consensus_prompt)
-            if hasattr(consensus_response, 'text'):
-                consensus_text = consensus_response.text
-                markdown_report += consensus_text + "\n\n"
-                
-                # Try to extract the score
-                try:
-                    score_line = [line for line in consensus_text.split('\n') if '**Score:**' in line][0]
-                    score_str = score_line.split('**Score:**')[1].strip().split(' ')[0]
-                    score = float(score_str)
-                    total_marks += score
-                    logging.info(f"Score for question {question_num}: {score} out of {max_marks}")
-                except Exception as e:
-                    logging.warning(f"Could not extract score for question {question_num}: {e}")
-            else:
-                markdown_report += f"## Question {question_num}\n\n"
-                markdown_report += f"**Score:** 0 out of {max_marks}\n\n"
-                markdown_report += "**Feedback:**\nUnable to generate consensus evaluation.\n\n"
-                logging.error(f"Empty consensus response for question {question_num}")
+            response = model.generate_content(prompt)
+            result = _parse_single_call(getattr(response, 'text', None))
+            if result is not None:
+                return _single_call_result(item, result)
+            logging.warning(f"Unparseable single-call evaluation for question {question_num} on attempt {attempt}")
         except Exception as e:
-            markdown_report += f"## Question {question_num}\n\n"
-            markdown_report += f"**Score:** 0 out of {max_marks}\n\n"
-            markdown_report += f"**Feedback:**\nError in consensus evaluation: {str(e)}\n\n"
-            logging.error(f"Error in consensus evaluation for question {question_num}: {e}")
+            logging.error(f"Error in single-call evaluation for question {question_num} on attempt {attempt}: {e}")
+    
+    logging.warning(f"Falling back to multi-agent evaluation for question {question_num}")
+    # Not cached: the cache key is for the single-call prompt, not the one used here
+    return _evaluate_question(model, professors, item, persona_pool)._replace(complete=False)
+
+def _single_call_result(item, result):
+    """Turn a validated structured result into a QuestionResult."""
+    question_num = item['questionNumber']
+    consensus_text = render_single_call_section(question_num, item['questionText'], item['maxMarks'], result)
+    score = result["consensus"]["score"]
+    logging.info(f"Score for question {question_num}: {score} out of {item['maxMarks']}")
+    return QuestionResult(consensus_text + "\n\n", score, consensus_text, True)
+
+def _batch_question_block(index, item):
+    return BATCH_QUESTION_TEMPLATE.format(
+        index=index,
+        question_num=item['questionNumber'],
+        max_marks=item['maxMarks'],
+        question_text=item['questionText'],
+        answer=item['answer'],
+    )
+
+def plan_batches(qa_mapping, token_budget=None, max_questions=None, professors=None):
+    """
+    Group questions into batched evaluation requests under a token budget.
+    
+    Questions are packed greedily in order. Each costs its prompt block
+    plus the expected size of its JSON result, so short answers share a
+    request with many others while a long answer may get one to itself.
+    
+    Args:
+        qa_mapping (list): Dictionaries with questionNumber, questionText, maxMarks and answer
+        token_budget (int, optional): Estimated tokens per request, defaults to EVAL_BATCH_TOKEN_BUDGET
+        max_questions (int, optional): Questions per request, defaults to EVAL_BATCH_MAX_QUESTIONS
+        professors (dict, optional): Personas the prompt is formatted with, defaults to get_professors()
+        
+    Returns:
+        list: Lists of indexes into qa_mapping, one list per request
+    """
+    token_budget = token_budget or EVAL_BATCH_TOKEN_BUDGET
+    max_questions = max(1, max_questions or EVAL_BATCH_MAX_QUESTIONS)
+    overhead = llm_backend.estimate_tokens(
+        BATCH_EVALUATION_PROMPT.format(questions="", **persona_fields(professors or get_professors())))
+    
+    batches = []
+    batch = []
+    used = overhead
+    for index, item in enumerate(qa_mapping):
+        cost = llm_backend.estimate_tokens(_batch_question_block(len(batch) + 1, item)) + BATCH_OUTPUT_TOKENS_PER_QUESTION
+        if batch and (used + cost > token_budget or len(batch) >= max_questions):
+            batches.append(batch)
+            batch = []
+            used = overhead
+        batch.append(index)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _evaluate_batch(model, professors, items, persona_pool):
+    """
+    Evaluate several questions with one structured-JSON request.
+    
+    The response array is split back into per-question results by the
+    item number each question is given in the prompt, since sub-questions
+    can share a question number. Questions whose result is missing or does
+    not parse are re-run on their own through _evaluate_question_single_call;
+    the others are kept.
+    
+    Returns:
+        list: QuestionResults aligned with ``items``
+    """
+    if len(items) == 1:
+        return [_evaluate_question_single_call(model, professors, items[0], persona_pool)]
+    
+    numbers = [str(item['questionNumber']) for item in items]
+    logging.info(f"Evaluating questions {', '.join(numbers)} in one batch")
+    prompt = BATCH_EVALUATION_PROMPT.format(
+        **persona_fields(professors), questions="\n".join(_batch_question_block(index, item) for index, item in enumerate(items, 1)))
+    # Matching a result without its item number is only safe by a unique question number
+    unique_numbers = len(set(numbers)) == len(numbers)
+    
+    parsed = {}
+    try:
+        response = model.generate_content(prompt)
+        results = extract_json_from_text(getattr(response, 'text', None))
+        if isinstance(results, list):
+            for result in results:
+                if not isinstance(result, dict):
+                    continue
+                index = _batch_item_index(result.get("item"), len(items))
+                if index is None and unique_numbers and str(result.get("questionNumber")) in numbers:
+                    index = numbers.index(str(result.get("questionNumber")))
+                if index is None or index in parsed:
+                    continue
+                result = _validate_result(result)
+                if result is not None:
+                    parsed[index] = result
+    except Exception as e:
+        logging.error(f"Error in batch evaluation of questions {', '.join(numbers)}: {e}")
+    
+    outputs = []
+    for index, (number, item) in enumerate(zip(numbers, items)):
+        if index in parsed:
+            outputs.append(_single_call_result(item, parsed[index]))
+        else:
+            logging.warning(f"No usable batch result for question {number}, re-running it alone")
+            outputs.append(_evaluate_question_single_call(model, professors, item, persona_pool))
+    return outputs
+
+def _batch_item_index(value, count):
+    """The 0-based position of a batch result's 1-based "item" number, or None."""
+    try:
+        index = int(value) - 1
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index < count else None
+
+def _normalize_text(text):
+    """Collapse whitespace and case so trivially different copies share a cache entry."""
+    return " ".join(str(text).split()).casefold()
+
+def _prompt_fingerprint(professors, mode):
+    """Hash of everything about the prompts that affects a result in this mode."""
+    if mode == "single_call":
+        template = SINGLE_CALL_EVALUATION_PROMPT
+    elif mode == "batched":
+        # Questions a batch response leaves out are re-run with the single-call prompt
+        template = BATCH_EVALUATION_PROMPT + BATCH_QUESTION_TEMPLATE + SINGLE_CALL_EVALUATION_PROMPT
+    else:
+        placeholders = ("{question_num}", "{question_text}", "{answer}", "{max_marks}")
+        template = _persona_prompt({"name": "{name}"}, *placeholders) + _consensus_prompt(
+            {"name": "{name}"}, *placeholders, {key: "{" + key + "}" for key in EVALUATOR_KEYS},
+            "{theoretical_score}", "{practical_score}", "{holistic_score}")
+    return hashlib.sha256(
+        (mode + "\0" + template + "\0" + json.dumps(professors, sort_keys=True)).encode("utf-8")
+    ).hexdigest()
+
+def evaluation_cache_key(item, prompt_fingerprint, model_id):
+    """
+    Build the cache key for one question's evaluation.
+    
+    Args:
+        item (dict): questionText, maxMarks and answer
+        prompt_fingerprint (str): From _prompt_fingerprint
+        model_id (str): Backend-qualified model id
+        
+    Returns:
+        str: Cache key
+    """
+    return make_key(
+        _normalize_text(item['questionText']),
+        _normalize_text(item['answer']),
+        str(item['maxMarks']),
+        prompt_fingerprint,
+        model_id,
+    )
+
+def cache_entry(result):
+    """
+    Serialise a complete QuestionResult for the evaluation cache.
+    
+    The cache key leaves out the question number, so the heading naming it
+    is cut out here and rebuilt by cached_result for the question served.
+    """
+    match = QUESTION_HEADING.search(result.consensus_text)
+    if match:
+        prefix, body = result.consensus_text[:match.start()], result.consensus_text[match.end():]
+    else:
+        prefix, body = None, result.consensus_text
+    return json.dumps({"score": result.score, "prefix": prefix, "body": body})
+
+def cached_result(entry, item):
+    """
+    Rebuild a QuestionResult from a cache entry for this question.
+    
+    Returns:
+        QuestionResult or None: None for an entry in an older format
+    """
+    cached = json.loads(entry)
+    if "body" not in cached:
+        return None
+    consensus_text = cached["body"]
+    if cached["prefix"] is not None:
+        heading = f"## Question {item['questionNumber']}: {item['questionText']}\n"
+        consensus_text = cached["prefix"] + heading + consensus_text
+    return QuestionResult(consensus_text + "\n\n", cached["score"], consensus_text, True)
+
+def get_cache_stats():
+    """Return hit/miss counters and size of the evaluation cache."""
+    stats = evaluation_cache.stats()
+    stats["enabled"] = EVAL_CACHE_ENABLED
+    return stats
+
+def multi_agent_evaluate_answers(qa_mapping, question_paper_text=None, on_question=None, max_workers=None,
+                                 mode=None):
+    """
+    Evaluate each question with three evaluator personas and a consensus step.
+    
+    The three persona calls of a question run in parallel, and up to
+    ``max_workers`` questions are evaluated at once. The report lists the
+    questions in their original order whatever order they finish in.
+    
+    Results are cached per question (see evaluation_cache_key), so only
+    questions that have not been evaluated before make model calls.
+    
+    In "single_call" mode the perspectives and the consensus come from one
+    structured-JSON response per question instead of four calls, and the
+    report section is rendered locally in the same format. "batched" mode
+    packs several questions into each of those requests (see plan_batches).
+    
+    Args:
+        qa_mapping (list): Dictionaries with questionNumber, questionText, maxMarks and answer
+        question_paper_text (str, optional): The question paper, passed to get_professors
+        on_question (callable, optional): Progress callback, called as
+            on_question(question_num, score, consensus_text, done, total) as
+            each question finishes; score is None if it could not be extracted
+        max_workers (int, optional): Questions evaluated concurrently,
+            defaults to EVAL_MAX_WORKERS
+        mode (str, optional): "multi_agent", "single_call" or "batched", defaults to EVAL_MODE
+        
+    Returns:
+        str: The markdown evaluation report
+    """
+
+    logging.info("Starting multi-agent evaluation of answers")
+    
+    # Get the model
+    try:
+        model = get_gemini_model()
+    except Exception as e:
+        logging.error(f"Error initializing Gemini model: {e}")
+        raise Exception(f"Error initializing Gemini model: {e}")
+    
+    # Initialize professor personas from prompts
+    professors = get_professors(question_paper_text)
+    
+    max_workers = max(1, max_workers or EVAL_MAX_WORKERS)
+    mode = mode or EVAL_MODE
+    if mode not in EVAL_MODES:
+        raise ValueError(f"Unknown evaluation mode {mode!r}, expected one of {EVAL_MODES}")
+    if (mode == "batched" and not BATCH_EVALUATION_PROMPT) or (mode == "single_call" and not SINGLE_CALL_EVALUATION_PROMPT):
+        mode = "multi_agent"
+    results = [None] * len(qa_mapping)
+    done = 0
+    
+    def finish(index, result):
+        nonlocal done
+        results[index] = result
+        done += 1
+        if on_question is not None:
+            on_question(qa_mapping[index]['questionNumber'], result.score, result.consensus_text, done, len(qa_mapping))
+    
+    # Serve previously evaluated questions from the cache
+    cache_keys = [None] * len(qa_mapping)
+    pending = []
+    if EVAL_CACHE_ENABLED:
+        fingerprint = _prompt_fingerprint(professors, mode)
+        for index, item in enumerate(qa_mapping):
+            cache_keys[index] = evaluation_cache_key(item, fingerprint, model.model_id)
+            cached = evaluation_cache.get(cache_keys[index])
+            if cached is not None:
+                cached = cached_result(cached, item)
+            if cached is not None:
+                finish(index, cached)
+            else:
+                pending.append(index)
+        logging.info(f"{len(qa_mapping) - len(pending)} of {len(qa_mapping)} questions served from the evaluation cache")
+    else:
+        pending = list(range(len(qa_mapping)))
+    
+    # Each unit of work is a list of question indexes evaluated together
+    if mode == "batched":
+        evaluate_unit = _evaluate_batch
+        pending_items = [qa_mapping[i] for i in pending]
+        units = [[pending[i] for i in batch] for batch in plan_batches(pending_items, professors=professors)]
+        logging.info(f"Planned {len(units)} evaluation requests for {len(pending)} questions")
+    else:
+        evaluate_question = _evaluate_question_single_call if mode == "single_call" else _evaluate_question
+        evaluate_unit = lambda model, professors, items, persona_pool: [
+            evaluate_question(model, professors, items[0], persona_pool)
+        ]
+        units = [[index] for index in pending]
+    
+    # Question workers only wait on persona futures, so the two pools can't deadlock
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="eval-question") as question_pool, \
+            ThreadPoolExecutor(max_workers=max_workers * len(EVALUATOR_KEYS),
+                               thread_name_prefix="eval-persona") as persona_pool:
+        futures = {
+            question_pool.submit(evaluate_unit, model, professors, [qa_mapping[i] for i in unit], persona_pool): unit
+            for unit in units
+        }
+        for future in as_completed(futures):
+            for index, result in zip(futures[future], future.result()):
+                finish(index, result)
+                if cache_keys[index] and result.complete:
+                    evaluation_cache.set(cache_keys[index], cache_entry(result))
+    
+    # Create an evaluation report, in question order
+    markdown_report = "# Student Answer Evaluation\n\n"
+    total_marks = 0
+    max_total_marks = 0
+    for item, result in zip(qa_mapping, results):
+        max_total_marks += item['maxMarks']
+        markdown_report += result.section
+        if result.score is not None:
+            total_marks += result.score
     
     # Add a summary section with total marks
     markdown_report += "# Summary\n\n"
@@ -359,13 +790,14 @@ def match_questions_with_answers(question_paper, answer_text):
     logging.info(f"Question mapping results: {json.dumps(result, indent=2)}")
     return result
 
-def evaluate_structured_answers(question_answers, file_name):
+def evaluate_structured_answers(question_answers, file_name, on_question=None):
     """
     Evaluate structured question-answer mappings.
     
     Args:
         question_answers (list): List of dictionaries with 'question' and 'answer' keys
         file_name (str): Name of the file (for logging/reference)
+        on_question (callable, optional): Progress callback, see multi_agent_evaluate_answers
         
     Returns:
         str or dict: Path to the evaluation markdown file or a dict with error info
@@ -401,7 +833,7 @@ def evaluate_structured_answers(question_answers, file_name):
         logging.info(f"Formatted {len(qa_formatted)} QA pairs for evaluation")
         
         # Use the multi-agent evaluation with the formatted QA pairs
-        return multi_agent_evaluate_answers(qa_formatted)
+        return multi_agent_evaluate_answers(qa_formatted, on_question=on_question)
         
     except Exception as e:
         logging.error(f"Error in evaluate_structured_answers: {str(e)}")
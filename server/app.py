@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, request, jsonify, render_template, redirect, url_for, Response, stream_with_context
 from flask_cors import CORS
 import os
 import ocr
+import gemini_ocr
 import agentic
 import mapper
+import jobs
 from dotenv import load_dotenv
 import json
 import uuid
@@ -11,28 +13,35 @@ from datetime import datetime
 import re
 import time
 import logging
-import threading
-import queue
-import concurrent.futures
 try:
     import jwt
 except ImportError:
     import PyJWT as jwt
 from functools import wraps
-from flask_bcrypt import Bcrypt
 from datetime import timedelta
 
 # Import database and authentication modules
 import database
-# Initialize database first - this needs to happen before importing the collections
-database.init_db()
+import db_indexes
+import pagination
+import text_store
+import password_hashing
+import bounded_executor
+# Initialize database first - this needs to happen before importing the collections.
+# Under `python app.py`, the password_hashing pool processes re-import this script
+# as __mp_main__; they only hash, so they must not connect or start the index build.
+if __name__ != "__mp_main__":
+    database.init_db()
 from database import (
     extracted_texts_collection,
     evaluations_collection,
     question_papers_collection,
     users_collection
 )
-from auth import create_user, authenticate_user, token_required, admin_required, JWT_SECRET
+from auth import (
+    create_user, authenticate_user, authenticate_request, token_required, admin_required,
+    get_user_cache_stats, invalidate_user, JWT_SECRET
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -44,7 +53,6 @@ load_dotenv()
 app = Flask(__name__)
 # Use the same JWT_SECRET from auth.py to ensure consistent token handling
 app.config['JWT_SECRET'] = JWT_SECRET
-bcrypt = Bcrypt(app)
 
 # Configure CORS for deployment - allow requests from any origin
 # All routes are standardized to use /api prefix
@@ -93,7 +101,7 @@ def register():
         
         # Create user
         user_id = str(uuid.uuid4())
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = password_hashing.hash_password(password)
         
         user_data = {
             "id": user_id,
@@ -169,8 +177,13 @@ def login():
             return jsonify({"success": False, "message": "Invalid email or password"}), 401
         
         # Check password
-        if not bcrypt.check_password_hash(user['password'], password):
+        password_ok, new_hash = password_hashing.check_password(password, user['password'])
+        if not password_ok:
             return jsonify({"success": False, "message": "Invalid email or password"}), 401
+        if new_hash:
+            # Stored with another work factor; upgrade to the current one
+            users_collection.update_one({"id": user['id']}, {"$set": {"password": new_hash}})
+            invalidate_user(user['id'])
         
         # Generate JWT token using the same secret and format as in auth.py
         payload = {
@@ -223,6 +236,73 @@ def get_profile(current_user):
         logger.error(f"Error getting user profile: {str(e)}")
         return jsonify({"error": f"Error getting user profile: {str(e)}"}), 500
 
+def run_process_file(progress, temp_path, file_name, current_user):
+    """
+    OCR a saved upload and store the extracted text.
+    
+    Shared by /api/process-file and the background job of the same name.
+    The file is removed afterwards.
+    
+    Args:
+        progress (jobs.JobProgress or None): Progress reporter for background jobs
+        temp_path (str): Path of the saved upload
+        file_name (str): Original file name
+        current_user (dict): The authenticated user
+        
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
+    try:
+        # Process the file with OCR
+        result = ocr.process_file(temp_path, on_page=progress.page_done if progress else None)
+        
+        # Create a text ID for this extraction
+        text_id = str(uuid.uuid4())
+        
+        # Create document for MongoDB
+        extracted_text_doc = {
+            "id": text_id,
+            "extractedText": result.get("text", ""),
+            "timestamp": datetime.now().isoformat(),
+            "fileName": file_name,
+            "confidence": result.get("confidence", 0),
+            # Sections are stored as offsets into extractedText, not as copies of it
+            "sectionSpans": result.get("section_spans", []),
+            "userId": current_user["id"]
+        }
+        
+        # Store in MongoDB, with large text compressed
+        extracted_texts_collection.insert_one(text_store.pack_document("extracted_texts", extracted_text_doc))
+        
+        logger.info(f"Successfully extracted text with ID {text_id}, sections: {len(result.get('section_spans', []))}")
+        
+        # Return the text ID and extraction result
+        return {
+            "success": True,
+            "text_id": text_id,
+            "extractedText": result.get("text", ""),
+            "confidence": result.get("confidence", 0),
+            "sections": ocr.materialize_sections(result.get("text", ""), result.get("section_spans", [])),
+            "page_count": result.get("page_count", 0),
+            "skipped_pages": result.get("skipped_pages", 0),
+            "page_timings": result.get("page_timings", []),
+            "message": "File processed successfully"
+        }, 200
+        
+    except Exception as e:
+        # Log the error
+        logger.error(f"Error processing file: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        
+        return {
+            "error": f"Error processing file: {str(e)}"
+        }, 500
+    finally:
+        # Clean up the temporary file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
 @app.route('/api/process-file', methods=['POST', 'OPTIONS'])
 def process_file():
     """Process a file using OCR and return the extracted text."""
@@ -235,128 +315,79 @@ def process_file():
         return response
     
     # Token validation for POST requests
-    token = None
-    auth_header = request.headers.get('Authorization')
-    
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-    
-    if not token:
-        logger.warning("No token provided for process-file")
-        return jsonify({"error": "Authentication token is missing"}), 401
+    current_user, auth_error = authenticate_request()
+    if auth_error:
+        return auth_error
     
     try:
-        # Decode and validate token
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        current_user = users_collection.find_one({"id": data["id"]})
-        
-        if not current_user:
-            logger.warning(f"User ID from token not found: {data.get('id')}")
-            return jsonify({"error": "Invalid user"}), 401
-        
         # Original function logic
-        try:
-            if 'file' not in request.files:
-                return jsonify({"error": "No file part"}), 400
-                
-            file = request.files['file']
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
             
-            if file.filename == '':
-                return jsonify({"error": "No selected file"}), 400
-                
-            # Debug: log the file details
-            logger.info(f"Processing file: {file.filename}, size: {file.content_length} bytes")
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
             
-            # Save the file temporarily
-            temp_path = f"temp_{file.filename}"
+        # Debug: log the file details
+        logger.info(f"Processing file: {file.filename}, size: {file.content_length} bytes")
+        
+        # Save the file temporarily
+        temp_path = f"temp_{file.filename}"
+        try:
             file.save(temp_path)
-            
-            # Process the file with OCR
-            result = ocr.process_file(temp_path)
-            
-            # Clean up the temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            
-            # Create a text ID for this extraction
-            text_id = str(uuid.uuid4())
-            
-            # Create document for MongoDB
-            extracted_text_doc = {
-                "id": text_id,
-                "extractedText": result.get("text", ""),
-                "timestamp": datetime.now().isoformat(),
-                "fileName": file.filename,
-                "confidence": result.get("confidence", 0),
-                "sections": result.get("sections", []),
-                "userId": current_user["id"]
-            }
-            
-            # Store in MongoDB
-            extracted_texts_collection.insert_one(extracted_text_doc)
-            
-            logger.info(f"Successfully extracted text with ID {text_id}, sections: {len(result.get('sections', []))}")
-            
-            # Return the text ID and extraction result
-            return jsonify({
-                "success": True,
-                "text_id": text_id,
-                "extractedText": result.get("text", ""),
-                "confidence": result.get("confidence", 0),
-                "sections": result.get("sections", []),
-                "message": "File processed successfully"
-            })
-            
         except Exception as e:
-            # Log the error
-            logger.error(f"Error processing file: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            
-            # Clean up any temporary files
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                os.remove(temp_path)
-                
-            return jsonify({
-                "error": f"Error processing file: {str(e)}"
-            }), 500
+            logger.error(f"Error saving uploaded file: {str(e)}")
+            return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+        
+        payload, status = run_process_file(None, temp_path, file.filename, current_user)
+        return jsonify(payload), status
     
-    except Exception as jwt_error:
-        logger.error(f"JWT validation error in process-file: {str(jwt_error)}")
-        return jsonify({"error": "Invalid token"}), 401
+    except Exception as e:
+        logger.error(f"Unexpected error in process-file: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-@app.route('/api/process-complete', methods=['POST'])
-def process_complete():
-    """Process a file with OCR and evaluation in one step."""
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
+def run_process_complete(progress, temp_path, file_name, question_paper_id=None, user_id=None):
+    """
+    OCR a saved upload and evaluate it in one step.
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    Shared by /api/process-complete and the background job of the same name.
+    The file is removed afterwards.
     
+    Args:
+        progress (jobs.JobProgress or None): Progress reporter for background jobs
+        temp_path (str): Path of the saved upload
+        file_name (str): Original file name
+        question_paper_id (str, optional): Question paper to evaluate against
+        user_id (str, optional): Restrict the question paper lookup to this user
+        
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
     try:
-        # Save the file temporarily
-        temp_path = f"temp_{file.filename}"
-        file.save(temp_path)
-        
         # 1. Process the file with OCR
-        ocr_result = ocr.process_file(temp_path)
+        ocr_result = ocr.process_file(temp_path, on_page=progress.page_done if progress else None)
         
         # 2. Process the OCR result with evaluation
-        question_paper_id = request.form.get('questionPaperId', None)
         question_paper_text = None
         if question_paper_id:
-            question_paper = question_papers_collection.find_one({"id": question_paper_id})
+            query = {"id": question_paper_id}
+            if user_id:
+                query["userId"] = user_id
+            question_paper = question_papers_collection.find_one(query, {"_id": 0})
             if question_paper:
                 question_paper_text = json.dumps(question_paper)
             
         # Get the evaluation file path
-        evaluation_file_path = agentic.evaluate_answers(ocr_result["text"], file.filename, question_paper_text)
+        evaluation = agentic.evaluate_answers(
+            ocr_result["text"], file_name, question_paper_text,
+            on_question=progress.question_done if progress else None
+        )
+        evaluation_file_path = evaluation["evaluation_path"]
         
         # Read the evaluation file content
-        with open(evaluation_file_path, 'r', encoding='utf-8') as file:
-            markdown_content = file.read()
+        with open(evaluation_file_path, 'r', encoding='utf-8') as eval_file:
+            markdown_content = eval_file.read()
         
         # Generate filename for ID
         evaluation_filename = os.path.basename(evaluation_file_path)
@@ -364,21 +395,218 @@ def process_complete():
         # Create result object in the format expected by the frontend
         evaluation_result = {
             "id": f"file_{evaluation_filename}",
-            "fileName": file.filename,
+            "fileName": file_name,
             "timestamp": datetime.now().isoformat(),
             "markdownContent": markdown_content
         }
         
         # 3. Add evaluation to the OCR result
         ocr_result["evaluation"] = evaluation_result
+        ocr_result["sections"] = ocr.materialize_sections(ocr_result["text"], ocr_result.pop("section_spans", []))
         
+        return ocr_result, 200
+    except Exception as e:
+        logger.error(f"Error in complete processing: {e}")
+        return {"error": str(e)}, 500
+    finally:
         # Clean up the temporary file
-        os.remove(temp_path)
-        
-        return jsonify(ocr_result)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@app.route('/api/process-complete', methods=['POST'])
+def process_complete():
+    """Process a file with OCR and evaluation in one step."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    
+    try:
+        # Save the file temporarily
+        temp_path = f"temp_{file.filename}"
+        file.save(temp_path)
     except Exception as e:
         logger.error(f"Error in complete processing: {e}")
         return jsonify({"error": str(e)}), 500
+    
+    payload, status = run_process_complete(None, temp_path, file.filename, request.form.get('questionPaperId', None))
+    return jsonify(payload), status
+
+def run_evaluation(progress, data, current_user):
+    """
+    Evaluate submitted answers and store the evaluation.
+    
+    Shared by /api/evaluate and the background job of the same name.
+    
+    Args:
+        progress (jobs.JobProgress or None): Progress reporter for background jobs
+        data (dict): The request payload
+        current_user (dict): The authenticated user
+        
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
+    on_question = progress.question_done if progress else None
+    try:
+        # Get text either directly or from text_id
+        answer_text = None
+        file_name = data.get("fileName", "Unknown")
+        
+        # Check if we have direct text
+        if "text" in data:
+            answer_text = data["text"]
+        # Or if we have a text_id to lookup
+        elif "text_id" in data:
+            text_id = data["text_id"]
+            
+            # Look up in MongoDB
+            extracted_text_doc = extracted_texts_collection.find_one(
+                {"id": text_id, "userId": current_user["id"]}
+            )
+            
+            if extracted_text_doc:
+                answer_text = text_store.unpack_field(extracted_text_doc, "extractedText")
+                file_name = extracted_text_doc.get("fileName", file_name)
+            else:
+                return {"error": f"Text ID not found: {text_id}"}, 404
+        else:
+            return {"error": "Missing required field: either text or text_id"}, 400
+        
+        # Check if we have mapped question-answers or need to process through a question paper
+        question_paper_text = None
+        question_answers = None
+        
+        # If we have mapped question_answers, use those
+        if "question_answers" in data:
+            question_answers = data["question_answers"]
+            
+            # Filter out answers that are empty or not found
+            filtered_qa = []
+            for qa in question_answers:
+                if qa.get('answer') and qa['answer'].strip() and qa['answer'] != "No answer found":
+                    filtered_qa.append(qa)
+            
+            question_answers = filtered_qa
+            logger.info(f"Using {len(question_answers)} valid question-answer pairs")
+            
+            if len(question_answers) == 0:
+                return {
+                    "success": True,
+                    "evaluation": "# No Valid Answers to Evaluate\n\nThe system could not find valid answers to any of the questions in the paper. Please check if the uploaded document contains the answers or try a different document.",
+                    "score": "0",
+                    "id": str(uuid.uuid4())
+                }, 200
+        
+        # If we have a question paper object in the request
+        if "question_paper" in data:
+            question_paper_data = data["question_paper"]
+            logger.info(f"Using provided question paper: {question_paper_data.get('title', 'Untitled')}")
+            question_paper_text = json.dumps(question_paper_data)
+        
+        # If we have a question paper ID, try to fetch it
+        elif "question_paper_id" in data:
+            question_paper_id = data["question_paper_id"]
+            if question_paper_id and question_paper_id != 'default':
+                # Look up in MongoDB
+                question_paper_doc = question_papers_collection.find_one(
+                    {"id": question_paper_id, "userId": current_user["id"]}
+                )
+                
+                if question_paper_doc:
+                    question_paper_text = json.dumps(question_paper_doc)
+        
+        try:
+            # Direct evaluation without timeouts
+            if question_answers and len(question_answers) > 0:
+                # Use question_answers for structured evaluation
+                evaluation_result = agentic.evaluate_structured_answers(
+                    question_answers, file_name, on_question=on_question
+                )
+            else:
+                # Use traditional evaluation method
+                evaluation_result = agentic.evaluate_answers(
+                    answer_text, file_name, question_paper_text, on_question=on_question
+                )
+            
+        except Exception as eval_error:
+            logger.error(f"Error during evaluation: {str(eval_error)}")
+            # Provide a graceful response
+            return {
+                "success": True,
+                "evaluation": f"# Evaluation Error\n\nThere was an error during the evaluation process: {str(eval_error)}.\n\nPlease try again or contact support if the issue persists.",
+                "score": "N/A",
+                "id": str(uuid.uuid4())
+            }, 200
+        
+        # Handle the evaluation result
+        evaluation_file_path = None
+        if isinstance(evaluation_result, dict):
+            if evaluation_result.get("success", False):
+                evaluation_file_path = evaluation_result.get("evaluation_path")
+            else:
+                error_message = evaluation_result.get("message", "Unknown error in evaluation")
+                logger.error(f"Evaluation error: {error_message}")
+                return {
+                    "success": True,
+                    "evaluation": f"# Evaluation Failed\n\n{error_message}\n\nPlease try again or contact support.",
+                    "score": "N/A",
+                    "id": str(uuid.uuid4())
+                }, 200
+        
+        # Extract the evaluation content and score
+        evaluation_content = None
+        if isinstance(evaluation_result, str):
+            evaluation_content = evaluation_result
+        elif isinstance(evaluation_result, dict) and "evaluation_content" in evaluation_result:
+            evaluation_content = evaluation_result["evaluation_content"]
+        elif evaluation_file_path and os.path.exists(evaluation_file_path):
+            with open(evaluation_file_path, 'r', encoding='utf-8') as eval_file:
+                evaluation_content = eval_file.read()
+        
+        if not evaluation_content:
+            evaluation_content = "# Evaluation Failed\n\nNo evaluation content was generated."
+        
+        # Parse the score from the evaluation content
+        score = "N/A"
+        score_match = re.search(r'Score: (\d+(?:\.\d+)?)\/(\d+(?:\.\d+)?)', evaluation_content)
+        if score_match:
+            score = f"{score_match.group(1)}/{score_match.group(2)}"
+        
+        # Generate a unique ID for the evaluation
+        evaluation_id = str(uuid.uuid4())
+        
+        # Create evaluation document for MongoDB
+        evaluation_doc = {
+            "id": evaluation_id,
+            "markdownContent": evaluation_content,
+            "score": score,
+            "fileName": file_name,
+            "timestamp": datetime.now().isoformat(),
+            "userId": current_user["id"]
+        }
+        
+        # Store in MongoDB, with large text compressed
+        evaluations_collection.insert_one(text_store.pack_document("evaluations", evaluation_doc))
+        
+        # Return the evaluation response
+        return {
+            "success": True,
+            "evaluation": evaluation_content,
+            "score": score,
+            "id": evaluation_id
+        }, 200
+        
+
+    except Exception as e:
+        logger.error(f"Error in evaluate_answers: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return {
+            "success": False,
+            "error": f"Error processing evaluation: {str(e)}"
+        }, 500
 
 @app.route('/api/evaluate', methods=['POST', 'OPTIONS'])
 def evaluate_answers():
@@ -392,25 +620,11 @@ def evaluate_answers():
         return response
     
     # Token validation for POST requests
-    token = None
-    auth_header = request.headers.get('Authorization')
-    
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-    
-    if not token:
-        logger.warning("No token provided for evaluate")
-        return jsonify({"error": "Authentication token is missing"}), 401
+    current_user, auth_error = authenticate_request()
+    if auth_error:
+        return auth_error
     
     try:
-        # Decode and validate token
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        current_user = users_collection.find_one({"id": data["id"]})
-        
-        if not current_user:
-            logger.warning(f"User ID from token not found: {data.get('id')}")
-            return jsonify({"error": "Invalid user"}), 401
-        
         # Original function logic
         try:
             data = request.get_json()
@@ -421,148 +635,8 @@ def evaluate_answers():
             if not data:
                 return jsonify({"error": "No data provided"}), 400
             
-            # Get text either directly or from text_id
-            answer_text = None
-            file_name = data.get("fileName", "Unknown")
-            
-            # Check if we have direct text
-            if "text" in data:
-                answer_text = data["text"]
-            # Or if we have a text_id to lookup
-            elif "text_id" in data:
-                text_id = data["text_id"]
-                
-                # Look up in MongoDB
-                extracted_text_doc = extracted_texts_collection.find_one(
-                    {"id": text_id, "userId": current_user["id"]}
-                )
-                
-                if extracted_text_doc:
-                    answer_text = extracted_text_doc.get("extractedText", "")
-                    file_name = extracted_text_doc.get("fileName", file_name)
-                else:
-                    return jsonify({"error": f"Text ID not found: {text_id}"}), 404
-            else:
-                return jsonify({"error": "Missing required field: either text or text_id"}), 400
-            
-            # Check if we have mapped question-answers or need to process through a question paper
-            question_paper_text = None
-            question_answers = None
-            
-            # If we have mapped question_answers, use those
-            if "question_answers" in data:
-                question_answers = data["question_answers"]
-                
-                # Filter out answers that are empty or not found
-                filtered_qa = []
-                for qa in question_answers:
-                    if qa.get('answer') and qa['answer'].strip() and qa['answer'] != "No answer found":
-                        filtered_qa.append(qa)
-                
-                question_answers = filtered_qa
-                logger.info(f"Using {len(question_answers)} valid question-answer pairs")
-                
-                if len(question_answers) == 0:
-                    return jsonify({
-                        "success": True,
-                        "evaluation": "# No Valid Answers to Evaluate\n\nThe system could not find valid answers to any of the questions in the paper. Please check if the uploaded document contains the answers or try a different document.",
-                        "score": "0",
-                        "id": str(uuid.uuid4())
-                    })
-            
-            # If we have a question paper object in the request
-            if "question_paper" in data:
-                question_paper_data = data["question_paper"]
-                logger.info(f"Using provided question paper: {question_paper_data.get('title', 'Untitled')}")
-                question_paper_text = json.dumps(question_paper_data)
-            
-            # If we have a question paper ID, try to fetch it
-            elif "question_paper_id" in data:
-                question_paper_id = data["question_paper_id"]
-                if question_paper_id and question_paper_id != 'default':
-                    # Look up in MongoDB
-                    question_paper_doc = question_papers_collection.find_one(
-                        {"id": question_paper_id, "userId": current_user["id"]}
-                    )
-                    
-                    if question_paper_doc:
-                        question_paper_text = json.dumps(question_paper_doc)
-            
-            try:
-                # Direct evaluation without timeouts
-                if question_answers and len(question_answers) > 0:
-                    # Use question_answers for structured evaluation
-                    evaluation_result = agentic.evaluate_structured_answers(question_answers, file_name)
-                else:
-                    # Use traditional evaluation method
-                    evaluation_result = agentic.evaluate_answers(answer_text, file_name, question_paper_text)
-                
-            except Exception as eval_error:
-                logger.error(f"Error during evaluation: {str(eval_error)}")
-                # Provide a graceful response
-                return jsonify({
-                    "success": True,
-                    "evaluation": f"# Evaluation Error\n\nThere was an error during the evaluation process: {str(eval_error)}.\n\nPlease try again or contact support if the issue persists.",
-                    "score": "N/A",
-                    "id": str(uuid.uuid4())
-                })
-            
-            # Handle the evaluation result
-            if isinstance(evaluation_result, dict):
-                if evaluation_result.get("success", False):
-                    evaluation_file_path = evaluation_result.get("evaluation_path")
-                else:
-                    error_message = evaluation_result.get("message", "Unknown error in evaluation")
-                    logger.error(f"Evaluation error: {error_message}")
-                    return jsonify({
-                        "success": True,
-                        "evaluation": f"# Evaluation Failed\n\n{error_message}\n\nPlease try again or contact support.",
-                        "score": "N/A",
-                        "id": str(uuid.uuid4())
-                    })
-            
-            # Extract the evaluation content and score
-            evaluation_content = None
-            if isinstance(evaluation_result, str):
-                evaluation_content = evaluation_result
-            elif isinstance(evaluation_result, dict) and "evaluation_content" in evaluation_result:
-                evaluation_content = evaluation_result["evaluation_content"]
-            elif evaluation_file_path and os.path.exists(evaluation_file_path):
-                with open(evaluation_file_path, 'r', encoding='utf-8') as eval_file:
-                    evaluation_content = eval_file.read()
-            
-            if not evaluation_content:
-                evaluation_content = "# Evaluation Failed\n\nNo evaluation content was generated."
-            
-            # Parse the score from the evaluation content
-            score = "N/A"
-            score_match = re.search(r'Score: (\d+(?:\.\d+)?)\/(\d+(?:\.\d+)?)', evaluation_content)
-            if score_match:
-                score = f"{score_match.group(1)}/{score_match.group(2)}"
-            
-            # Generate a unique ID for the evaluation
-            evaluation_id = str(uuid.uuid4())
-            
-            # Create evaluation document for MongoDB
-            evaluation_doc = {
-                "id": evaluation_id,
-                "markdownContent": evaluation_content,
-                "score": score,
-                "fileName": file_name,
-                "timestamp": datetime.now().isoformat(),
-                "userId": current_user["id"]
-            }
-            
-            # Store in MongoDB
-            evaluations_collection.insert_one(evaluation_doc)
-            
-            # Return the evaluation response
-            return jsonify({
-                "success": True,
-                "evaluation": evaluation_content,
-                "score": score,
-                "id": evaluation_id
-            })
+            payload, status = run_evaluation(None, data, current_user)
+            return jsonify(payload), status
             
         except Exception as e:
             logger.error(f"Error in evaluate_answers: {str(e)}")
@@ -573,9 +647,63 @@ def evaluate_answers():
                 "error": f"Error processing evaluation: {str(e)}"
             }), 500
     
-    except Exception as jwt_error:
-        logger.error(f"JWT validation error in evaluate: {str(jwt_error)}")
-        return jsonify({"error": "Invalid token"}), 401
+    except Exception as e:
+        logger.error(f"Unexpected error in evaluate: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+# Fields of the per-user listings as (name, default). The summary fields
+# leave out the large text, which is fetched from the detail routes.
+EVALUATION_FIELDS = [("id", None), ("fileName", "Unknown"), ("timestamp", ""), ("markdownContent", ""), ("score", "N/A")]
+EVALUATION_SUMMARY_FIELDS = [("id", None), ("fileName", "Unknown"), ("timestamp", ""), ("score", "N/A")]
+EXTRACTED_TEXT_FIELDS = [("id", None), ("fileName", "Unknown"), ("timestamp", ""), ("extractedText", "")]
+EXTRACTED_TEXT_SUMMARY_FIELDS = [("id", None), ("fileName", "Unknown"), ("timestamp", ""), ("confidence", 0)]
+QUESTION_PAPER_FIELDS = [("id", None), ("fileName", "Untitled"), ("timestamp", ""), ("questions", []), ("totalMarks", 0)]
+QUESTION_PAPER_SUMMARY_FIELDS = [("id", None), ("fileName", "Untitled"), ("timestamp", ""), ("totalMarks", 0)]
+
+def list_user_documents(collection, current_user, fields, summary_fields):
+    """
+    Stream the current user's documents of a collection.
+    
+    Without query parameters this is the original listing: every document
+    with all of ``fields``, as one JSON array. With ``limit``, ``cursor``,
+    ``view`` or ``format`` it returns one keyset-paginated page, newest
+    first, of ``summary_fields`` (or ``fields`` with view=full), as
+    {"items": [...], "next_cursor": ...} or as NDJSON with format=ndjson.
+    Either way documents are written out as they are read from MongoDB.
+    
+    Args:
+        collection (pymongo.collection.Collection): The collection to list
+        current_user (dict): The authenticated user
+        fields (list): (name, default) pairs of the full listing
+        summary_fields (list): (name, default) pairs of the summary listing
+        
+    Returns:
+        flask.Response: The streamed listing, or a 400 error for bad paging parameters
+    """
+    args = request.args
+    ndjson = args.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get("Accept", "")
+    paged = ndjson or any(key in args for key in ("limit", "cursor", "view"))
+    if paged and args.get("view", "summary") == "summary":
+        fields = summary_fields
+    # Large text may be stored compressed or in GridFS under another field name
+    projection = {"_id": 0, **{stored: 1 for name, _ in fields for stored in text_store.projection_fields(name)}}
+    
+    def to_item(doc):
+        return {name: text_store.unpack_field(doc, name, default) for name, default in fields}
+    
+    base_filter = {"userId": current_user["id"]}
+    if not paged:
+        documents = collection.find(base_filter, projection, batch_size=pagination.STREAM_BATCH_SIZE)
+        return Response(stream_with_context(pagination.stream_json_array(documents, to_item)),
+                        mimetype="application/json")
+    
+    try:
+        page = pagination.Page(collection, base_filter, projection,
+                               pagination.parse_limit(args.get("limit")), args.get("cursor"))
+    except pagination.CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(stream_with_context(pagination.stream_page(page, to_item, ndjson)),
+                    mimetype="application/x-ndjson" if ndjson else "application/json")
 
 @app.route('/api/evaluations', methods=['GET', 'POST', 'OPTIONS'])
 def evaluations_handler():
@@ -589,44 +717,17 @@ def evaluations_handler():
         return response
     
     # Token validation for GET and POST requests
-    token = None
-    auth_header = request.headers.get('Authorization')
-    
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-    
-    if not token:
-        logger.warning("No token provided for evaluations endpoint")
-        return jsonify({"error": "Authentication token is missing"}), 401
+    current_user, auth_error = authenticate_request()
+    if auth_error:
+        return auth_error
     
     try:
-        # Decode and validate token
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        current_user = users_collection.find_one({"id": data["id"]})
-        
-        if not current_user:
-            logger.warning(f"User ID from token not found: {data.get('id')}")
-            return jsonify({"error": "Invalid user"}), 401
-        
         # Handle GET request - get all evaluations
         if request.method == 'GET':
             try:
-                evaluation_list = []
-                
                 # Query MongoDB for the user's evaluations
-                cursor = evaluations_collection.find({"userId": current_user["id"]})
-                
-                # Convert MongoDB documents to list
-                for doc in cursor:
-                    evaluation_list.append({
-                        "id": doc["id"],
-                        "fileName": doc.get("fileName", "Unknown"),
-                        "timestamp": doc.get("timestamp", ""),
-                        "markdownContent": doc.get("markdownContent", ""),
-                        "score": doc.get("score", "N/A")
-                    })
-                    
-                return jsonify(evaluation_list)
+                return list_user_documents(evaluations_collection, current_user,
+                                           EVALUATION_FIELDS, EVALUATION_SUMMARY_FIELDS)
             except Exception as e:
                 logger.error(f"Error getting evaluations: {str(e)}")
                 return jsonify({"error": f"Error getting evaluations: {str(e)}"}), 500
@@ -639,8 +740,9 @@ def evaluations_handler():
                 if not data:
                     return jsonify({"error": "No data provided"}), 400
                 
-                # Generate a unique ID for the evaluation if not provided
-                evaluation_id = data.get("id", str(uuid.uuid4()))
+                # Generate a unique ID for the evaluation if not provided. The ID and
+                # timestamp are stored as strings, the type the listing cursors page by
+                evaluation_id = str(data.get("id") or uuid.uuid4())
                 
                 # Create evaluation document for MongoDB
                 evaluation_doc = {
@@ -648,14 +750,15 @@ def evaluations_handler():
                     "markdownContent": data.get("markdownContent", data.get("evaluation", "")),
                     "score": data.get("score", "N/A"),
                     "fileName": data.get("fileName", "Unknown"),
-                    "timestamp": data.get("timestamp", datetime.now().isoformat()),
+                    "timestamp": str(data.get("timestamp") or datetime.now().isoformat()),
                     "userId": current_user["id"]
                 }
                 
                 # Store in MongoDB - use upsert to update if exists or insert if new
-                evaluations_collection.update_one(
+                text_store.update_document(
+                    evaluations_collection,
                     {"id": evaluation_id, "userId": current_user["id"]},
-                    {"$set": evaluation_doc},
+                    evaluation_doc,
                     upsert=True
                 )
                 
@@ -675,9 +778,9 @@ def evaluations_handler():
                     "error": f"Error saving evaluation: {str(e)}"
                 }), 500
     
-    except Exception as jwt_error:
-        logger.error(f"JWT validation error: {str(jwt_error)}")
-        return jsonify({"error": "Invalid token"}), 401
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 @app.route('/api/evaluation/<evaluation_id>', methods=['GET'])
 @token_required
@@ -692,7 +795,7 @@ def get_evaluation(current_user, evaluation_id):
                 "id": doc["id"],
                 "fileName": doc.get("fileName", "Unknown"),
                 "timestamp": doc.get("timestamp", ""),
-                "markdownContent": doc.get("markdownContent", ""),
+                "markdownContent": text_store.unpack_field(doc, "markdownContent"),
                 "score": doc.get("score", "N/A")
             })
             
@@ -707,10 +810,11 @@ def delete_evaluation(current_user, evaluation_id):
     """Delete an evaluation by ID."""
     try:
         # Delete from MongoDB
-        result = evaluations_collection.delete_one({"id": evaluation_id, "userId": current_user["id"]})
+        deleted = text_store.delete_documents(evaluations_collection,
+                                              {"id": evaluation_id, "userId": current_user["id"]})
         
         # Check if we found and deleted the document
-        if result.deleted_count > 0:
+        if deleted > 0:
             return jsonify({"success": True})
             
         return jsonify({"error": "Evaluation not found"}), 404
@@ -724,11 +828,11 @@ def clear_evaluations(current_user):
     """Clear all evaluations for the current user."""
     try:
         # Delete all evaluations for this user from MongoDB
-        result = evaluations_collection.delete_many({"userId": current_user["id"]})
+        deleted = text_store.delete_documents(evaluations_collection, {"userId": current_user["id"]})
         
         return jsonify({
             "success": True,
-            "message": f"Deleted {result.deleted_count} evaluations",
+            "message": f"Deleted {deleted} evaluations",
         })
     except Exception as e:
         logger.error(f"Error clearing evaluations: {str(e)}")
@@ -740,19 +844,8 @@ def get_extracted_texts(current_user):
     """Get all extracted texts for the current user."""
     try:
         # Query MongoDB for the user's extracted texts
-        cursor = extracted_texts_collection.find({"userId": current_user["id"]})
-        texts_list = []
-        
-        # Convert MongoDB documents to list
-        for doc in cursor:
-            texts_list.append({
-                "id": doc["id"],
-                "fileName": doc.get("fileName", "Unknown"),
-                "timestamp": doc.get("timestamp", ""),
-                "extractedText": doc.get("extractedText", "")
-            })
-            
-        return jsonify(texts_list)
+        return list_user_documents(extracted_texts_collection, current_user,
+                                   EXTRACTED_TEXT_FIELDS, EXTRACTED_TEXT_SUMMARY_FIELDS)
     except Exception as e:
         logger.error(f"Error getting extracted texts: {str(e)}")
         return jsonify({"error": f"Error getting extracted texts: {str(e)}"}), 500
@@ -766,13 +859,16 @@ def get_extracted_text(current_user, text_id):
         doc = extracted_texts_collection.find_one({"id": text_id, "userId": current_user["id"]})
         
         if doc:
+            extracted_text = text_store.unpack_field(doc, "extractedText")
             return jsonify({
                 "id": doc["id"],
                 "fileName": doc.get("fileName", "Unknown"),
                 "timestamp": doc.get("timestamp", ""),
-                "extractedText": doc.get("extractedText", ""),
+                "extractedText": extracted_text,
                 "confidence": doc.get("confidence", 0),
-                "sections": doc.get("sections", [])
+                # Documents stored before sectionSpans carry the section text itself
+                "sections": (ocr.materialize_sections(extracted_text, doc["sectionSpans"])
+                             if "sectionSpans" in doc else doc.get("sections", []))
             })
             
         return jsonify({"error": "Extracted text not found"}), 404
@@ -786,10 +882,10 @@ def delete_extracted_text(current_user, id):
     """Delete an extracted text."""
     try:
         # Delete from MongoDB
-        result = extracted_texts_collection.delete_one({"id": id, "userId": current_user["id"]})
+        deleted = text_store.delete_documents(extracted_texts_collection, {"id": id, "userId": current_user["id"]})
         
         # Check if document was found and deleted
-        if result.deleted_count > 0:
+        if deleted > 0:
             return jsonify({"success": True})
             
         return jsonify({"error": "Text not found"}), 404
@@ -803,11 +899,11 @@ def clear_extracted_texts(current_user):
     """Clear all extracted texts for the current user."""
     try:
         # Delete all extracted texts for this user from MongoDB
-        result = extracted_texts_collection.delete_many({"userId": current_user["id"]})
+        deleted = text_store.delete_documents(extracted_texts_collection, {"userId": current_user["id"]})
         
         return jsonify({
             "success": True,
-            "message": f"Deleted {result.deleted_count} extracted texts",
+            "message": f"Deleted {deleted} extracted texts",
         })
     except Exception as e:
         logger.error(f"Error clearing extracted texts: {str(e)}")
@@ -889,22 +985,9 @@ Total Marks: 30
 def get_question_papers(current_user):
     """Get all available question papers for the current user."""
     try:
-        paper_list = []
-        
         # Query MongoDB for the user's question papers
-        cursor = question_papers_collection.find({"userId": current_user["id"]})
-        
-        # Convert MongoDB documents to list
-        for doc in cursor:
-            paper_list.append({
-                "id": doc["id"],
-                "fileName": doc.get("fileName", "Untitled"),
-                "timestamp": doc.get("timestamp", ""),
-                "questions": doc.get("questions", []),
-                "totalMarks": doc.get("totalMarks", 0)
-            })
-        
-        return jsonify(paper_list)
+        return list_user_documents(question_papers_collection, current_user,
+                                   QUESTION_PAPER_FIELDS, QUESTION_PAPER_SUMMARY_FIELDS)
     except Exception as e:
         logger.error(f"Error getting question papers: {str(e)}")
         return jsonify({"error": f"Error getting question papers: {str(e)}"}), 500
@@ -997,6 +1080,124 @@ def save_question_paper(current_user):
         logger.error(f"Error saving question paper: {str(e)}")
         return jsonify({"error": f"Error saving question paper: {str(e)}"}), 500
 
+@app.route('/api/jobs/process-file', methods=['POST'])
+@token_required
+def submit_process_file_job(current_user):
+    """Queue OCR of an uploaded file and return the job ID immediately."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    
+    try:
+        path = jobs.save_upload(file)
+        job = jobs.submit("process-file", current_user["id"], run_process_file,
+                          path, file.filename, current_user, cleanup_paths=[path])
+        return jsonify({"success": True, "job_id": job["id"], "status": job["status"]}), 202
+    except Exception as e:
+        logger.error(f"Error submitting process-file job: {str(e)}")
+        return jsonify({"error": f"Error submitting job: {str(e)}"}), 500
+
+@app.route('/api/jobs/process-complete', methods=['POST'])
+@token_required
+def submit_process_complete_job(current_user):
+    """Queue OCR and evaluation of an uploaded file and return the job ID immediately."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    
+    try:
+        path = jobs.save_upload(file)
+        job = jobs.submit("process-complete", current_user["id"], run_process_complete,
+                          path, file.filename, request.form.get('questionPaperId', None), current_user["id"],
+                          cleanup_paths=[path])
+        return jsonify({"success": True, "job_id": job["id"], "status": job["status"]}), 202
+    except Exception as e:
+        logger.error(f"Error submitting process-complete job: {str(e)}")
+        return jsonify({"error": f"Error submitting job: {str(e)}"}), 500
+
+@app.route('/api/jobs/evaluate', methods=['POST'])
+@token_required
+def submit_evaluation_job(current_user):
+    """Queue an evaluation (same payload as /api/evaluate) and return the job ID immediately."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    try:
+        job = jobs.submit("evaluate", current_user["id"], run_evaluation, data, current_user)
+        return jsonify({"success": True, "job_id": job["id"], "status": job["status"]}), 202
+    except Exception as e:
+        logger.error(f"Error submitting evaluation job: {str(e)}")
+        return jsonify({"error": f"Error submitting job: {str(e)}"}), 500
+
+@app.route('/api/jobs/map-questions-answers', methods=['POST'])
+@token_required
+def submit_map_questions_job(current_user):
+    """Queue question-answer mapping (same payload as /api/map-questions-answers) and return the job ID."""
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    try:
+        job = jobs.submit("map-questions-answers", current_user["id"], run_map_questions, data, current_user)
+        return jsonify({"success": True, "job_id": job["id"], "status": job["status"]}), 202
+    except Exception as e:
+        logger.error(f"Error submitting mapping job: {str(e)}")
+        return jsonify({"error": f"Error submitting job: {str(e)}"}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job_status(current_user, job_id):
+    """Return a job's status, progress and, once finished, its result."""
+    try:
+        job = jobs.get_job(job_id, current_user["id"])
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"success": True, "job": job}), 200
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {str(e)}")
+        return jsonify({"error": f"Error getting job: {str(e)}"}), 500
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@token_required
+def stream_job_events(current_user, job_id):
+    """
+    Stream a job's progress as server-sent events.
+    
+    Emits "page", "mapping" and "question" events with the partial text and
+    score as each step finishes, then a final "end" event with the result.
+    Reconnecting clients resume after the Last-Event-ID header (or the
+    ``after`` query parameter).
+    """
+    if not jobs.get_job(job_id, current_user["id"]):
+        return jsonify({"error": "Job not found"}), 404
+    
+    after = request.headers.get('Last-Event-ID') or request.args.get('after') or 0
+    try:
+        after = int(after)
+    except ValueError:
+        after = 0
+    
+    def generate():
+        for event in jobs.iter_events(job_id, current_user["id"], after):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            payload = json.dumps({"time": event["time"], **event["data"]}, default=str)
+            yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {payload}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop nginx-style proxies from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/health', methods=['GET', 'OPTIONS'])
 def health_check():
     """Simple health check endpoint to verify server is running."""
@@ -1014,6 +1215,19 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.route('/api/metrics', methods=['GET'])
+@token_required
+@admin_required
+def get_metrics(current_user):
+    """Return cache, request task and slow query counters for this worker process."""
+    return jsonify({
+        "ocr_cache": gemini_ocr.get_cache_stats(),
+        "evaluation_cache": agentic.get_cache_stats(),
+        "user_cache": get_user_cache_stats(),
+        "request_tasks": bounded_executor.get_stats(),
+        "slow_queries": db_indexes.slow_query_listener.stats()
+    })
+
 @app.route('/api/process-markdown', methods=['POST'])
 def process_markdown():
     """Process markdown content and extract questions with marks."""
@@ -1078,12 +1292,12 @@ def map_questions_answers_advanced():
             extracted_text = extracted_texts_collection.find_one({"id": text_id})
             if not extracted_text:
                 return jsonify({"error": f"Text ID not found: {text_id}"}), 404
-            answer_text = extracted_text["extractedText"]
+            answer_text = text_store.unpack_field(extracted_text, "extractedText")
         
         # Process the mapping using our unified mapper
         start_time = time.time()
-        qa_mapping = run_with_timeout(mapper.map_answers,
-            args=(question_paper_text, answer_text, is_md_format, handle_noise),
+        qa_mapping = bounded_executor.run(mapper.map_answers,
+            question_paper_text, answer_text, is_md_format, handle_noise,
             timeout=300  # 5 minutes
         )
         processing_time = time.time() - start_time
@@ -1108,6 +1322,13 @@ def map_questions_answers_advanced():
             "processing_time_seconds": processing_time
         })
         
+    except bounded_executor.ExecutorBusy as e:
+        logger.warning(f"Rejected map-questions-answers-advanced request: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Server is busy, please try again shortly",
+            "mappings": []
+        }), 503
     except TimeoutError:
         logger.error("Mapping questions to answers timed out")
         return jsonify({
@@ -1125,6 +1346,87 @@ def map_questions_answers_advanced():
             "mappings": []
         }), 200  # Return 200 instead of 500 to avoid connection errors
 
+def run_map_questions(progress, data, current_user):
+    """
+    Map a list of questions to the answers in a stored extracted text.
+    
+    Shared by /api/map-questions-answers and the background job of the same name.
+    
+    Args:
+        progress (jobs.JobProgress or None): Progress reporter for background jobs
+        data (dict): The request payload with text_id and questions
+        current_user (dict): The authenticated user
+        
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
+    # Get the text ID and questions
+    text_id = data.get('text_id')
+    questions = data.get('questions', [])
+    
+    if not text_id:
+        return {"error": "Missing text_id parameter"}, 400
+        
+    if not questions or not isinstance(questions, list):
+        return {"error": "Missing or invalid questions parameter"}, 400
+    
+    # Get the extracted text from the database
+    extracted_text_doc = extracted_texts_collection.find_one(
+        {"id": text_id, "userId": current_user["id"]}
+    )
+    
+    if not extracted_text_doc:
+        return {"error": f"Text ID not found: {text_id}"}, 404
+        
+    answer_text = text_store.unpack_field(extracted_text_doc, "extractedText")
+    
+    # Format questions for mapper
+    question_paper_text = {
+        "title": "Questions",
+        "totalMarks": sum(q.get("marks", 0) for q in questions),
+        "questions": [
+            {
+                "id": str(i+1),
+                "text": q.get("question", ""),
+                "marks": q.get("marks", 0)
+            }
+            for i, q in enumerate(questions)
+        ]
+    }
+    
+    # Use our mapping function without timeout
+    try:
+        start_time = time.time()
+        # Anchored answers are mapped locally; the model only sees what is left
+        qa_mapping = mapper.map_question_list(question_paper_text["questions"], answer_text, True, True,
+                                              on_mapping=progress.mapping_done if progress else None)
+        processing_time = time.time() - start_time
+        
+        # If no mappings were found
+        if len(qa_mapping) == 0:
+            return {
+                "success": False,
+                "message": "Could not map any questions to answers.",
+                "mappings": [],
+                "processing_time_seconds": processing_time
+            }, 200
+        
+        # Return the mapped QA pairs
+        return {
+            "success": True,
+            "message": f"Successfully mapped {len(qa_mapping)} questions to answers",
+            "mappings": qa_mapping,
+            "processing_time_seconds": processing_time
+        }, 200
+        
+    except Exception as e:
+        logger.error(f"Error in mapper.map_answers: {str(e)}")
+        return {
+            "success": False, 
+            "message": f"Error mapping questions to answers: {str(e)}",
+            "mappings": []
+        }, 200
+
 @app.route('/api/map-questions-answers', methods=['POST', 'OPTIONS'])
 def map_questions_answers():
     """Map questions to answers in extracted text."""
@@ -1137,27 +1439,11 @@ def map_questions_answers():
         return response
     
     # For actual POST requests, apply token validation
-    token = None
-    
-    # Check for token in headers
-    auth_header = request.headers.get('Authorization')
-    
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-    
-    if not token:
-        logger.warning("No token provided for map-questions-answers")
-        return jsonify({"error": "Authentication token is missing"}), 401
+    current_user, auth_error = authenticate_request()
+    if auth_error:
+        return auth_error
     
     try:
-        # Decode and validate token
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        current_user = users_collection.find_one({"id": data["id"]})
-        
-        if not current_user:
-            logger.warning(f"User ID from token not found: {data.get('id')}")
-            return jsonify({"error": "Invalid user"}), 401
-        
         # Continue with the original function logic
         try:
             data = request.get_json()
@@ -1165,74 +1451,8 @@ def map_questions_answers():
             if not data:
                 return jsonify({"error": "No data provided"}), 400
                 
-            # Get the text ID and questions
-            text_id = data.get('text_id')
-            questions = data.get('questions', [])
-            
-            if not text_id:
-                return jsonify({"error": "Missing text_id parameter"}), 400
-                
-            if not questions or not isinstance(questions, list):
-                return jsonify({"error": "Missing or invalid questions parameter"}), 400
-            
-            # Get the extracted text from the database
-            extracted_text_doc = extracted_texts_collection.find_one(
-                {"id": text_id, "userId": current_user["id"]}
-            )
-            
-            if not extracted_text_doc:
-                return jsonify({"error": f"Text ID not found: {text_id}"}), 404
-                
-            answer_text = extracted_text_doc.get("extractedText", "")
-            
-            # Format questions for mapper
-            question_paper_text = {
-                "title": "Questions",
-                "totalMarks": sum(q.get("marks", 0) for q in questions),
-                "questions": [
-                    {
-                        "id": str(i+1),
-                        "text": q.get("question", ""),
-                        "marks": q.get("marks", 0)
-                    }
-                    for i, q in enumerate(questions)
-                ]
-            }
-            
-            # Convert to JSON string for mapping
-            question_paper_json = json.dumps(question_paper_text)
-            
-            # Use our mapping function without timeout
-            try:
-                start_time = time.time()
-                # Direct call to mapper without timeout
-                qa_mapping = mapper.map_answers(question_paper_json, answer_text, True, True)
-                processing_time = time.time() - start_time
-                
-                # If no mappings were found
-                if len(qa_mapping) == 0:
-                    return jsonify({
-                        "success": False,
-                        "message": "Could not map any questions to answers.",
-                        "mappings": [],
-                        "processing_time_seconds": processing_time
-                    }), 200
-                
-                # Return the mapped QA pairs
-                return jsonify({
-                    "success": True,
-                    "message": f"Successfully mapped {len(qa_mapping)} questions to answers",
-                    "mappings": qa_mapping,
-                    "processing_time_seconds": processing_time
-                })
-                
-            except Exception as e:
-                logger.error(f"Error in mapper.map_answers: {str(e)}")
-                return jsonify({
-                    "success": False, 
-                    "message": f"Error mapping questions to answers: {str(e)}",
-                    "mappings": []
-                }), 200
+            payload, status = run_map_questions(None, data, current_user)
+            return jsonify(payload), status
                 
         except Exception as e:
             logger.error(f"Error in map_questions_answers: {str(e)}")
@@ -1242,9 +1462,9 @@ def map_questions_answers():
                 "mappings": []
             }), 200
     
-    except Exception as jwt_error:
-        logger.error(f"JWT validation error: {str(jwt_error)}")
-        return jsonify({"error": "Invalid token"}), 401
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 def extract_questions_from_markdown(content):
     """Extract questions and their marks from markdown content."""
@@ -1287,33 +1507,6 @@ def extract_questions_from_markdown(content):
     
     return questions
 
-def run_with_timeout(func, args=(), kwargs={}, timeout=60):
-    """Run a function with a timeout."""
-    result_queue = queue.Queue()
-    
-    # Define a wrapper function that puts the result in a queue
-    def wrapper():
-        try:
-            result = func(*args, **kwargs)
-            result_queue.put(result)
-        except Exception as e:
-            result_queue.put(e)
-    
-    # Start the function in a separate thread
-    thread = threading.Thread(target=wrapper)
-    thread.daemon = True
-    thread.start()
-    
-    # Wait for the result with timeout
-    try:
-        result = result_queue.get(timeout=timeout)
-        if isinstance(result, Exception):
-            raise result
-        return result
-    except queue.Empty:
-        # If queue.get times out, raise TimeoutError
-        raise TimeoutError(f"Function execution timed out after {timeout} seconds")
-
 @app.route('/api/demo-login', methods=['POST', 'OPTIONS'])
 def demo_login():
     """Create and authenticate a demo user."""
@@ -1341,7 +1534,7 @@ def demo_login():
         else:
             # Create a new demo user
             user_id = str(uuid.uuid4())
-            hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+            hashed_password = password_hashing.hash_password(password)
             
             demo_user = {
                 "id": user_id,
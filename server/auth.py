@@ -1,4 +1,3 @@
-import bcrypt
 try:
     import jwt
 except ImportError:
@@ -6,9 +5,14 @@ except ImportError:
 import uuid
 import datetime
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify
 from database import users_collection
+import password_hashing
 import logging
 
 # Configure logging
@@ -19,6 +23,107 @@ logger = logging.getLogger(__name__)
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_EXPIRATION = int(os.getenv("JWT_EXPIRATION", 186400))  # 24 hours by default
 
+# Authenticated users are cached per process for this long, so most requests skip the users lookup
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 1024))
+
+
+class UserCache:
+    """
+    Bounded, expiring cache of user records for token validation.
+
+    Entries are keyed by user ID and a fingerprint of the token, so a user
+    record is only served to a token that was already checked against the
+    database once. The least recently used entry is evicted when full.
+    Caches are per process: a change made by another worker is picked up
+    when the entry expires, after at most ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=AUTH_CACHE_TTL_SECONDS, max_entries=AUTH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(user_id, token):
+        return user_id, hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, user_id, token):
+        """Return the cached user for this user ID and token, or None."""
+        key = self._key(user_id, token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            user, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return user
+
+    def put(self, user_id, token, user):
+        """Cache a user record fetched for this user ID and token."""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        key = self._key(user_id, token)
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, user_id):
+        """Drop every cached entry of a user, e.g. after the user record changed."""
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def stats(self):
+        """Return hit/miss counters, the hit ratio and the current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+user_cache = UserCache()
+
+
+def get_user_cache_stats():
+    """Counters of the authenticated-user cache of this worker process."""
+    return user_cache.stats()
+
+
+def invalidate_user(user_id):
+    """Forget the cached record of a user; call after changing or deleting the user."""
+    user_cache.invalidate(user_id)
+
 
 def create_user(username, password, email, role="user"):
     """Create a new user in the database"""
@@ -30,14 +135,13 @@ def create_user(username, password, email, role="user"):
         raise ValueError(f"Email {email} already exists")
     
     # Hash the password
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+    hashed_password = password_hashing.hash_password(password)
     
     # Create user document
     user = {
         "id": str(uuid.uuid4()),
         "username": username,
-        "password": hashed_password.decode('utf-8'),
+        "password": hashed_password,
         "email": email,
         "role": role,
         "created_at": datetime.datetime.now(),
@@ -78,12 +182,17 @@ def authenticate_user(username, password):
         return None
     
     # Check password
-    if bcrypt.checkpw(password.encode('utf-8'), user["password"].encode('utf-8')):
-        # Update last login time
+    password_ok, new_hash = password_hashing.check_password(password, user["password"])
+    if password_ok:
+        # Update last login time, and the hash if it was made with another work factor
+        update = {"last_login": datetime.datetime.now()}
+        if new_hash:
+            update["password"] = new_hash
         users_collection.update_one(
             {"username": username},
-            {"$set": {"last_login": datetime.datetime.now()}}
+            {"$set": update}
         )
+        invalidate_user(user["id"])
         
         # Generate JWT token - fix for PyJWT compatibility
         payload = {
@@ -111,45 +220,62 @@ def authenticate_user(username, password):
     return None
 
 
-def token_required(f):
-    """Decorator to require JWT token for API endpoints"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Check for token in headers
-        auth_header = request.headers.get('Authorization')
-        logger.info(f"Authorization header: {auth_header}")
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(" ")[1]
-            logger.info(f"Token extracted: {token[:10]}...")
-        
-        if not token:
-            logger.warning("No token provided")
-            return jsonify({"error": "Authentication token is missing"}), 401
+def get_request_token():
+    """Return the bearer token of the current request, or None."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(" ")[1]
+    return None
+
+
+def authenticate_request():
+    """
+    Validate the current request's bearer token and load its user.
+
+    The JWT is verified on every call; the user lookup is served from
+    user_cache when this token was already seen for the user.
+
+    Returns:
+        tuple: (user, None) on success, or (None, (response, status)) with
+        the 401 error to return
+    """
+    token = get_request_token()
+    if not token:
+        logger.warning(f"No token provided for {request.path}")
+        return None, (jsonify({"error": "Authentication token is missing"}), 401)
+    
+    try:
+        # Decode and validate token
+        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
         
-        try:
-            # Decode and validate token
-            logger.info(f"Attempting to decode token with secret key: {JWT_SECRET[:5]}...")
-            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            logger.info(f"Token decoded successfully. User ID: {data.get('id')}")
-            
+        current_user = user_cache.get(data["id"], token)
+        if current_user is None:
             current_user = users_collection.find_one({"id": data["id"]})
-            
             if not current_user:
                 logger.warning(f"User not found for ID: {data.get('id')}")
-                return jsonify({"error": "Invalid authentication token - user not found"}), 401
-            
-        except jwt.ExpiredSignatureError:
-            logger.warning("JWT token expired")
-            return jsonify({"error": "Authentication token has expired"}), 401
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"Invalid JWT token: {str(e)}")
-            return jsonify({"error": f"Invalid authentication token: {str(e)}"}), 401
-        except Exception as e:
-            logger.error(f"Unexpected error validating token: {str(e)}")
-            return jsonify({"error": f"Authentication error: {str(e)}"}), 401
+                return None, (jsonify({"error": "Invalid authentication token - user not found"}), 401)
+            user_cache.put(data["id"], token, current_user)
+        
+    except jwt.ExpiredSignatureError:
+        logger.warning("JWT token expired")
+        return None, (jsonify({"error": "Authentication token has expired"}), 401)
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"Invalid JWT token: {str(e)}")
+        return None, (jsonify({"error": f"Invalid authentication token: {str(e)}"}), 401)
+    except Exception as e:
+        logger.error(f"Unexpected error validating token: {str(e)}")
+        return None, (jsonify({"error": f"Authentication error: {str(e)}"}), 401)
+    
+    return current_user, None
+
+
+def token_required(f):
+    """Decorator to require JWT token for API endpoints"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        current_user, error = authenticate_request()
+        if error:
+            return error
         
         # Pass the current user to the route
         return f(current_user, *args, **kwargs)
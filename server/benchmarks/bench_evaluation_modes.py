@@ -0,0 +1,84 @@
+"""
+Benchmark: latency, model calls and tokens of the agentic evaluation modes.
+
+Evaluates the same synthetic question-answer set with
+agentic.multi_agent_evaluate_answers in each mode against llm_backend's
+FakeBackend. Token counts are the fake backend's estimates (~4 characters
+per token), which is enough to compare the modes. The evaluation cache is
+disabled.
+
+Usage (from the server directory):
+    python benchmarks/bench_evaluation_modes.py [--questions 10] [--answer-words 150]
+        [--latency lognormal:800,0.4] [--ms-per-token 0] [--workers 3] [--token-budget 6000] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import llm_backend
+import agentic
+
+
+def make_qa_mapping(questions, answer_words, seed):
+    rng = random.Random(seed)
+    words = llm_backend._WORDS
+    return [
+        {
+            "questionNumber": number,
+            "questionText": f"Explain concept {number} of object-oriented programming with an example.",
+            "maxMarks": rng.choice([2, 5, 10]),
+            "answer": " ".join(rng.choice(words) for _ in range(answer_words)),
+        }
+        for number in range(1, questions + 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--answer-words", type=int, default=150)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="Fake model latency distribution")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Extra latency per generated token")
+    parser.add_argument("--workers", type=int, default=agentic.EVAL_MAX_WORKERS, help="Questions evaluated at once")
+    parser.add_argument("--token-budget", type=int, default=agentic.EVAL_BATCH_TOKEN_BUDGET,
+                        help="Token budget per batched request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = llm_backend.set_backend(llm_backend.FakeBackend(
+        latency=args.latency, ms_per_token=args.ms_per_token, seed=args.seed
+    ))
+    agentic.EVAL_BATCH_TOKEN_BUDGET = args.token_budget
+    agentic.EVAL_CACHE_ENABLED = False
+    qa_mapping = make_qa_mapping(args.questions, args.answer_words, args.seed)
+
+    rows = []
+    for mode in agentic.EVAL_MODES:
+        backend.reset_stats()
+        start = time.perf_counter()
+        agentic.multi_agent_evaluate_answers(qa_mapping, max_workers=args.workers, mode=mode)
+        elapsed = time.perf_counter() - start
+        rows.append((mode, elapsed, backend.stats()))
+
+    print(f"{args.questions} questions, {args.answer_words}-word answers, latency={args.latency}, "
+          f"ms_per_token={args.ms_per_token}, workers={args.workers}, "
+          f"batches={len(agentic.plan_batches(qa_mapping))}")
+    print(f"{'mode':<14}{'wall s':>9}{'calls':>8}{'prompt tok':>12}{'output tok':>12}")
+    for mode, elapsed, stats in rows:
+        print(f"{mode:<14}{elapsed:>9.2f}{stats['calls']:>8}{stats['prompt_tokens']:>12}{stats['response_tokens']:>12}")
+
+    _, base_s, base = rows[0]
+    base_tokens = base["prompt_tokens"] + base["response_tokens"]
+    for mode, elapsed, stats in rows[1:]:
+        tokens = stats["prompt_tokens"] + stats["response_tokens"]
+        print(f"{mode} vs {rows[0][0]}: {base['calls'] / stats['calls']:.1f}x fewer calls, "
+              f"{base_tokens / tokens:.1f}x fewer tokens, {base_s / elapsed:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
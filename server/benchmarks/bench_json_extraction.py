@@ -0,0 +1,117 @@
+"""
+Benchmark: JSON extraction from model responses, regex search vs. single-pass scanner.
+
+Compares the previous regex-based mapper.extract_json_from_text (kept here
+as legacy_extract_json) with the current scanner on well-formed and
+adversarial inputs of about --size bytes, and measures how soon
+mapper.JSONItemStream yields the first item of a streamed response.
+
+Usage (from the server directory):
+    python benchmarks/bench_json_extraction.py [--size 100000] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import mapper
+
+
+def legacy_extract_json(text):
+    """The regex-based extractor mapper used before the scanner."""
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    for pattern in (r'```(?:json)?\s*([\s\S]*?)\s*```', r'\[\s*{[\s\S]*}\s*\]', r'({[\s\S]*}|\[[\s\S]*\])'):
+        for match in re.findall(pattern, text):
+            try:
+                return json.loads(match)
+            except Exception:
+                continue
+    return None
+
+
+def mapping_items(size):
+    items = []
+    length = 0
+    number = 0
+    while length < size:
+        number += 1
+        item = {"questionNumber": number, "question": f"Explain concept {number}", "maxMarks": 5,
+                "answer": "The answer covers [brackets], {braces} and \"quotes\". " * 8}
+        items.append(item)
+        length += len(json.dumps(item))
+    return items
+
+
+def make_inputs(size):
+    items = mapping_items(size)
+    array = json.dumps(items, indent=2)
+    return {
+        "fenced array": "Here is the mapping:\n```json\n" + array + "\n```\nLet me know if you need more.",
+        "array after prose brackets": "Note [see rubric] and [1] " * (size // 52) + "\n" + array,
+        "truncated array": "```json\n" + array[: len(array) * 3 // 4],
+        "unclosed brackets": "[" * size,
+        "unclosed braces then array": "{" * (size // 2) + json.dumps(items[:2]),
+        "no json": "The student wrote an answer {with braces but no json " * (size // 52),
+    }
+
+
+def time_call(function, text, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function(text)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def describe(result):
+    if isinstance(result, list):
+        return f"list[{len(result)}]"
+    if isinstance(result, dict):
+        return "dict"
+    return "None"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'input':<30}{'bytes':>9}{'legacy ms':>11}{'scanner ms':>12}{'legacy':>12}{'scanner':>12}")
+    for name, text in make_inputs(args.size).items():
+        legacy_s, legacy_result = time_call(legacy_extract_json, text, args.runs)
+        scanner_s, scanner_result = time_call(mapper.extract_json_from_text, text, args.runs)
+        print(f"{name:<30}{len(text):>9}{legacy_s * 1000:>11.1f}{scanner_s * 1000:>12.1f}"
+              f"{describe(legacy_result):>12}{describe(scanner_result):>12}")
+
+    # Streaming: time to the first item vs. to the whole array, fed in 64-char chunks
+    text = "```json\n" + json.dumps(mapping_items(args.size), indent=2) + "\n```"
+    chunks = [text[start:start + 64] for start in range(0, len(text), 64)]
+    stream = mapper.JSONItemStream()
+    first_chunk = None
+    count = 0
+    start = time.perf_counter()
+    for position, chunk in enumerate(chunks):
+        items = stream.feed(chunk)
+        if items and first_chunk is None:
+            first_chunk = position + 1
+        count += len(items)
+    elapsed = time.perf_counter() - start
+    print(f"\nstream: {count} items from {len(chunks)} chunks in {elapsed * 1000:.1f} ms, "
+          f"first item after chunk {first_chunk} ({first_chunk / len(chunks):.1%} of the response)")
+
+
+if __name__ == "__main__":
+    main()
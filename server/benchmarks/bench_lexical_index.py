@@ -0,0 +1,107 @@
+"""
+Benchmark: BM25 candidate retrieval over answer booklets of different sizes.
+
+Builds synthetic booklets of unnumbered answers, where each answer reuses a
+few topic words from its question among filler words, and measures
+lexical_index segmentation + indexing time, query time, recall (the true
+answer paragraph among a question's top-k candidates) and how much of the
+text narrow_text keeps for the model.
+
+Usage (from the server directory):
+    python benchmarks/bench_lexical_index.py [--pages 10 25 50 100] [--words-per-page 300]
+        [--questions 10] [--top-k 3] [--runs 5] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import llm_backend
+import lexical_index
+
+TOPICS = [
+    "encapsulation", "inheritance", "polymorphism", "abstraction", "recursion", "hashing",
+    "normalization", "deadlock", "paging", "scheduling", "semaphore", "indexing",
+    "transaction", "concurrency", "compiler", "lexer", "parser", "routing", "subnetting",
+    "encryption", "sorting", "heap", "graph", "tree", "queue", "stack", "pointer",
+    "virtualization", "caching", "pipelining",
+]
+
+
+def make_booklet(pages, words_per_page, questions, rng):
+    """Return (questions, answer text, {question id: answer paragraph texts})."""
+    topics = rng.sample(TOPICS, min(questions, len(TOPICS)))
+    question_list = [
+        {"id": str(number), "text": f"Explain {topic} and {rng.choice(TOPICS)} with an example", "marks": 5}
+        for number, topic in enumerate(topics, start=1)
+    ]
+    filler = llm_backend._WORDS
+    words_per_answer = pages * words_per_page // len(question_list)
+    paragraphs = []
+    truth = {}
+    for question, topic in zip(question_list, topics):
+        written = 0
+        truth[question["id"]] = []
+        while written < words_per_answer:
+            size = rng.randint(40, 100)
+            words = [rng.choice(filler) for _ in range(size)]
+            # About half the paragraphs of an answer mention its topic
+            if rng.random() < 0.5:
+                for _ in range(rng.randint(1, 3)):
+                    words[rng.randrange(size)] = topic
+                truth[question["id"]].append(" ".join(words))
+            paragraphs.append(" ".join(words))
+            written += size
+    # Page markers as written by gemini_ocr.process_images
+    text = []
+    per_page = max(1, len(paragraphs) // pages)
+    for page in range(pages):
+        text.append(f"--- Page {page + 1} ---")
+        text.extend(paragraphs[page * per_page:(page + 1) * per_page] if page < pages - 1
+                    else paragraphs[page * per_page:])
+    return question_list, "\n\n".join(text), truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.words_per_page} words/page, {args.questions} questions, top-{args.top_k}, {args.runs} runs")
+    print(f"{'pages':>6}{'chars':>10}{'segments':>10}{'index ms':>10}{'query ms':>10}"
+          f"{'recall':>8}{'kept %':>8}")
+    for pages in args.pages:
+        rng = random.Random(args.seed + pages)
+        questions, text, truth = make_booklet(pages, args.words_per_page, args.questions, rng)
+
+        index_times, query_times = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            index = lexical_index.BM25Index(lexical_index.segment_text(text))
+            index_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            candidates = lexical_index.candidate_segments(questions, text, args.top_k, index)
+            query_times.append(time.perf_counter() - start)
+
+        hits = sum(
+            any(candidate["text"] in truth[key] for candidate in found)
+            for key, found in candidates.items()
+        )
+        narrowed = lexical_index.narrow_text(questions, text, args.top_k)
+        print(f"{pages:>6}{len(text):>10}{len(index.segments):>10}"
+              f"{statistics.median(index_times) * 1000:>10.1f}{statistics.median(query_times) * 1000:>10.1f}"
+              f"{hits / len(questions):>8.0%}{len(narrowed) / len(text):>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: login throughput versus bcrypt work factor and hashing pool size.
+
+Simulates a burst of --logins logins handled by --threads request threads
+(the gthread count in the Procfile). Each login is a
+password_hashing.check_password against a stored hash. While the burst runs,
+a probe thread does light request-sized work in a loop, and its latency
+shows how much the hashing slows down the other requests of the worker.
+Pool size 0 hashes inline on the request threads, as the server did before
+the hashing pool existed.
+
+Usage (from the server directory):
+    python benchmarks/bench_password_hashing.py [--rounds 10,12] [--workers 0,1,2,4]
+        [--logins 32] [--threads 8]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import password_hashing
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def probe(stop, latencies):
+    """Light request work: serialise a small listing page."""
+    payload = [{"id": str(number), "fileName": f"answers_{number}.pdf", "timestamp": "2026-01-01"}
+               for number in range(50)]
+    while not stop.is_set():
+        start = time.perf_counter()
+        json.dumps(payload)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.001)
+
+
+def run_burst(stored_hash, rounds, logins, threads):
+    def login(_):
+        start = time.perf_counter()
+        ok, _new_hash = password_hashing.check_password(PASSWORD, stored_hash, rounds)
+        assert ok
+        return time.perf_counter() - start
+
+    stop = threading.Event()
+    probe_latencies = []
+    probe_thread = threading.Thread(target=probe, args=(stop, probe_latencies))
+    probe_thread.start()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    probe_thread.join()
+    return elapsed, latencies, probe_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", default="10,12")
+    parser.add_argument("--workers", default="0,1,2,4")
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.logins} logins on {args.threads} request threads\n")
+    print(f"{'rounds':>6}{'pool':>6}{'logins/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'probe p95 ms':>14}")
+    for rounds in [int(value) for value in args.rounds.split(",")]:
+        stored_hash = password_hashing._hash(PASSWORD, rounds)
+        for workers in [int(value) for value in args.workers.split(",")]:
+            password_hashing.shutdown()
+            password_hashing.PASSWORD_HASH_WORKERS = workers
+            # Start the pool processes before timing, as a running server has
+            password_hashing.check_password(PASSWORD, stored_hash, rounds)
+            if workers > 1:
+                list(password_hashing._get_executor().map(password_hashing._hash, [PASSWORD] * workers,
+                                                          [4] * workers))
+            elapsed, latencies, probe_latencies = run_burst(stored_hash, rounds, args.logins, args.threads)
+            print(f"{rounds:>6}{workers:>6}{args.logins / elapsed:>10.1f}"
+                  f"{statistics.median(latencies) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+                  f"{percentile(probe_latencies, 0.95) * 1000:>14.2f}")
+    password_hashing.shutdown()
+
+    # Rehash on login: a hash of another cost is replaced on the first successful check
+    old_hash = password_hashing._hash(PASSWORD, 10)
+    ok, new_hash = password_hashing.check_password(PASSWORD, old_hash, 12)
+    print(f"\nrehash: 10-round hash checked at cost 12 -> match {ok}, "
+          f"new hash has {password_hashing.hash_rounds(new_hash)} rounds")
+    password_hashing.shutdown()
+
+
+if __name__ == "__main__":
+    main()
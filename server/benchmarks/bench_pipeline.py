@@ -0,0 +1,116 @@
+"""
+Benchmark: end-to-end OCR -> mapping -> evaluation against the offline fake LLM backend.
+
+Runs the real pipeline code (ocr.process_file, mapper.map_answers and
+agentic.multi_agent_evaluate_answers) with llm_backend's FakeBackend in place
+of Gemini. No API key or network is needed, and runs with the same seed and
+latency settings are comparable.
+The OCR page and evaluation caches are disabled so every run makes the same
+requests.
+
+Usage (from the server directory):
+    python benchmarks/bench_pipeline.py [--pages 6] [--questions 5] [--runs 3]
+        [--latency lognormal:800,0.4] [--ms-per-token 0] [--error-rate 0]
+        [--rpm 0] [--max-concurrency 0] [--seed 0]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import llm_backend
+import gemini_ocr
+import ocr
+import mapper
+import agentic
+from bench_page_encoding import make_sample_pdf
+
+
+def make_question_paper(questions):
+    return "\n".join(f"{number}. Explain concept {number} with an example [{5 + number % 3 * 5}]"
+                     for number in range(1, questions + 1))
+
+
+def run_pipeline(pdf_path, question_paper):
+    timings = {}
+
+    start = time.perf_counter()
+    ocr_result = ocr.process_file(pdf_path)
+    timings["ocr"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mapping = mapper.map_answers(question_paper, ocr_result["text"], True, True)
+    timings["mapping"] = time.perf_counter() - start
+
+    qa_mapping = [
+        {
+            "questionNumber": item["questionNumber"],
+            "questionText": item["question"],
+            "maxMarks": item["maxMarks"],
+            "answer": item["answer"],
+        }
+        for item in mapping
+    ]
+    start = time.perf_counter()
+    if qa_mapping:
+        agentic.multi_agent_evaluate_answers(qa_mapping)
+    timings["evaluation"] = time.perf_counter() - start
+
+    timings["total"] = sum(timings.values())
+    return timings, ocr_result["page_count"], len(qa_mapping)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="Fake model latency distribution")
+    parser.add_argument("--ms-per-token", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute quota (0 = unlimited)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Concurrent requests served (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = llm_backend.set_backend(llm_backend.FakeBackend(
+        latency=args.latency,
+        ms_per_token=args.ms_per_token,
+        error_rate=args.error_rate,
+        requests_per_minute=args.rpm,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    ))
+    gemini_ocr.OCR_CACHE_ENABLED = False
+    agentic.EVAL_CACHE_ENABLED = False
+    question_paper = make_question_paper(args.questions)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "answers.pdf")
+        make_sample_pdf(pdf_path, args.pages, scanned=True)
+        for run in range(args.runs):
+            backend.reset_stats()
+            timings, pages, questions = run_pipeline(pdf_path, question_paper)
+            results.append((timings, backend.stats()))
+            print(f"run {run + 1}: {pages} pages, {questions} questions, {timings['total']:.1f} s")
+
+    print(f"\nfake backend: latency={args.latency} error_rate={args.error_rate} rpm={args.rpm} "
+          f"max_concurrency={args.max_concurrency} seed={args.seed}")
+    print(f"{'stage':<14}{'mean s':>10}{'min s':>10}")
+    for stage in ("ocr", "mapping", "evaluation", "total"):
+        values = [timings[stage] for timings, _ in results]
+        print(f"{stage:<14}{statistics.mean(values):>10.2f}{min(values):>10.2f}")
+
+    stats = results[-1][1]
+    print(f"\nrequests per run: {stats['calls']} ({stats['errors']} errors, {stats['throttled']} throttled), "
+          f"peak in flight {stats['peak_in_flight']}, model p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Bounded Executor Module - Shared, deadline-aware pool for synchronous request work
+
+Routes that wait for long model-backed work with a time limit submit it
+here instead of starting a thread per request. The pool has
+TASK_MAX_WORKERS threads and admits at most TASK_MAX_QUEUE more tasks
+waiting for one; further submissions are rejected at once with
+ExecutorBusy, so load beyond capacity is turned away rather than piled up.
+
+Each task runs under an llm_backend.deadline set when it was submitted, so
+time spent queued counts against it. When the caller stops waiting, a task
+that has not started is cancelled, and a running task stops at its next
+model call or retry, which raise DeadlineExceeded past the deadline;
+nothing keeps paying for model requests whose result nobody will read.
+"""
+
+import os
+import time
+import logging
+import threading
+import concurrent.futures
+
+import llm_backend
+
+logger = logging.getLogger(__name__)
+
+# Threads running tasks, per server worker process
+TASK_MAX_WORKERS = int(os.getenv("TASK_MAX_WORKERS", 4))
+# Tasks admitted beyond the running ones; more are rejected
+TASK_MAX_QUEUE = int(os.getenv("TASK_MAX_QUEUE", 8))
+
+
+class ExecutorBusy(Exception):
+    """Raised when a task is submitted while the executor is at capacity."""
+
+
+class BoundedExecutor:
+    """
+    A thread pool with admission control, per-task deadlines and counters.
+    """
+
+    def __init__(self, max_workers=TASK_MAX_WORKERS, max_queue=TASK_MAX_QUEUE, name="task"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "timed_out": 0,
+            "rejected": 0, "cancelled": 0, "abandoned": 0,
+        }
+        self._queued = 0
+        self._in_flight = 0
+
+    def _count(self, counter, delta=1):
+        with self._lock:
+            self._stats[counter] += delta
+
+    def _task(self, func, args, kwargs, task_deadline):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            with llm_backend.deadline(at=task_deadline):
+                # Waited in the queue past the deadline: do not start
+                llm_backend.check_deadline()
+                return func(*args, **kwargs)
+        except llm_backend.DeadlineExceeded:
+            self._count("abandoned")
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def run(self, func, *args, timeout, **kwargs):
+        """
+        Run func(*args, **kwargs) on the pool and wait for its result.
+
+        Args:
+            func (callable): The work
+            timeout (float): Seconds allowed, including time spent queued
+
+        Returns:
+            The result of func
+
+        Raises:
+            ExecutorBusy: If the pool and its queue are full
+            TimeoutError: If the result is not ready in time
+            Exception: Whatever func raised
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise ExecutorBusy(f"All {self.max_workers} workers and {self.max_queue} queue slots are busy")
+        task_deadline = time.monotonic() + timeout
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._queued += 1
+        try:
+            future = self._pool.submit(self._task, func, args, kwargs, task_deadline)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            self._slots.release()
+            raise
+
+        try:
+            result = future.result(timeout=max(task_deadline - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            self._count("timed_out")
+            if future.cancel():
+                # Never started: free its slot here, as _task will not run
+                with self._lock:
+                    self._queued -= 1
+                    self._stats["cancelled"] += 1
+                self._slots.release()
+            raise TimeoutError(f"Task timed out after {timeout} seconds")
+        except llm_backend.DeadlineExceeded:
+            self._count("timed_out")
+            raise TimeoutError(f"Task timed out after {timeout} seconds")
+        except Exception:
+            self._count("failed")
+            raise
+        self._count("completed")
+        return result
+
+    def stats(self):
+        """
+        Return the task counters.
+
+        Returns:
+            dict: in_flight and queued now; submitted, completed, failed,
+            timed_out, rejected, cancelled (timed out before starting) and
+            abandoned (stopped at the deadline) since start
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            stats["queued"] = self._queued
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        return stats
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BoundedExecutor()
+        return _executor
+
+
+def run(func, *args, timeout, **kwargs):
+    """Run func on the shared executor; see BoundedExecutor.run."""
+    return get_executor().run(func, *args, timeout=timeout, **kwargs)
+
+
+def get_stats():
+    """Task counters of the shared executor in this worker process."""
+    return get_executor().stats()
@@ -8,6 +8,7 @@ from pymongo import MongoClient, errors
 import uuid
 from datetime import datetime
 import bcrypt
+import db_indexes
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -38,6 +39,7 @@ users_collection = None
 extracted_texts_collection = None
 question_papers_collection = None
 evaluations_collection = None
+jobs_collection = None
 
 # Simple password hashing function to avoid circular imports
 def hash_password(password):
@@ -54,12 +56,14 @@ def init_db():
     """Initialize database connection and collection references"""
     global client, db
     global users_collection, extracted_texts_collection, question_papers_collection, evaluations_collection
+    global jobs_collection
     
     logger.info(f"Attempting to connect to MongoDB at: {MONGO_URI}")
     
     try:
         # Connect to MongoDB
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000,
+                             event_listeners=[db_indexes.slow_query_listener])
         # Test connection by getting server info
         client.admin.command('ping')
         
@@ -70,13 +74,10 @@ def init_db():
         extracted_texts_collection = db.extracted_texts
         question_papers_collection = db.question_papers
         evaluations_collection = db.evaluations
+        jobs_collection = db.jobs
         
-        # Create indexes
-        try:
-            users_collection.create_index("username", unique=True)
-            users_collection.create_index("email", unique=True)
-        except Exception as index_error:
-            logger.error(f"Failed to create indexes: {str(index_error)}")
+        # Create indexes (see db_indexes.INDEXES) without holding up startup
+        db_indexes.start_index_build(db)
         
         logger.info("Successfully connected to MongoDB")
             
@@ -0,0 +1,281 @@
+"""
+Database Indexes Module - Declared MongoDB indexes, query plan checks and slow query reporting
+
+Every per-user query in app.py, auth.py and jobs.py filters on ``id``,
+``userId`` or both. INDEXES declares the indexes those queries need;
+ensure_indexes builds them idempotently (create_index is a no-op for an index
+that already exists) on a background thread at startup, and then
+verify_query_plans runs explain() on each hot query shape in HOT_QUERIES and
+logs any that still scan the whole collection.
+
+SlowQueryListener is a pymongo command listener that logs commands slower
+than DB_SLOW_QUERY_MS by query shape (field names with values removed) and
+keeps per-shape counters for /api/metrics.
+"""
+
+import os
+import time
+import logging
+import threading
+from pymongo import ASCENDING, DESCENDING, IndexModel, errors, monitoring
+
+logger = logging.getLogger(__name__)
+
+# Build the declared indexes at startup
+DB_BUILD_INDEXES = os.getenv("DB_BUILD_INDEXES", "true").lower() == "true"
+# Check with explain() that the hot queries use an index once the build is done
+DB_CHECK_QUERY_PLANS = os.getenv("DB_CHECK_QUERY_PLANS", "true").lower() == "true"
+# Commands slower than this are logged with their query shape
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 100))
+# Distinct slow query shapes kept in the counters
+MAX_SLOW_SHAPES = 200
+
+# Indexes per collection. {"id", "userId"} lookups, lookups by id alone and
+# the per-user lists all use the same compound indexes through their prefixes;
+# (userId, timestamp, id) also serves the keyset-paginated listings in pagination.py.
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_1", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_1", unique=True),
+    ],
+    "extracted_texts": [
+        IndexModel([("id", ASCENDING), ("userId", ASCENDING)], name="id_1_userId_1"),
+        IndexModel([("userId", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                   name="userId_1_timestamp_-1_id_-1"),
+    ],
+    "evaluations": [
+        IndexModel([("id", ASCENDING), ("userId", ASCENDING)], name="id_1_userId_1"),
+        IndexModel([("userId", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                   name="userId_1_timestamp_-1_id_-1"),
+    ],
+    "question_papers": [
+        IndexModel([("id", ASCENDING), ("userId", ASCENDING)], name="id_1_userId_1"),
+        IndexModel([("userId", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                   name="userId_1_timestamp_-1_id_-1"),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_1", unique=True),
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)], name="userId_1_createdAt_-1"),
+        # Deletes finished jobs at their expiresAt (set by jobs.py when a job finishes)
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_1", expireAfterSeconds=0),
+    ],
+}
+
+# Query shapes served on every request, as (collection, filter); the values
+# are placeholders, only the fields matter to the query planner
+HOT_QUERIES = [
+    ("users", {"id": "?"}),
+    ("users", {"username": "?"}),
+    ("users", {"email": "?"}),
+    ("extracted_texts", {"id": "?", "userId": "?"}),
+    ("extracted_texts", {"id": "?"}),
+    ("extracted_texts", {"userId": "?"}),
+    ("evaluations", {"id": "?", "userId": "?"}),
+    ("evaluations", {"userId": "?"}),
+    ("question_papers", {"id": "?", "userId": "?"}),
+    ("question_papers", {"id": "?"}),
+    ("question_papers", {"userId": "?"}),
+    ("jobs", {"id": "?", "userId": "?"}),
+    ("jobs", {"id": "?"}),
+]
+
+
+def ensure_indexes(db):
+    """
+    Create the declared indexes that do not exist yet.
+
+    An index that cannot be built (for example a unique index over existing
+    duplicates, or a different index already using the name) is logged and
+    skipped; the other indexes are still built.
+
+    Args:
+        db (pymongo.database.Database): The application database
+
+    Returns:
+        dict: collection name -> list of index names now in place
+    """
+    built = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        built[collection_name] = []
+        for model in models:
+            name = model.document["name"]
+            try:
+                collection.create_indexes([model])
+                built[collection_name].append(name)
+            except errors.OperationFailure as e:
+                logger.error(f"Could not build index {collection_name}.{name}: {str(e)}")
+    return built
+
+
+def _plan_stages(plan):
+    """Yield every stage of an explain() plan tree."""
+    if not plan:
+        return
+    # Slot-based execution nests the classic plan under "queryPlan"
+    plan = plan.get("queryPlan", plan)
+    yield plan
+    for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        yield from _plan_stages(child)
+    for shard in plan.get("shards", []):
+        yield from _plan_stages(shard.get("winningPlan"))
+
+
+def explain_query(db, collection_name, query_filter):
+    """
+    Report how MongoDB would run a query.
+
+    Returns:
+        dict: collection, filter, indexes used and whether the plan scans
+        the whole collection
+    """
+    explanation = db[collection_name].find(query_filter).explain()
+    stages = list(_plan_stages(explanation.get("queryPlanner", {}).get("winningPlan")))
+    return {
+        "collection": collection_name,
+        "filter": sorted(query_filter),
+        "indexes": sorted({stage["indexName"] for stage in stages if stage.get("indexName")}),
+        "collection_scan": any(stage.get("stage") == "COLLSCAN" for stage in stages),
+    }
+
+
+def verify_query_plans(db):
+    """
+    Check that every hot query shape is served by an index.
+
+    Returns:
+        list: explain_query results for the shapes that scan a collection
+    """
+    scans = []
+    for collection_name, query_filter in HOT_QUERIES:
+        try:
+            result = explain_query(db, collection_name, query_filter)
+        except errors.PyMongoError as e:
+            logger.error(f"Could not explain {collection_name} query on {sorted(query_filter)}: {str(e)}")
+            continue
+        if result["collection_scan"]:
+            logger.warning(f"Query on {collection_name} by {result['filter']} scans the whole collection")
+            scans.append(result)
+        else:
+            logger.info(f"Query on {collection_name} by {result['filter']} uses {', '.join(result['indexes'])}")
+    return scans
+
+
+def start_index_build(db):
+    """
+    Build the declared indexes and check the hot query plans on a background thread.
+
+    Startup does not wait: MongoDB serves queries while indexes build, and
+    queries just use the indexes once they exist.
+
+    Returns:
+        threading.Thread or None: The build thread, or None if disabled
+    """
+    if not DB_BUILD_INDEXES:
+        return None
+
+    def build():
+        start = time.time()
+        try:
+            built = ensure_indexes(db)
+            logger.info(f"Indexes ready in {time.time() - start:.2f} seconds: "
+                        f"{sum(len(names) for names in built.values())} indexes on {len(built)} collections")
+            if DB_CHECK_QUERY_PLANS:
+                verify_query_plans(db)
+        except Exception as e:
+            logger.error(f"Index build failed: {str(e)}")
+
+    thread = threading.Thread(target=build, name="index-build", daemon=True)
+    thread.start()
+    return thread
+
+
+def query_shape(value):
+    """Replace the values in a filter with "?" but keep field names and operators."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists and the like: the length does not change the shape
+        return [query_shape(value[0])] if value and isinstance(value[0], dict) else "?"
+    return "?"
+
+
+def _command_filter(command_name, command):
+    """The filter document of a read or write command, if it has one."""
+    if command_name in ("find", "count", "delete", "update", "findAndModify", "distinct"):
+        if "filter" in command:
+            return command["filter"]
+        if "query" in command:
+            return command["query"]
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    if command_name == "aggregate":
+        for stage in command.get("pipeline", []):
+            if "$match" in stage:
+                return stage["$match"]
+    return None
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Log MongoDB commands slower than a threshold, grouped by query shape.
+
+    Register it when creating the client: MongoClient(..., event_listeners=[listener]).
+    """
+
+    def __init__(self, threshold_ms=None):
+        self.threshold_ms = DB_SLOW_QUERY_MS if threshold_ms is None else threshold_ms
+        self._started = {}
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        command_filter = _command_filter(event.command_name, event.command)
+        shape = None
+        if command_filter is not None:
+            collection = event.command.get(event.command_name)
+            shape = f"{event.database_name}.{collection} {event.command_name} {query_shape(command_filter)}"
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = shape
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        with self._lock:
+            shape = self._started.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if shape is None or duration_ms < self.threshold_ms:
+            return
+        logger.warning(f"Slow query ({duration_ms:.0f} ms): {shape}")
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                if len(self._shapes) >= MAX_SLOW_SHAPES:
+                    return
+                stats = self._shapes[shape] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+
+    def stats(self):
+        """
+        Return the slow query counters, slowest total first.
+
+        Returns:
+            list: {"shape", "count", "total_ms", "max_ms"} per query shape
+        """
+        with self._lock:
+            shapes = [dict(stats, shape=shape) for shape, stats in self._shapes.items()]
+        for stats in shapes:
+            stats["total_ms"] = round(stats["total_ms"], 1)
+            stats["max_ms"] = round(stats["max_ms"], 1)
+        return sorted(shapes, key=lambda stats: -stats["total_ms"])
+
+
+# Shared by the MongoClient in database.init_db and /api/metrics
+slow_query_listener = SlowQueryListener()
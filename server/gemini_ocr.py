@@ -1,5 +1,8 @@
 """
 Gemini OCR Module - Handles OCR processing using Google's Gemini API
+
+Requests go through llm_backend, so the offline fake backend can stand in
+for Gemini when benchmarking.
 """
 
 import os
@@ -7,20 +10,21 @@ import json
 import time
 import re
 import io
-import google.generativeai as genai
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from dotenv import load_dotenv
 from prompts import OCR_PROMPT
+from result_cache import ResultCache, make_key
+from pdf_utils import RenderedPage
+import image_prep
+import llm_backend
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is not set.")
-
-genai.configure(api_key=GEMINI_API_KEY)
+# Number of pages OCR'd concurrently by process_images (1 = sequential)
+OCR_MAX_WORKERS = int(os.environ.get("OCR_MAX_WORKERS", 4))
 
 generation_config = {
     "temperature": 0.2,
@@ -29,9 +33,30 @@ generation_config = {
     "max_output_tokens": 4096,
 }
 
-model = genai.GenerativeModel(
-    model_name="gemini-2.0-flash-thinking-exp-01-21",
-    generation_config=generation_config,
+GEMINI_MODEL_NAME = llm_backend.DEFAULT_MODEL_NAME
+
+# The API key is only needed once a request is made
+model = llm_backend.get_model(GEMINI_MODEL_NAME, generation_config)
+
+# Placeholder text for pages classified as blank, which are never sent to the model
+BLANK_PAGE_TEXT = "[Blank page]"
+
+# Page-level OCR cache. "exact" keys on the rendered pixels; "phash" keys on a
+# perceptual hash so that re-scans of the same page also hit. A perceptual
+# hash can also match a different page that looks alike at thumbnail size
+# (e.g. two students' pages on the same printed answer sheet), which would
+# serve one student another's text, so "phash" is only safe for re-runs of
+# the same scans and the hash is taken at PHASH_SIZE x PHASH_SIZE bits.
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_KEY_MODE = os.environ.get("OCR_CACHE_KEY_MODE", "exact")
+PHASH_SIZE = 32
+
+page_cache = ResultCache(
+    "ocr_pages",
+    path=os.environ.get("OCR_CACHE_PATH"),
+    max_entries=int(os.environ.get("OCR_CACHE_MAX_ENTRIES", 5000)),
+    max_bytes=int(os.environ.get("OCR_CACHE_MAX_MB", 200)) * 1024 * 1024,
+    ttl_seconds=int(os.environ.get("OCR_CACHE_TTL_DAYS", 30)) * 86400,
 )
 
 def safe_generate_content(prompt, retries=3, sleep_time=2):
@@ -60,18 +85,102 @@ def safe_generate_content(prompt, retries=3, sleep_time=2):
 
     return None
 
+def perceptual_hash(image, hash_size=PHASH_SIZE):
+    """
+    Compute a difference hash (dHash) of an image.
+    
+    The image is reduced to a small grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour, so changes in
+    scan noise, exposure or compression flip only a few bits. The default
+    size keeps handwriting in the thumbnail: pages that differ only in what
+    was written on the same printed sheet still get different hashes.
+    
+    Args:
+        image: PIL Image object
+        hash_size (int): Hash width/height in bits
+        
+    Returns:
+        str: Hex-encoded hash
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(thumbnail.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+def page_cache_key(image):
+    """
+    Build the OCR cache key for an image.
+    
+    Args:
+        image: RenderedPage, PIL Image object or path to an image file
+        
+    Returns:
+        str: Cache key combining the page content, the OCR prompt and the model
+    """
+    if OCR_CACHE_KEY_MODE == "phash":
+        if isinstance(image, RenderedPage):
+            with image.to_image() as img:
+                content = "phash:" + perceptual_hash(img)
+        elif isinstance(image, str):
+            with Image.open(image) as img:
+                content = "phash:" + perceptual_hash(img)
+        else:
+            content = "phash:" + perceptual_hash(image)
+    elif isinstance(image, RenderedPage):
+        content = image.data
+    elif isinstance(image, str):
+        with open(image, "rb") as img_file:
+            content = img_file.read()
+    else:
+        content = f"{image.mode}:{image.size}:".encode("utf-8") + image.tobytes()
+    return make_key(content, OCR_PROMPT, model.model_id)
+
+def get_cache_stats():
+    """Return hit/miss counters and size of the OCR page cache."""
+    stats = page_cache.stats()
+    stats["enabled"] = OCR_CACHE_ENABLED
+    stats["key_mode"] = OCR_CACHE_KEY_MODE
+    return stats
+
 def extract_text_from_image(image):
     """
     Extract text from an image using Gemini Vision API.
     
+    Results are served from the page cache when the same page has been
+    OCR'd before with the same prompt and model.
+    
     Args:
-        image: PIL Image object or path to an image file
+        image: RenderedPage, PIL Image object or path to an image file
         
     Returns:
         Extracted text as string
     """
-    # Handle both PIL Image objects and image paths
-    if isinstance(image, str):
+    # Born-digital pages already carry exact text; blank pages have none
+    if isinstance(image, RenderedPage) and image.text is not None:
+        return image.text
+    if _is_blank_page(image):
+        return BLANK_PAGE_TEXT
+    
+    cache_key = None
+    if OCR_CACHE_ENABLED:
+        cache_key = page_cache_key(image)
+        cached_text = page_cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
+    
+    mime_type = "image/png"
+    
+    # Handle rendered pages, PIL Image objects and image paths
+    if isinstance(image, RenderedPage):
+        # Already encoded by the renderer - upload the bytes as they are
+        img_data = image.data
+        mime_type = image.mime_type
+    elif isinstance(image, str):
         # If image is a file path
         with open(image, "rb") as img_file:
             img_data = img_file.read()
@@ -84,7 +193,7 @@ def extract_text_from_image(image):
     
     prompt = [
         OCR_PROMPT,
-        {"mime_type": "image/png", "data": img_data}
+        {"mime_type": mime_type, "data": img_data}
     ]
 
     text = safe_generate_content(prompt, retries=3, sleep_time=2)
@@ -92,6 +201,8 @@ def extract_text_from_image(image):
     if text is None:
         return "ERROR: Unable to process image after multiple retries."
     else:
+        if cache_key:
+            page_cache.set(cache_key, text)
         return text
 
 def process_image(image):
@@ -104,30 +215,111 @@ def process_image(image):
     Returns:
         Extracted text as string
     """
+    extracted_text, elapsed_time = _timed_ocr(image)
+    
+    print(f"Processed image in {elapsed_time} seconds.")
+    return extracted_text
+
+def _timed_ocr(image):
+    """Run OCR on one image and return (text, elapsed seconds)."""
     start_time = time.time()
     extracted_text = extract_text_from_image(image)
     end_time = time.time()
-    elapsed_time = round(end_time - start_time, 2)
+    return extracted_text, round(end_time - start_time, 2)
+
+def _is_blank_page(image):
+    """Whether an image is a page the renderer classified as blank (and has no text layer)."""
+    return isinstance(image, RenderedPage) and image.text is None and image.is_blank
+
+def _page_number(image, position):
+    """The document page number of an image: its own for a RenderedPage, else its 1-based position."""
+    return image.number if isinstance(image, RenderedPage) else position
+
+def iter_ocr_pages(images, max_workers=None):
+    """
+    OCR pages concurrently and yield the results in page order.
     
-    print(f"Processed image in {elapsed_time} seconds.")
-    return extracted_text
+    At most ``max_workers`` pages are in flight at once, so a lazy page
+    iterator is only consumed as fast as the worker pool drains it.
+    
+    Args:
+        images: Iterable of RenderedPage or PIL Image objects
+        max_workers (int, optional): Pool size, defaults to OCR_MAX_WORKERS.
+            A value of 1 processes pages sequentially with a pause between them.
+        
+    Yields:
+        tuple: (page_number, extracted_text, elapsed_seconds, is_blank); a
+        RenderedPage keeps its page number in the document, e.g. when
+        rendering started at first_page. is_blank is True for pages
+        classified as blank, whose text is BLANK_PAGE_TEXT.
+    """
+    max_workers = max(1, max_workers or OCR_MAX_WORKERS)
+    
+    if max_workers == 1:
+        for i, img in enumerate(images):
+            # Small pause to avoid rate limits (text-layer and blank pages make no request)
+            if i > 0 and not (isinstance(img, RenderedPage) and (img.text is not None or img.is_blank)):
+                time.sleep(1)
+            page_number = _page_number(img, i + 1)
+            is_blank = _is_blank_page(img)
+            page_text, elapsed_time = _timed_ocr(img)
+            del img
+            print(f"Processed page {page_number} in {elapsed_time} seconds.")
+            yield page_number, page_text, elapsed_time, is_blank
+        return
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr") as executor:
+        pending = deque()
+        try:
+            for i, img in enumerate(images):
+                pending.append((_page_number(img, i + 1), _is_blank_page(img), executor.submit(_timed_ocr, img)))
+                del img
+                # Keep the window bounded; yield the oldest page once it is full
+                if len(pending) >= max_workers:
+                    page_number, is_blank, future = pending.popleft()
+                    page_text, elapsed_time = future.result()
+                    print(f"Processed page {page_number} in {elapsed_time} seconds.")
+                    yield page_number, page_text, elapsed_time, is_blank
+            
+            while pending:
+                page_number, is_blank, future = pending.popleft()
+                page_text, elapsed_time = future.result()
+                print(f"Processed page {page_number} in {elapsed_time} seconds.")
+                yield page_number, page_text, elapsed_time, is_blank
+        finally:
+            # Don't start pages nobody will read if the consumer stops early
+            for _, _, future in pending:
+                future.cancel()
 
-def process_images(images):
+def process_images(images, max_workers=None, page_timings=None, on_page=None):
     """
     Process multiple images and combine their text.
     
     Args:
-        images: List of PIL Image objects
+        images: Iterable of RenderedPage or PIL Image objects (a list, or a
+            lazy page iterator such as pdf_utils.iter_pdf_pages)
+        max_workers (int, optional): Number of pages to OCR concurrently,
+            defaults to OCR_MAX_WORKERS
+        page_timings (list, optional): If given, a {"page", "seconds"} entry
+            is appended for every page processed
+        on_page (callable, optional): Called as on_page(page_number, page_text)
+            as each page completes, in page order
         
     Returns:
-        Combined extracted text as string
+        Combined extracted text as string. Blank pages appear as
+        BLANK_PAGE_TEXT, or not at all when BLANK_PAGE_ACTION is "skip".
     """
-    combined_text = ""
-    for i, img in enumerate(images):
-        page_text = process_image(img)
-        combined_text += f"\n\n--- Page {i+1} ---\n\n{page_text}"
-        # Small pause to avoid rate limits
-        if i < len(images) - 1:
-            time.sleep(1)
-    
-    return combined_text.strip()
+    start_time = time.time()
+    page_texts = []
+    for page_number, page_text, elapsed_time, is_blank in iter_ocr_pages(images, max_workers):
+        if page_timings is not None:
+            page_timings.append({"page": page_number, "seconds": elapsed_time})
+        if on_page is not None:
+            on_page(page_number, page_text)
+        if is_blank and image_prep.BLANK_PAGE_ACTION == "skip":
+            continue
+        page_texts.append(f"\n\n--- Page {page_number} ---\n\n{page_text}")
+    
+    total_time = round(time.time() - start_time, 2)
+    print(f"Processed {len(page_texts)} pages in {total_time} seconds.")
+    return "".join(page_texts).strip()
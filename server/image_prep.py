@@ -0,0 +1,336 @@
+"""
+Image Preparation Module - Shrinks rendered pages before they are sent for OCR
+
+Each PDF page is first rendered as a small preview. Cheap
+measurements on that preview (ink density, stroke width, ink bounding box,
+colour content) decide the resolution and colour space of the final render,
+how much blank margin to trim, and the encoder settings needed to stay under
+a per-page byte budget.
+"""
+
+import io
+import os
+import logging
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OCR_IMAGE_PREP = os.getenv("OCR_IMAGE_PREP", "true").lower() == "true"
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", 150))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", 300))
+OCR_IMAGE_FORMAT = os.getenv("OCR_IMAGE_FORMAT", "jpeg").lower()  # jpeg, webp or png
+OCR_IMAGE_BYTE_BUDGET = int(os.getenv("OCR_IMAGE_BYTE_BUDGET_KB", 350)) * 1024
+
+# Preview scale: 2 pixels per PDF point, so stroke widths are measured in half points
+PREVIEW_SCALE = 2.0
+# Gray level below which a preview pixel counts as ink
+INK_THRESHOLD = 160
+# Thinnest stroke we want in the final image, in pixels
+TARGET_STROKE_PX = 2.5
+# Fraction of ink pixels that must be clearly coloured to keep RGB
+COLOR_INK_FRACTION = 0.08
+# Padding kept around the ink bounding box, as a fraction of the page size
+TRIM_PADDING = 0.03
+
+# Blank page handling: "mark" keeps a placeholder for the page in the OCR
+# text, "skip" leaves it out entirely, "ocr" disables detection.
+BLANK_PAGE_ACTION = os.getenv("BLANK_PAGE_ACTION", "mark").lower()
+# Share of page tiles that carry ink, at or below which a page is blank / sparse
+BLANK_PAGE_MAX_COVERAGE = float(os.getenv("BLANK_PAGE_MAX_COVERAGE", 0.001))
+SPARSE_PAGE_MAX_COVERAGE = float(os.getenv("SPARSE_PAGE_MAX_COVERAGE", 0.03))
+# Share of a tile's pixels that must be ink for the tile to count
+TILE_INK_FRACTION = 0.02
+# Border ignored by the blank check (scanner edges, punch holes, page numbers)
+BLANK_CHECK_MARGIN = 0.05
+
+INK_BLANK = "blank"
+INK_SPARSE = "sparse"
+INK_CONTENT = "content"
+
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+_QUALITY_LADDER = (85, 75, 65, 55, 45)
+
+PageMetrics = namedtuple("PageMetrics", ["ink_density", "stroke_width_pt", "ink_bbox", "is_color",
+                                         "ink_coverage", "ink_class"])
+PreparedImage = namedtuple("PreparedImage", ["data", "mime_type", "width", "height", "dpi", "metrics"])
+
+
+def _run_lengths(mask):
+    """Lengths of consecutive True runs along each row of a boolean array."""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)
+    return ends[1] - starts[1]
+
+
+def to_gray(pixels):
+    """Convert an HxWxN uint8 array (N = 1, 3 or 4) to a 2-D grayscale array."""
+    if pixels.ndim == 2:
+        return pixels
+    if pixels.shape[2] < 3:
+        return pixels[..., 0]
+    # ITU-R 601 luma, computed in integers
+    wide = pixels[..., :3].astype(np.uint16)
+    return ((wide[..., 0] * 77 + wide[..., 1] * 150 + wide[..., 2] * 29) >> 8).astype(np.uint8)
+
+
+def classify_ink(gray, blank_max=None, sparse_max=None):
+    """
+    Classify a page as blank, sparse or content from its ink coverage.
+
+    The page interior is divided into roughly 100 tiles along the short side
+    and a tile counts as inked when enough of its pixels are dark. Counting
+    tiles rather than pixels keeps scan noise and dust, which spread a few
+    dark pixels everywhere, from being mistaken for writing.
+
+    Args:
+        gray (numpy.ndarray): 2-D uint8 array, 0 = black
+        blank_max (float, optional): Coverage at or below which the page is
+            blank, defaults to BLANK_PAGE_MAX_COVERAGE
+        sparse_max (float, optional): Coverage at or below which the page is
+            sparse, defaults to SPARSE_PAGE_MAX_COVERAGE
+
+    Returns:
+        tuple: (label, coverage) where label is INK_BLANK, INK_SPARSE or INK_CONTENT
+    """
+    blank_max = BLANK_PAGE_MAX_COVERAGE if blank_max is None else blank_max
+    sparse_max = SPARSE_PAGE_MAX_COVERAGE if sparse_max is None else sparse_max
+
+    height, width = gray.shape
+    margin_y = int(height * BLANK_CHECK_MARGIN)
+    margin_x = int(width * BLANK_CHECK_MARGIN)
+    interior = gray[margin_y:height - margin_y, margin_x:width - margin_x]
+
+    tile = max(4, min(interior.shape) // 100)
+    rows = interior.shape[0] // tile
+    cols = interior.shape[1] // tile
+    if not rows or not cols:
+        return INK_BLANK, 0.0
+
+    ink = interior[:rows * tile, :cols * tile] < INK_THRESHOLD
+    tile_ink = ink.reshape(rows, tile, cols, tile).mean(axis=(1, 3))
+    coverage = float((tile_ink > TILE_INK_FRACTION).mean())
+
+    if coverage <= blank_max:
+        return INK_BLANK, coverage
+    if coverage <= sparse_max:
+        return INK_SPARSE, coverage
+    return INK_CONTENT, coverage
+
+
+def classify_pixmap(pix):
+    """Classify a rendered PyMuPDF pixmap; see classify_ink."""
+    return classify_ink(to_gray(_pixmap_array(pix)))
+
+
+def blank_detection_enabled():
+    """Whether pages should be checked for being blank before OCR."""
+    return BLANK_PAGE_ACTION in ("mark", "skip")
+
+
+def measure(gray, scale=1.0, rgb=None):
+    """
+    Take cheap content measurements from a grayscale page preview.
+
+    Args:
+        gray (numpy.ndarray): 2-D uint8 array, 0 = black
+        scale (float): Preview pixels per PDF point (or per output pixel for images)
+        rgb (numpy.ndarray, optional): Matching HxWx3 array used to detect colour ink
+
+    Returns:
+        PageMetrics: ink density (0-1), median stroke width in points, ink
+        bounding box as (x0, y0, x1, y1) fractions of the page or None,
+        whether the ink is noticeably coloured, and the classify_ink result
+    """
+    ink = gray < INK_THRESHOLD
+    ink_pixels = int(ink.sum())
+    ink_density = ink_pixels / ink.size if ink.size else 0.0
+
+    if ink_pixels == 0:
+        return PageMetrics(0.0, 0.0, None, False, 0.0, INK_BLANK)
+
+    ink_class, ink_coverage = classify_ink(gray)
+
+    # Strokes show up as short runs across rows and columns; long runs are
+    # ruled lines or filled areas and are ignored.
+    runs = np.concatenate((_run_lengths(ink), _run_lengths(ink.T)))
+    runs = runs[runs <= 12 * scale]
+    stroke_width_pt = float(np.median(runs)) / scale if runs.size else 1.0
+
+    # Ignore isolated specks when finding the bounding box
+    rows = np.nonzero(ink.sum(axis=1) >= 2)[0]
+    cols = np.nonzero(ink.sum(axis=0) >= 2)[0]
+    ink_bbox = None
+    if rows.size and cols.size:
+        height, width = gray.shape
+        ink_bbox = (
+            float(cols[0] / width),
+            float(rows[0] / height),
+            float((cols[-1] + 1) / width),
+            float((rows[-1] + 1) / height),
+        )
+
+    is_color = False
+    if rgb is not None:
+        chroma = rgb.max(axis=2).astype(np.int16) - rgb.min(axis=2)
+        is_color = float((chroma[ink] > 60).mean()) >= COLOR_INK_FRACTION
+
+    return PageMetrics(ink_density, stroke_width_pt, ink_bbox, is_color, ink_coverage, ink_class)
+
+
+def choose_dpi(metrics):
+    """
+    Pick the lowest resolution at which the thinnest strokes stay legible.
+
+    The result uses the same convention as pdf_utils (scale = dpi / 96).
+    """
+    if not metrics.stroke_width_pt:
+        return OCR_MIN_DPI
+    dpi = 96 * TARGET_STROKE_PX / metrics.stroke_width_pt
+    # Dense pages (small handwriting) get a little more resolution
+    if metrics.ink_density > 0.08:
+        dpi *= 1.2
+    return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, dpi)))
+
+
+def encode_under_budget(img, fmt=None, budget=None):
+    """
+    Encode an image in a compact format, lowering quality and then size until it fits.
+
+    Args:
+        img (PIL.Image.Image): Image to encode
+        fmt (str, optional): "jpeg", "webp" or "png", defaults to OCR_IMAGE_FORMAT
+        budget (int, optional): Byte budget, defaults to OCR_IMAGE_BYTE_BUDGET
+
+    Returns:
+        tuple: (data, mime_type, width, height)
+    """
+    fmt = fmt or OCR_IMAGE_FORMAT
+    budget = budget or OCR_IMAGE_BYTE_BUDGET
+    if fmt not in _MIME_TYPES:
+        logger.warning(f"Unknown OCR image format '{fmt}', using jpeg")
+        fmt = "jpeg"
+
+    data = None
+    while True:
+        qualities = (None,) if fmt == "png" else _QUALITY_LADDER
+        for quality in qualities:
+            buffer = io.BytesIO()
+            if fmt == "png":
+                img.save(buffer, format="PNG", optimize=True)
+            elif fmt == "webp":
+                img.save(buffer, format="WEBP", quality=quality, method=4)
+            else:
+                img.save(buffer, format="JPEG", quality=quality, optimize=True)
+            data = buffer.getvalue()
+            if len(data) <= budget:
+                return data, _MIME_TYPES[fmt], img.width, img.height
+
+        # Still too large at the lowest quality: shrink and try again
+        if min(img.size) < 800:
+            logger.warning(f"Page image is {len(data) // 1024} KB, over the {budget // 1024} KB budget")
+            return data, _MIME_TYPES[fmt], img.width, img.height
+        img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+
+
+def _trim_rect(page_rect, ink_bbox):
+    """Map a fractional ink bounding box to a padded clip rectangle on the page."""
+    if not ink_bbox:
+        return page_rect
+    x0, y0, x1, y1 = ink_bbox
+    clip = fitz.Rect(
+        page_rect.x0 + max(0.0, x0 - TRIM_PADDING) * page_rect.width,
+        page_rect.y0 + max(0.0, y0 - TRIM_PADDING) * page_rect.height,
+        page_rect.x0 + min(1.0, x1 + TRIM_PADDING) * page_rect.width,
+        page_rect.y0 + min(1.0, y1 + TRIM_PADDING) * page_rect.height,
+    )
+    return clip
+
+
+def _pixmap_array(pix):
+    """View a pixmap's samples as an HxWxN uint8 array without copying."""
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def preview_page(page):
+    """
+    Render a small RGB preview of a PDF page and measure it.
+
+    Args:
+        page (fitz.Page): Page to preview
+
+    Returns:
+        PageMetrics
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(PREVIEW_SCALE, PREVIEW_SCALE), colorspace=fitz.csRGB)
+    rgb = _pixmap_array(pix)
+    return measure(to_gray(rgb), PREVIEW_SCALE, rgb)
+
+
+def prepare_pdf_page(page, metrics=None):
+    """
+    Render a PDF page at an adaptive resolution and encode it compactly for OCR.
+
+    Args:
+        page (fitz.Page): Page to render
+        metrics (PageMetrics, optional): Measurements from preview_page, taken
+            here if not given
+
+    Returns:
+        PreparedImage
+    """
+    if metrics is None:
+        metrics = preview_page(page)
+    dpi = choose_dpi(metrics)
+    colorspace = fitz.csRGB if metrics.is_color else fitz.csGRAY
+    clip = _trim_rect(page.rect, metrics.ink_bbox)
+
+    scale = dpi / 96
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=colorspace, clip=clip)
+    mode = "RGB" if pix.n == 3 else "L"
+    img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples, "raw", mode, 0, 1)
+    data, mime_type, width, height = encode_under_budget(img)
+    return PreparedImage(data, mime_type, width, height, dpi, metrics)
+
+
+def prepare_image(img):
+    """
+    Trim, convert and compactly encode an uploaded image for OCR.
+
+    Uploaded images have a fixed resolution, so only the colour space, the
+    margins and the encoding are adapted.
+
+    Args:
+        img (PIL.Image.Image): Image to prepare
+
+    Returns:
+        PreparedImage
+    """
+    rgb_img = img.convert("RGB")
+    # Measure on a reduced copy; strokes are then in preview pixels
+    preview = rgb_img.copy()
+    preview.thumbnail((1200, 1200))
+    rgb = np.asarray(preview)
+    gray = np.asarray(preview.convert("L"))
+    metrics = measure(gray, 1.0, rgb)
+
+    if metrics.ink_bbox:
+        x0, y0, x1, y1 = metrics.ink_bbox
+        box = (
+            int(max(0.0, x0 - TRIM_PADDING) * img.width),
+            int(max(0.0, y0 - TRIM_PADDING) * img.height),
+            int(min(1.0, x1 + TRIM_PADDING) * img.width),
+            int(min(1.0, y1 + TRIM_PADDING) * img.height),
+        )
+        rgb_img = rgb_img.crop(box)
+
+    final = rgb_img if metrics.is_color else rgb_img.convert("L")
+    data, mime_type, width, height = encode_under_budget(final)
+    return PreparedImage(data, mime_type, width, height, None, metrics)
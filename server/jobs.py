@@ -0,0 +1,330 @@
+"""
+Background Jobs Module - Runs long OCR, mapping and evaluation work outside the request worker
+
+A job is submitted with a runner function and returns immediately with a job
+ID. The runner executes on a small in-process thread pool and reports
+progress through a JobProgress object. Job state lives in the MongoDB
+``jobs`` collection, so any worker process can answer a status query.
+
+Besides the progress counters, each job keeps a list of the last
+JOB_MAX_EVENTS events (a page OCR'd, a question mapped, a question
+evaluated) that :func:`iter_events` replays and tails for the server-sent
+events stream. Events carry page and question numbers, counts and scores
+only; the text is in the job's result. Finished jobs are deleted by a TTL
+index JOB_RETENTION_DAYS after they finish.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+
+import database
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# A running job that has not reported progress for this long is considered dead
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+# A queued job that no worker has started this long after it was submitted is
+# considered lost (its worker process died); waiting behind a long queue is not
+JOB_QUEUE_TIMEOUT_SECONDS = int(os.getenv("JOB_QUEUE_TIMEOUT_SECONDS", 3600))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "uploads"))
+# How often an event stream checks MongoDB for new events
+JOB_EVENT_POLL_SECONDS = float(os.getenv("JOB_EVENT_POLL_SECONDS", 0.5))
+# Send a keep-alive comment after this long without events so proxies keep the stream open
+JOB_EVENT_HEARTBEAT_SECONDS = 15
+# Events kept per job; older ones are dropped, so a job document stays small
+JOB_MAX_EVENTS = int(os.getenv("JOB_MAX_EVENTS", 500))
+# Finished jobs are deleted this long after they finish (TTL index on expiresAt)
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", 7))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def _expires_at():
+    """Deletion time of a job finishing now; a BSON date, as TTL indexes require."""
+    return datetime.utcnow() + timedelta(days=JOB_RETENTION_DAYS)
+
+
+class JobProgress:
+    """
+    Progress reporter handed to job runners.
+
+    Every update is written through to the job document, so a status query
+    served by another worker sees it straight away. The page, mapping and
+    question callbacks also append an event saying which part is done.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        """Set progress fields, e.g. update(stage="ocr", pages_total=12)."""
+        self._write({f"progress.{key}": value for key, value in fields.items()})
+
+    def emit(self, event_type, progress=None, **data):
+        """
+        Append an event to the job and optionally update progress with it.
+
+        Args:
+            event_type (str): Event name, e.g. "page" or "question"
+            progress (dict, optional): Progress fields to set in the same write
+            **data: Event payload
+        """
+        with self._lock:
+            # Events are numbered in the order they were emitted; the number
+            # doubles as the SSE event ID a client resumes from
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, "time": _now(), "data": data}
+            changes = {f"progress.{key}": value for key, value in (progress or {}).items()}
+            self._write(changes, push=event)
+
+    def _write(self, changes, push=None):
+        changes["updatedAt"] = _now()
+        update = {"$set": changes}
+        if push is not None:
+            update["$push"] = {"events": {"$each": [push], "$slice": -JOB_MAX_EVENTS}}
+        try:
+            database.jobs_collection.update_one({"id": self.job_id}, update)
+        except Exception as e:
+            # Progress is best effort; never fail the job because of it
+            logger.error(f"Failed to update progress for job {self.job_id}: {str(e)}")
+
+    def page_done(self, page_number, page_text, page_total):
+        """Callback with the signature expected by ocr.process_file."""
+        self.emit("page", {"stage": "ocr", "pages_done": page_number, "pages_total": page_total},
+                  page=page_number, total=page_total, chars=len(page_text or ""))
+
+    def mapping_done(self, item):
+        """Callback with the signature expected by mapper.map_answers."""
+        self.emit("mapping", {"stage": "mapping"}, question=item.get("questionNumber"),
+                  mappedBy=item.get("mappedBy"), confidence=item.get("confidence"))
+
+    def question_done(self, question_num, score, consensus_text, done, total):
+        """Callback with the signature expected by agentic.multi_agent_evaluate_answers."""
+        self.emit("question", {"stage": "evaluation", "questions_done": done, "questions_total": total},
+                  question=question_num, score=score, done=done, total=total)
+
+
+def save_upload(file):
+    """
+    Save an uploaded file where a background job can read it.
+
+    Args:
+        file (werkzeug.datastructures.FileStorage): The uploaded file
+
+    Returns:
+        str: Path of the saved file
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{secure_filename(file.filename) or 'upload'}")
+    file.save(path)
+    return path
+
+
+def _public_view(job):
+    """Strip MongoDB internals and the event log from a job document."""
+    job = dict(job)
+    job.pop("_id", None)
+    job.pop("events", None)
+    return job
+
+
+def submit(job_type, user_id, runner, *args, cleanup_paths=()):
+    """
+    Create a job and start it in the background.
+
+    Args:
+        job_type (str): Name of the pipeline, e.g. "process-file"
+        user_id (str): Owner of the job
+        runner (callable): Called as runner(progress, *args) and must return
+            (result, status_code), the payload and HTTP status that the
+            matching synchronous endpoint would have returned
+        *args: Extra arguments for the runner
+        cleanup_paths (iterable): Files to delete once the job has finished
+
+    Returns:
+        dict: The new job document
+    """
+    job_id = str(uuid.uuid4())
+    job = {
+        "id": job_id,
+        "type": job_type,
+        "userId": user_id,
+        "status": QUEUED,
+        "progress": {"stage": QUEUED},
+        "result": None,
+        "error": None,
+        "events": [],
+        "createdAt": _now(),
+        "updatedAt": _now(),
+    }
+    database.jobs_collection.insert_one(job)
+    _get_executor().submit(_run, job_id, runner, args, tuple(cleanup_paths))
+    logger.info(f"Submitted {job_type} job {job_id} for user {user_id}")
+    return _public_view(job)
+
+
+def _run(job_id, runner, args, cleanup_paths):
+    jobs = database.jobs_collection
+    progress = JobProgress(job_id)
+    # Only a job still queued starts; one expired while waiting for a worker stays failed
+    started = jobs.update_one(
+        {"id": job_id, "status": QUEUED},
+        {"$set": {"status": RUNNING, "startedAt": _now(), "updatedAt": _now(), "progress.stage": RUNNING}}
+    )
+    if started.matched_count == 0:
+        logger.warning(f"Job {job_id} is no longer queued, not running it")
+        for path in cleanup_paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+        return
+    try:
+        result, status_code = runner(progress, *args)
+        if status_code >= 400:
+            error = result.get("error") or result.get("message") or f"Job failed with status {status_code}"
+            update = {"status": FAILED, "error": error, "result": result}
+        else:
+            update = {"status": SUCCEEDED, "result": result}
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}\n{traceback.format_exc()}")
+        update = {"status": FAILED, "error": str(e)}
+    finally:
+        for path in cleanup_paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    update.update({"finishedAt": _now(), "updatedAt": _now(), "expiresAt": _expires_at(),
+                   "progress.stage": update["status"]})
+    # A job expired as stale while it ran keeps its failed status and error
+    finished = jobs.update_one({"id": job_id, "status": RUNNING}, {"$set": update})
+    if finished.matched_count == 0:
+        logger.warning(f"Job {job_id} finished with status {update['status']} after it was marked as abandoned")
+        return
+    logger.info(f"Job {job_id} finished with status {update['status']}")
+
+
+def get_job(job_id, user_id):
+    """
+    Look up a job owned by a user.
+
+    Running jobs that have stopped reporting progress (for example because
+    their worker process was restarted) are marked as failed.
+
+    Args:
+        job_id (str): The job ID
+        user_id (str): The requesting user's ID
+
+    Returns:
+        dict or None: The job document, or None if not found
+    """
+    job = database.jobs_collection.find_one({"id": job_id, "userId": user_id},
+                                            {"_id": 0, "events": 0, "expiresAt": 0})
+    if not job:
+        return None
+    _expire_if_stale(job)
+    return job
+
+
+def _expire_if_stale(job):
+    """
+    Mark a job that is no longer being worked on as failed, in place.
+
+    A running job reports progress as it goes, so one silent for
+    JOB_STALE_SECONDS has lost its worker. A queued job reports nothing while
+    it waits for a free worker, so it is only given up on
+    JOB_QUEUE_TIMEOUT_SECONDS after it was created.
+    """
+    if job["status"] == RUNNING:
+        stale = datetime.now() - datetime.fromisoformat(job["updatedAt"]) > timedelta(seconds=JOB_STALE_SECONDS)
+        error = "Job stopped reporting progress and was abandoned"
+    elif job["status"] == QUEUED:
+        created = datetime.fromisoformat(job.get("createdAt", job["updatedAt"]))
+        stale = datetime.now() - created > timedelta(seconds=JOB_QUEUE_TIMEOUT_SECONDS)
+        error = "Job was never started and was abandoned"
+    else:
+        stale = False
+    if stale:
+        database.jobs_collection.update_one(
+            {"id": job["id"], "status": job["status"]},
+            {"$set": {"status": FAILED, "error": error, "finishedAt": _now(), "expiresAt": _expires_at()}}
+        )
+        job.update({"status": FAILED, "error": error})
+
+
+def iter_events(job_id, user_id, after=0):
+    """
+    Replay a job's events and follow new ones until the job finishes.
+
+    Events are read from MongoDB, so the stream can be served by a different
+    worker from the one running the job.
+
+    Args:
+        job_id (str): The job ID
+        user_id (str): The requesting user's ID
+        after (int): Only yield events with a higher sequence number, e.g. the
+            Last-Event-ID of a reconnecting client. Events older than the
+            last JOB_MAX_EVENTS are no longer stored and are not replayed.
+
+    Yields:
+        dict or None: Events in order, then a final "end" event carrying the
+        job status and result. None is yielded when nothing happened for
+        JOB_EVENT_HEARTBEAT_SECONDS, so the caller can send a keep-alive.
+    """
+    # The event list is capped, so positions shift as old events are
+    # dropped; read the (small) list and skip the events already seen by seq
+    last_event_at = time.monotonic()
+    while True:
+        job = database.jobs_collection.find_one({"id": job_id, "userId": user_id}, {"_id": 0, "expiresAt": 0})
+        if not job:
+            return
+
+        events = [event for event in job.pop("events", []) if event["seq"] > after]
+        for event in events:
+            after = event["seq"]
+            yield event
+        if events:
+            last_event_at = time.monotonic()
+
+        _expire_if_stale(job)
+        if job["status"] in FINISHED_STATES:
+            yield {
+                "seq": after + 1,
+                "type": "end",
+                "time": job.get("finishedAt"),
+                "data": {"status": job["status"], "error": job.get("error"), "result": job.get("result")},
+            }
+            return
+
+        if time.monotonic() - last_event_at >= JOB_EVENT_HEARTBEAT_SECONDS:
+            last_event_at = time.monotonic()
+            yield None
+        time.sleep(JOB_EVENT_POLL_SECONDS)
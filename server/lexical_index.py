@@ -0,0 +1,201 @@
+"""
+Lexical Index Module - In-process BM25 retrieval over answer sheet segments
+
+Answer sheets without numbered answers can still be matched to questions by
+the words they share. The OCR text is cut into paragraph segments, indexed
+with BM25, and each question is scored against the index to give the
+segments most likely to hold its answer. The candidates can be used as the
+answer directly or sent to the model in place of the whole text.
+"""
+
+import re
+import math
+import logging
+from collections import Counter, defaultdict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Paragraphs longer than this many words are split at line breaks
+SEGMENT_MAX_WORDS = 120
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+PAGE_MARKER_PATTERN = re.compile(r"^--- Page \d+ ---[ \t]*$", re.MULTILINE)
+STOPWORDS = frozenset("""
+a an and are as at be by can do does each for from has have how in is it its
+of on or that the their this to was were what when where which why will with
+explain describe discuss define write short note notes briefly example examples
+give list state marks question answer
+""".split())
+
+Segment = namedtuple("Segment", ["start", "end", "text"])
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text, without stopwords and single characters."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def segment_text(text, max_words=SEGMENT_MAX_WORDS):
+    """
+    Cut answer text into paragraph segments.
+
+    Paragraphs are separated by blank lines and page markers; a paragraph of
+    more than ``max_words`` words is split further at line breaks.
+
+    Args:
+        text (str): OCR text of an answer sheet
+        max_words (int): Largest segment size before it is split
+
+    Returns:
+        list: Segment tuples (start offset, end offset, text) in text order
+    """
+    segments = []
+    for paragraph in re.finditer(r"(?:[^\n]|\n(?![ \t]*\n))+", text):
+        if PAGE_MARKER_PATTERN.fullmatch(paragraph.group().strip()):
+            continue
+        start = paragraph.start()
+        words = 0
+        for line in re.finditer(r"[^\n]*\n?", paragraph.group()):
+            if not line.group():
+                break
+            if PAGE_MARKER_PATTERN.fullmatch(line.group().strip()):
+                # A page marker inside a paragraph ends it
+                _append_segment(segments, text, start, paragraph.start() + line.start())
+                start = paragraph.start() + line.end()
+                words = 0
+                continue
+            words += len(line.group().split())
+            if words >= max_words:
+                _append_segment(segments, text, start, paragraph.start() + line.end())
+                start = paragraph.start() + line.end()
+                words = 0
+        _append_segment(segments, text, start, paragraph.end())
+    return segments
+
+
+def _append_segment(segments, text, start, end):
+    if text[start:end].strip():
+        segments.append(Segment(start, end, text[start:end].strip()))
+
+
+class BM25Index:
+    """
+    BM25 index over a list of text segments.
+
+    Only the segments containing a query term are scored, through an
+    inverted index of term -> [(segment, term frequency)].
+    """
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for position, segment in enumerate(segments):
+            counts = Counter(tokenize(segment.text))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((position, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def _idf(self, term):
+        matching = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.segments) - matching + 0.5) / (matching + 0.5))
+
+    def score(self, query):
+        """
+        Score the segments against a query.
+
+        Args:
+            query (str): Query text, e.g. a question
+
+        Returns:
+            dict: segment position -> BM25 score, for segments sharing a term with the query
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for position, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / (self.average_length or 1))
+                scores[position] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def top(self, query, k=3):
+        """
+        Return the ``k`` best segments for a query.
+
+        Returns:
+            list: (segment position, score) pairs, best first
+        """
+        scores = self.score(query)
+        return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+
+
+def candidate_segments(questions, answer_text, top_k=3, index=None):
+    """
+    Find the answer segments most likely to answer each question.
+
+    Args:
+        questions (list): Question dictionaries with "id" and "text", as
+            returned by extract_questions_from_markdown
+        answer_text (str): OCR text of the answer sheet
+        top_k (int): Candidates returned per question
+        index (BM25Index, optional): A prebuilt index over answer_text
+
+    Returns:
+        dict: question id -> list of {"segment", "start", "end", "score", "text"}, best first
+    """
+    if index is None:
+        index = BM25Index(segment_text(answer_text))
+    candidates = {}
+    for position, question in enumerate(questions):
+        key = str(question.get("id", position + 1))
+        candidates[key] = [
+            {
+                "segment": segment,
+                "start": index.segments[segment].start,
+                "end": index.segments[segment].end,
+                "score": round(score, 3),
+                "text": index.segments[segment].text,
+            }
+            for segment, score in index.top(question.get("text", ""), top_k)
+        ]
+    return candidates
+
+
+def narrow_text(questions, answer_text, top_k=3, context=1):
+    """
+    Keep only the parts of an answer text that are candidates for some question.
+
+    Each question's top candidates are kept together with ``context``
+    neighbouring segments on either side, since an answer often runs on
+    past the paragraph that names its topic. Kept segments stay in text order.
+
+    Args:
+        questions (list): Question dictionaries with "id" and "text"
+        answer_text (str): OCR text of the answer sheet
+        top_k (int): Candidates kept per question
+        context (int): Neighbouring segments kept around each candidate
+
+    Returns:
+        str: The narrowed text, or the whole text if no segment matched any question
+    """
+    index = BM25Index(segment_text(answer_text))
+    keep = set()
+    for candidates in candidate_segments(questions, answer_text, top_k, index).values():
+        for candidate in candidates:
+            low = max(0, candidate["segment"] - context)
+            high = min(len(index.segments) - 1, candidate["segment"] + context)
+            keep.update(range(low, high + 1))
+    if not keep:
+        return answer_text
+    narrowed = "\n\n".join(index.segments[position].text for position in sorted(keep))
+    logger.info(f"Lexical index kept {len(keep)} of {len(index.segments)} segments "
+                f"({len(narrowed)} of {len(answer_text)} chars)")
+    return narrowed
@@ -0,0 +1,624 @@
+"""
+LLM Backend Module - Pluggable model backends shared by OCR, mapping and evaluation
+
+gemini_ocr, mapper and agentic never talk to google.generativeai directly.
+They hold a Model from :func:`get_model` and call ``generate_content`` on it.
+The call is routed to the active backend when it is made, so the backend can be
+swapped at any time, including after those modules have been imported:
+
+- ``gemini``: the real Gemini API (default)
+- ``fake``: an offline stand-in returning plausible OCR text, mapping JSON and
+  evaluation markdown. Its latency, error rate and throughput limits are
+  configurable, so capacity tests run without a network and give repeatable
+  numbers.
+
+Select the backend with ``LLM_BACKEND`` or :func:`set_backend`.
+
+Work with a time limit runs inside :func:`deadline`. Every model call made
+under it checks the deadline first, passes the time left to the backend as
+the request timeout, and retries made with :func:`backoff_sleep` are given up
+once they could not finish in time, so work that has timed out stops
+spending on model calls.
+"""
+
+import os
+import re
+import contextlib
+import contextvars
+import functools
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+DEFAULT_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash-thinking-exp-01-21")
+
+
+class LLMResponse:
+    """Minimal stand-in for a Gemini response: the generated text in ``.text``."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a model call or retry would run past the current deadline."""
+
+
+# Absolute time.monotonic() deadline of the current work, if any
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds=None, at=None):
+    """
+    Run a block with a deadline for the model calls made in it.
+
+    A nested deadline never extends an outer one.
+
+    Args:
+        seconds (float, optional): Time allowed from now
+        at (float, optional): Absolute time.monotonic() deadline instead
+
+    Yields:
+        float: The effective absolute deadline
+    """
+    new_deadline = at if at is not None else time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(new_deadline, current)
+    token = _deadline.set(new_deadline)
+    try:
+        yield new_deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Seconds left before the current deadline, or None without a deadline."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+
+
+def backoff_sleep(seconds):
+    """
+    Wait before a retry, or give up if the retry would start past the deadline.
+
+    Raises:
+        DeadlineExceeded: If less than ``seconds`` are left
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= seconds:
+        raise DeadlineExceeded(f"No time left for a retry ({max(remaining, 0):.1f} seconds remaining)")
+    time.sleep(seconds)
+
+
+def propagate_deadline(func):
+    """
+    Wrap a function to run under the caller's deadline.
+
+    Threads do not inherit the deadline, so wrap work handed to an executor
+    with this.
+    """
+    current = _deadline.get()
+    if current is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with deadline(at=current):
+            return func(*args, **kwargs)
+    return run
+
+
+def _chunks_until_deadline(chunks):
+    for chunk in chunks:
+        check_deadline()
+        yield chunk
+
+
+class GeminiBackend:
+    """Sends requests to the Gemini API through google.generativeai."""
+
+    name = "gemini"
+
+    def __init__(self):
+        self._models = {}
+        self._configured = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def api_key():
+        return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+    def is_configured(self):
+        return bool(self.api_key())
+
+    def _model(self, model_name, generation_config):
+        key = (model_name, json.dumps(generation_config, sort_keys=True))
+        with self._lock:
+            if not self._configured:
+                api_key = self.api_key()
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable is not set.")
+                genai.configure(api_key=api_key)
+                self._configured = True
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+                logger.info(f"Gemini model initialized: {model_name}")
+            return self._models[key]
+
+    def generate_content(self, prompt, model_name, generation_config=None, stream=False, timeout=None):
+        request_options = {"timeout": timeout} if timeout is not None else None
+        return self._model(model_name, generation_config).generate_content(
+            prompt, stream=stream, request_options=request_options)
+
+    def model_id(self, model_name):
+        return model_name
+
+
+class FakeLLMError(Exception):
+    """An injected failure from the fake backend."""
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampling function.
+
+    Args:
+        spec (str): One of ``fixed:MS``, ``uniform:LOW_MS,HIGH_MS``,
+            ``normal:MEAN_MS,SD_MS`` or ``lognormal:MEDIAN_MS,SIGMA``
+
+    Returns:
+        callable: Takes a random.Random and returns a latency in seconds
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(",") if v.strip()]
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0] / 1000
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(values[0], values[1]) / 1000
+        if kind == "normal" and len(values) == 2:
+            return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+        if kind == "lognormal" and len(values) == 2:
+            mu = math.log(values[0])
+            return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+_WORDS = (
+    "class object method inheritance encapsulation polymorphism interface abstraction "
+    "constructor instance attribute overriding overloading module function variable "
+    "data structure algorithm memory reference value return loop condition example "
+    "because therefore which allows the a of to is and in that this for with"
+).split()
+
+
+class FakeBackend:
+    """
+    Offline stand-in that imitates the Gemini API's shape and timing.
+
+    The response depends on the kind of prompt: OCR requests (an image part)
+    get answer-sheet text, mapping prompts get a JSON array built from the
+    questions and answers in the prompt, evaluator prompts get a proposed
+    grade and consensus prompts get a scored report.
+
+    Responses, latencies and injected errors are drawn from a random source
+    seeded with the seed, the prompt and the attempt number. Reruns therefore
+    give the same results regardless of thread scheduling, while a retry of
+    a failed prompt can still succeed.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency="lognormal:800,0.4", ms_per_token=0.0, error_rate=0.0,
+                 requests_per_minute=0, max_concurrency=0, seed=0):
+        """
+        Args:
+            latency (str): Base latency distribution, see parse_latency
+            ms_per_token (float): Extra latency per generated token (~4 characters)
+            error_rate (float): Probability that a call raises FakeLLMError
+            requests_per_minute (int): Quota; calls over it fail like a 429 (0 = unlimited)
+            max_concurrency (int): Calls served at once; the rest wait (0 = unlimited)
+            seed (int): Seed for responses, latencies and errors
+        """
+        self.latency = latency
+        self._sample_latency = parse_latency(latency)
+        self.ms_per_token = ms_per_token
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.seed = seed
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self._window = []
+        self.reset_stats()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=os.getenv("FAKE_LLM_LATENCY", "lognormal:800,0.4"),
+            ms_per_token=float(os.getenv("FAKE_LLM_MS_PER_TOKEN", 0)),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", 0)),
+            requests_per_minute=int(os.getenv("FAKE_LLM_RPM", 0)),
+            max_concurrency=int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", 0)),
+            seed=int(os.getenv("FAKE_LLM_SEED", 0)),
+        )
+
+    def is_configured(self):
+        return True
+
+    def model_id(self, model_name):
+        # Keeps fake results out of cache entries written by the real model
+        return f"fake:{model_name}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.throttled = 0
+            self.timed_out = 0
+            self.prompt_tokens = 0
+            self.response_tokens = 0
+            self.in_flight = 0
+            self.peak_in_flight = 0
+            self.latencies = []
+            self._attempts.clear()
+            self._window = []
+
+    def stats(self):
+        """
+        Return call counters and latency percentiles since the last reset.
+
+        Returns:
+            dict: calls, errors, throttled, timed_out, prompt_tokens,
+            response_tokens, peak_in_flight, p50_ms, p95_ms. Token counts are
+            estimates.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "timed_out": self.timed_out,
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "peak_in_flight": self.peak_in_flight,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+    def generate_content(self, prompt, model_name, generation_config=None, stream=False, timeout=None):
+        digest = _prompt_digest(prompt)
+        with self._lock:
+            self.calls += 1
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+            over_quota = self._over_quota()
+        rng = random.Random(f"{self.seed}:{digest}:{attempt}")
+
+        if over_quota:
+            with self._lock:
+                self.throttled += 1
+            raise FakeLLMError("429 Resource has been exhausted (e.g. check quota).")
+
+        if self._slots:
+            self._slots.acquire()
+        try:
+            with self._lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            text = _fake_response(prompt, rng)
+            delay = self._sample_latency(rng) + self.ms_per_token * (len(text) / 4) / 1000
+            fail = rng.random() < self.error_rate
+            timed_out = timeout is not None and delay > timeout
+            if timed_out:
+                # The client gives up at its timeout, like a real request
+                delay = max(timeout, 0)
+            time.sleep(delay)
+            with self._lock:
+                self.latencies.append(delay)
+                if timed_out:
+                    self.timed_out += 1
+                self.prompt_tokens += estimate_tokens(prompt)
+                if fail:
+                    self.errors += 1
+                else:
+                    self.response_tokens += estimate_tokens(text)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self._slots:
+                self._slots.release()
+
+        if timed_out:
+            raise DeadlineExceeded("504 Deadline Exceeded")
+        if fail:
+            raise FakeLLMError("500 An internal error has occurred.")
+        if stream:
+            return _stream_chunks(text)
+        return LLMResponse(text)
+
+    def _over_quota(self):
+        """Sliding one-minute request window; call with the lock held."""
+        if not self.requests_per_minute:
+            return False
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 60]
+        if len(self._window) >= self.requests_per_minute:
+            return True
+        self._window.append(now)
+        return False
+
+
+def estimate_tokens(prompt):
+    """
+    Rough token count of a prompt or response: ~4 characters per token, and
+    258 tokens per image part, which is what Gemini charges for an image.
+    """
+    parts = prompt if isinstance(prompt, (list, tuple)) else [prompt]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, dict):
+            tokens += 258
+        else:
+            tokens += len(str(part)) // 4
+    return tokens
+
+
+def _stream_chunks(text, chunk_chars=64):
+    for start in range(0, len(text), chunk_chars):
+        yield LLMResponse(text[start:start + chunk_chars])
+
+
+def _prompt_digest(prompt):
+    digest = hashlib.sha256()
+    parts = prompt if isinstance(prompt, (list, tuple)) else [prompt]
+    for part in parts:
+        if isinstance(part, dict):
+            data = part.get("data", b"")
+            digest.update(data if isinstance(data, bytes) else str(data).encode("utf-8"))
+        else:
+            digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _sentence(rng, words=12):
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _fake_response(prompt, rng):
+    if isinstance(prompt, (list, tuple)):
+        return _fake_ocr(rng)
+    if "Question-Answer Extraction Task" in prompt:
+        return _fake_mapping(prompt, rng)
+    if "BATCH EVALUATION" in prompt:
+        return _fake_batch(prompt, rng)
+    if "MULTI-PERSPECTIVE EVALUATION" in prompt:
+        return _fake_single_call(prompt, rng)
+    # Consensus prompts quote the evaluators' proposed grades, so test them first
+    if "**Score:**" in prompt:
+        return _fake_consensus(prompt, rng)
+    if "**Proposed Grade:**" in prompt:
+        return _fake_evaluator(prompt, rng)
+    return " ".join(_sentence(rng) for _ in range(3))
+
+
+def _fake_ocr(rng):
+    first = rng.randint(1, 6)
+    answers = []
+    for number in range(first, first + rng.randint(1, 3)):
+        body = " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 6)))
+        answers.append(f"Answer {number}: {body}")
+    return "\n\n".join(answers)
+
+
+def _fence_block(prompt, heading):
+    """Return the fenced block that follows a markdown heading in a prompt."""
+    match = re.search(re.escape(heading) + r".*?```\s*\n(.*?)```", prompt, re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+def _fake_mapping(prompt, rng):
+    questions = []
+    paper = _fence_block(prompt, "## Questions")
+    try:
+        parsed = json.loads(paper)
+        for i, q in enumerate(parsed.get("questions", [])):
+            number = str(q.get("id", i + 1))
+            questions.append((int(number) if number.isdigit() else number, q.get("text", ""), q.get("marks", 0)))
+    except (ValueError, AttributeError):
+        for i, (text, marks) in enumerate(re.findall(r"(?m)^\s*(?:\d+\.|-|#+)\s*(.*?)\s*\[(\d+)\]", paper)):
+            questions.append((i + 1, text, int(marks)))
+
+    answer_text = _fence_block(prompt, "## Student Answer Text")
+    answers = dict(re.findall(r"Answer\s*(\d+):\s*(.*?)(?=Answer\s*\d+:|\Z)", answer_text, re.DOTALL))
+
+    items = [
+        {
+            "questionNumber": number,
+            "question": text,
+            "maxMarks": marks,
+            "answer": answers.get(str(number), "").strip() or ("No answer found" if rng.random() < 0.5 else _sentence(rng)),
+        }
+        for number, text, marks in questions
+    ]
+    return "```json\n" + json.dumps(items, indent=2) + "\n```"
+
+
+def _fake_evaluator(prompt, rng):
+    name = re.search(r"You are (.*?),", prompt)
+    max_marks = re.search(r"\[(\d+(?:\.\d+)?) marks\]", prompt)
+    max_marks = float(max_marks.group(1)) if max_marks else 10.0
+    grade = round(rng.uniform(0.4, 1.0) * max_marks)
+    return (
+        f"## {name.group(1) if name else 'Evaluator'} Evaluation\n\n"
+        f"**Key Points Required:**\n- {_sentence(rng, 6)}\n- {_sentence(rng, 6)}\n\n"
+        f"**Points Addressed:**\n- {_sentence(rng, 6)}\n\n"
+        f"**Evaluation:**\n{_sentence(rng, 20)}\n\n"
+        f"**Proposed Grade:** {grade} out of {max_marks:g}"
+    )
+
+
+def _fake_consensus(prompt, rng):
+    header = re.search(r"QUESTION (\S+) \[(\d+(?:\.\d+)?) marks\]:\s*\n\s*(.*)", prompt)
+    number, max_marks, question = header.groups() if header else ("1", "10", "Question")
+    grades = [float(g) for g in re.findall(r"\*\*Proposed Grade:\*\* (\d+(?:\.\d+)?)", prompt)]
+    score = round(sum(grades) / len(grades)) if grades else round(rng.uniform(0.4, 1.0) * float(max_marks))
+    return (
+        f"## Question {number}: {question.strip()}\n\n"
+        f"**Score:** {score} out of {max_marks}\n\n"
+        f"**Consensus Feedback:**\n{_sentence(rng, 18)}\n\n"
+        f"**Strengths:**\n- {_sentence(rng, 6)}\n\n"
+        f"**Areas for Improvement:**\n- {_sentence(rng, 6)}"
+    )
+
+
+def _fake_result(max_marks, rng):
+    scores = [round(rng.uniform(0.4, 1.0) * max_marks) for _ in range(3)]
+    result = {
+        key: {"score": score, "rationale": _sentence(rng, 14)}
+        for key, score in zip(("theoretical", "practical", "holistic"), scores)
+    }
+    result["consensus"] = {
+        "score": max(scores),
+        "feedback": _sentence(rng, 18),
+        "strengths": [_sentence(rng, 6)],
+        "improvements": [_sentence(rng, 6)],
+    }
+    return result
+
+
+def _fake_single_call(prompt, rng):
+    max_marks = re.search(r"\[(\d+(?:\.\d+)?) marks\]", prompt)
+    max_marks = float(max_marks.group(1)) if max_marks else 10.0
+    return json.dumps(_fake_result(max_marks, rng), indent=2)
+
+
+def _fake_batch(prompt, rng):
+    results = []
+    for index, number, max_marks in re.findall(
+            r"### ITEM (\d+) - QUESTION (\S+) \[(\d+(?:\.\d+)?) marks\]:", prompt):
+        result = {"item": int(index), "questionNumber": number}
+        result.update(_fake_result(float(max_marks), rng))
+        results.append(result)
+    return json.dumps(results, indent=2)
+
+
+_BACKEND_FACTORIES = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend.from_env,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the active backend, creating it from LLM_BACKEND on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if LLM_BACKEND not in _BACKEND_FACTORIES:
+                raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}, expected one of {sorted(_BACKEND_FACTORIES)}")
+            _backend = _BACKEND_FACTORIES[LLM_BACKEND]()
+            logger.info(f"Using LLM backend: {_backend.name}")
+        return _backend
+
+
+def set_backend(backend):
+    """
+    Replace the active backend.
+
+    Args:
+        backend (str or object): "gemini", "fake", or a backend instance
+
+    Returns:
+        object: The new active backend
+    """
+    global _backend
+    if isinstance(backend, str):
+        backend = _BACKEND_FACTORIES[backend]()
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+class Model:
+    """
+    A model handle bound to a model name and generation config.
+
+    Mirrors ``genai.GenerativeModel.generate_content`` so call sites are
+    unchanged, but resolves the backend on every call and applies the
+    current deadline.
+    """
+
+    def __init__(self, model_name=None, generation_config=None):
+        self.model_name = model_name or DEFAULT_MODEL_NAME
+        self.generation_config = generation_config
+
+    def generate_content(self, prompt, stream=False):
+        check_deadline()
+        response = get_backend().generate_content(prompt, self.model_name, self.generation_config,
+                                                  stream=stream, timeout=remaining_time())
+        if stream and _deadline.get() is not None:
+            return _chunks_until_deadline(response)
+        return response
+
+    @property
+    def model_id(self):
+        """Identifies the backend and model, e.g. for cache keys."""
+        return get_backend().model_id(self.model_name)
+
+
+def get_model(model_name=None, generation_config=None):
+    """
+    Return a model handle for the active backend.
+
+    Args:
+        model_name (str, optional): Defaults to GEMINI_MODEL_NAME
+        generation_config (dict, optional): Passed to the backend
+
+    Returns:
+        Model: Handle with a generate_content(prompt, stream=False) method
+    """
+    return Model(model_name, generation_config)
+
+
+def is_configured():
+    """True if the active backend can serve requests (e.g. an API key is set)."""
+    return get_backend().is_configured()
@@ -0,0 +1,169 @@
+"""
+Local Mapper Module - Deterministic question-answer mapping for anchored answer sheets
+
+Many answer sheets label every answer ("Answer 3:", "Q3.", "3.") and can be
+split without a model call. The mapper finds these anchors in a single
+regex pass over the text and cuts the text between them. Each mapping gets a
+confidence score, so the caller can send only the doubtful questions (and
+only the text not already claimed) to mapper.map_answers.
+"""
+
+import re
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Anchors naming the answer explicitly: "Answer 3:", "**Ans. 3b)**", "Q3.", "## Question 3"
+EXPLICIT_ANCHOR = (
+    r"(?:\#+[ \t]*)?(?:\*\*)?(?:answer|ans|question|ques|q)\.?[ \t]*(?:no\.?[ \t]*)?"
+    r"(?P<explicit>\d{1,3})[ \t]*\(?(?P<explicit_part>[a-h](?![a-z]))?\)?[ \t]*[:.)\-]?[ \t]*(?:\*\*)?"
+)
+# Bare numbers at the start of a line: "3.", "3)", "3b)"; these also start numbered lists inside answers
+BARE_ANCHOR = r"(?:\*\*)?(?P<bare>\d{1,3})[ \t]*(?P<bare_part>[a-h])?[.)](?:\*\*)?(?=[ \t]|$)[ \t]*"
+ANCHOR_PATTERN = re.compile(
+    rf"^[ \t]*(?:{EXPLICIT_ANCHOR}|{BARE_ANCHOR})",
+    re.IGNORECASE | re.MULTILINE
+)
+# Page separators written by gemini_ocr.process_images
+PAGE_MARKER_PATTERN = re.compile(r"^--- Page \d+ ---[ \t]*\n?", re.MULTILINE)
+
+# Confidence of a mapping, by the kind of anchor that started it
+EXPLICIT_CONFIDENCE = 0.95
+SEQUENTIAL_CONFIDENCE = 0.8  # bare number following the previous one
+GAP_CONFIDENCE = 0.6  # bare number after a skipped number
+# Penalty when the same question is answered in several places
+SCATTERED_PENALTY = 0.2
+# Answers shorter than this many words may be a label without an answer
+MIN_ANSWER_WORDS = 3
+SHORT_ANSWER_CONFIDENCE = 0.4
+
+Anchor = namedtuple("Anchor", ["start", "end", "number", "part", "explicit"])
+LocalMapping = namedtuple("LocalMapping", ["resolved", "unresolved", "remaining_text"])
+
+
+def find_anchors(answer_text):
+    """
+    Find the answer anchors in a text.
+
+    Args:
+        answer_text (str): OCR text of an answer sheet
+
+    Returns:
+        list: Anchor tuples in text order
+    """
+    anchors = []
+    for match in ANCHOR_PATTERN.finditer(answer_text):
+        if match.group("explicit"):
+            number, part, explicit = match.group("explicit"), match.group("explicit_part"), True
+        else:
+            number, part, explicit = match.group("bare"), match.group("bare_part"), False
+        anchors.append(Anchor(match.start(), match.end(), int(number), (part or "").lower(), explicit))
+    return anchors
+
+
+def _select_anchors(anchors, max_question):
+    """
+    Choose the anchors that delimit answers, with the confidence each one carries.
+
+    If the text has explicit anchors, bare numbers are treated as part of the
+    answers (numbered points). Otherwise a bare number is accepted only if it
+    continues the sequence (same number for a sub-part, or a higher one) and
+    names an existing question, which skips most numbered lists.
+    """
+    explicit = [anchor for anchor in anchors if anchor.explicit]
+    if explicit:
+        return [(anchor, EXPLICIT_CONFIDENCE) for anchor in explicit]
+
+    selected = []
+    last = 0
+    for anchor in anchors:
+        if anchor.number > max_question or anchor.number < last or (anchor.number == last and not anchor.part):
+            continue
+        if anchor.number == last or anchor.number == last + 1:
+            confidence = SEQUENTIAL_CONFIDENCE
+        else:
+            confidence = GAP_CONFIDENCE
+        selected.append((anchor, confidence))
+        last = anchor.number
+    return selected
+
+
+def _question_key(question, index):
+    return str(question.get("id", index + 1)).strip()
+
+
+def map_locally(questions, answer_text, min_confidence=0.7):
+    """
+    Map questions to answers by the anchors in the answer text.
+
+    Args:
+        questions (list): Question dictionaries with "id", "text" and "marks",
+            as in a question paper's "questions" list
+        answer_text (str): OCR text of the answer sheet
+        min_confidence (float): Lowest confidence accepted as resolved
+
+    Returns:
+        LocalMapping: ``resolved`` mapped items (questionNumber, question,
+        maxMarks, answer, confidence) in question order; ``unresolved``
+        question dictionaries; and ``remaining_text``, the answer text not
+        claimed by a resolved question
+    """
+    keys = [_question_key(question, index) for index, question in enumerate(questions)]
+    numeric_keys = [int(key) for key in keys if key.isdigit()]
+    anchors = _select_anchors(find_anchors(answer_text), max(numeric_keys, default=0))
+
+    # Cut the text at the selected anchors: each piece runs to the next anchor
+    pieces = {}
+    claimed = []
+    previous_number = None
+    for position, (anchor, confidence) in enumerate(anchors):
+        end = anchors[position + 1][0].start if position + 1 < len(anchors) else len(answer_text)
+        body = PAGE_MARKER_PATTERN.sub("", answer_text[anchor.end:end]).strip()
+        if anchor.part:
+            body = f"{anchor.part}) {body}"
+        entry = pieces.setdefault(str(anchor.number), {"parts": [], "spans": [], "confidence": confidence})
+        if entry["parts"] and previous_number != anchor.number:
+            # The same question answered again further on
+            entry["confidence"] -= SCATTERED_PENALTY
+        entry["confidence"] = min(entry["confidence"], confidence)
+        entry["parts"].append(body)
+        entry["spans"].append((anchor.start, end))
+        previous_number = anchor.number
+
+    resolved = []
+    unresolved = []
+    for index, question in enumerate(questions):
+        key = keys[index]
+        entry = pieces.get(key)
+        if entry is None:
+            unresolved.append(question)
+            continue
+        answer = "\n".join(part for part in entry["parts"] if part).strip()
+        confidence = entry["confidence"]
+        if len(answer.split()) < MIN_ANSWER_WORDS:
+            confidence = min(confidence, SHORT_ANSWER_CONFIDENCE)
+        if confidence < min_confidence:
+            unresolved.append(question)
+            continue
+        claimed.extend(entry["spans"])
+        resolved.append({
+            "questionNumber": int(key) if key.isdigit() else key,
+            "question": question.get("text", ""),
+            "maxMarks": question.get("marks", 0),
+            "answer": answer,
+            "confidence": round(confidence, 2),
+        })
+
+    # Whatever no resolved question claimed is left for the model
+    remaining = []
+    position = 0
+    for start, end in sorted(claimed):
+        remaining.append(answer_text[position:start])
+        position = end
+    remaining.append(answer_text[position:])
+    remaining_text = "\n".join(piece.strip() for piece in remaining if piece.strip())
+
+    logger.info(f"Local mapper resolved {len(resolved)} of {len(questions)} questions "
+                f"from {len(anchors)} anchors; {len(remaining_text)} chars left unmapped")
+    return LocalMapping(resolved, unresolved, remaining_text)
@@ -3,18 +3,46 @@ import logging
 import re
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
+import llm_backend
+import local_mapper
+import lexical_index
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Prompt size limits: the question paper is trimmed, longer answer text is mapped in windows
+MAX_QP_CHARS = 8000
+MAX_ANS_CHARS = 16000
+MAX_TOTAL_CHARS = 22000
+
+# Map long answer sheets in overlapping windows instead of truncating them
+MAPPER_CHUNKING = os.getenv("MAPPER_CHUNKING", "true").lower() == "true"
+# Characters of each window repeated at the start of the next one
+MAPPER_WINDOW_OVERLAP = int(os.getenv("MAPPER_WINDOW_OVERLAP", 1500))
+# Windows mapped concurrently
+MAPPER_MAX_WORKERS = int(os.getenv("MAPPER_MAX_WORKERS", 4))
+# Shortest repeated text treated as window overlap when joining answer pieces
+MIN_OVERLAP_MATCH = 20
+# Placeholder answers the model returns for questions it found no answer to
+EMPTY_ANSWERS = {"no answer found", "no answer provided", "not found", "n/a"}
+
+# Resolve anchored answers ("Answer 3:", "3.") locally before calling the model
+LOCAL_MAPPER_ENABLED = os.getenv("LOCAL_MAPPER_ENABLED", "true").lower() == "true"
+# Local mappings below this confidence are sent to the model instead
+LOCAL_MAPPER_MIN_CONFIDENCE = float(os.getenv("LOCAL_MAPPER_MIN_CONFIDENCE", 0.7))
+# Narrow answer text too long for one prompt to its best BM25 matches for the questions
+MAPPER_RETRIEVAL = os.getenv("MAPPER_RETRIEVAL", "true").lower() == "true"
+# Candidate segments kept per question when narrowing
+MAPPER_RETRIEVAL_TOP_K = int(os.getenv("MAPPER_RETRIEVAL_TOP_K", 3))
+
 # Initialize the model at module level
 model = None
 
 def get_gemini_model():
-    """Initialize and return the Gemini model."""
+    """Initialize and return the Gemini model (or the configured llm_backend stand-in)."""
     global model
     
     try:
@@ -24,21 +52,14 @@ def get_gemini_model():
         # Load environment variables if not already done
         load_dotenv()
         
-        # Get API key from environment - check multiple possible environment variable names
-        api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        # The Gemini backend reads GEMINI_API_KEY, falling back to GOOGLE_API_KEY
+        if not llm_backend.is_configured():
             logger.error("API key not found in environment variables (checked GOOGLE_API_KEY, GEMINI_API_KEY)")
             raise ValueError("API key environment variable not set")
-            
-        # Configure the API
-        genai.configure(api_key=api_key)
-        
-        # Use the specified model name
-        gemini_model_name = "gemini-2.0-flash-thinking-exp-01-21"
         
         # Initialize the model
-        model = genai.GenerativeModel(gemini_model_name)
-        logger.info(f"Gemini model successfully initialized with model: {gemini_model_name}")
+        model = llm_backend.get_model()
+        logger.info(f"Gemini model successfully initialized with model: {model.model_name}")
         
         return model
         
@@ -46,10 +67,80 @@ def get_gemini_model():
         logger.error(f"Error initializing Gemini model: {e}")
         return None
 
+_json_decoder = json.JSONDecoder()
+_CLOSERS = {"[": "]", "{": "}"}
+# Characters that change the scanner's state; everything else is skipped over
+_JSON_STRUCTURE = re.compile(r'[\[\]{}"\\]')
+
+def _json_candidates(text):
+    """
+    Find the outermost balanced [...] / {...} spans of a text in one pass.
+    
+    Brackets inside JSON strings are ignored. When an opening bracket is never
+    closed (a stray "[" in prose, or a truncated response), the complete spans
+    nested directly inside it are candidates too, so a stray bracket cannot
+    hide the JSON that follows it; an unclosed "[" that opens straight onto
+    its first element is also offered as a truncated array.
+    
+    Returns:
+        list: (start, end, children) in text order; children is None for a
+        balanced span, or the (start, end) spans of the complete elements of
+        a truncated array
+    """
+    candidates = []
+    # Open brackets as (offset, char); complete child spans by parent offset
+    stack = []
+    children = {}
+    in_string = False
+    escaped_at = -1
+    for match in _JSON_STRUCTURE.finditer(text):
+        char = match.group()
+        if in_string:
+            if match.start() == escaped_at:
+                continue
+            if char == "\\":
+                escaped_at = match.end()
+            elif char == '"':
+                in_string = False
+        elif char in _CLOSERS:
+            stack.append((match.start(), char))
+        elif stack:
+            if char == '"':
+                in_string = True
+            elif char == _CLOSERS[stack[-1][1]]:
+                start = stack.pop()[0]
+                children.pop(start, None)
+                if stack:
+                    children.setdefault(stack[-1][0], []).append((start, match.end()))
+                else:
+                    candidates.append((start, match.end(), None))
+    for start, char in stack:
+        spans = children.get(start)
+        if not spans:
+            continue
+        if char == "[" and not text[start + 1:spans[0][0]].strip():
+            candidates.append((start, len(text), spans))
+        candidates.extend((child_start, child_end, None) for child_start, child_end in spans)
+    return sorted(candidates, key=lambda candidate: candidate[0])
+
+def _decode_span(text, start, end):
+    """Decode text[start:end] as exactly one JSON value, or raise ValueError."""
+    value, value_end = _json_decoder.raw_decode(text, start)
+    if value_end != end:
+        raise ValueError("Trailing data after JSON value")
+    return value
+
 def extract_json_from_text(text):
     """
     Extract a JSON object or array from a text that might contain other content.
     
+    The text is scanned once for balanced brackets (see _json_candidates)
+    and each candidate is decoded in place with JSONDecoder.raw_decode, so the
+    work stays linear in the length of the text. The first array or object
+    holding objects or arrays wins; a list of plain values (e.g. "[1]" in
+    prose) is only returned if nothing better is found. A response cut off
+    in the middle of an array yields the elements that were complete.
+    
     Args:
         text (str): Text potentially containing JSON
         
@@ -58,58 +149,135 @@ def extract_json_from_text(text):
     """
     if not text:
         return None
-        
+    
     try:
         # First try direct JSON parsing
         return json.loads(text)
-    except:
+    except (ValueError, RecursionError):
         pass
     
-    try:
-        # Look for JSON within code blocks
-        code_block_pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'
-        matches = re.findall(code_block_pattern, text)
-        
-        for match in matches:
-            try:
-                return json.loads(match)
-            except:
-                continue
-                
-        # Look for arrays within the text
-        array_pattern = r'\[\s*{[\s\S]*}\s*\]'
-        array_matches = re.findall(array_pattern, text)
+    fallback = None
+    for start, end, children in _json_candidates(text):
+        try:
+            if children is None:
+                value = _decode_span(text, start, end)
+            else:
+                value = [_decode_span(text, child_start, child_end) for child_start, child_end in children]
+                logger.warning(f"JSON array was cut off; keeping its {len(value)} complete elements")
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(value, dict) or any(isinstance(item, (dict, list)) for item in value):
+            return value
+        if fallback is None:
+            fallback = value
+    return fallback
+
+class JSONItemStream:
+    """
+    Incremental parser for a streamed JSON array of objects.
+    
+    Text is fed in chunks as it arrives; every element of the first top-level
+    array is decoded as soon as it closes, so callers can act on the first
+    items before the response has finished. Anything before the array (such
+    as a ```json fence) is skipped.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._item_start = None
+        self._in_string = False
+        self._escaped = False
+        self.done = False
+    
+    def feed(self, chunk):
+        """
+        Add a chunk of response text.
         
-        for match in array_matches:
-            try:
-                return json.loads(match)
-            except:
-                continue
-                
-        # Look for any JSON-like structure
-        json_pattern = r'({[\s\S]*}|\[[\s\S]*\])'
-        json_matches = re.findall(json_pattern, text)
+        Args:
+            chunk (str): The next piece of the response
+            
+        Returns:
+            list: Array elements completed by this chunk
+        """
+        items = []
+        if self.done or not chunk:
+            return items
+        self._buffer += chunk
+        text = self._buffer
+        position = self._position
+        while position < len(text):
+            char = text[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 1:
+                    self._item_start = position
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(text[self._item_start:position + 1]))
+                    except ValueError:
+                        logger.warning("Skipping malformed item in streamed JSON array")
+                    self._item_start = None
+                elif self._depth == 0:
+                    self.done = True
+                    break
+            position += 1
         
-        for match in json_matches:
-            try:
-                return json.loads(match)
-            except:
-                continue
-                
-        return None
-    except Exception as e:
-        logger.error(f"Error extracting JSON: {e}")
-        return None
+        # Keep only the unfinished item in the buffer
+        keep_from = self._item_start if self._item_start is not None else position
+        self._buffer = text[keep_from:]
+        self._position = position - keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
+
+def iter_json_items(chunks):
+    """
+    Yield the elements of a JSON array streamed as text chunks, as each one closes.
+    
+    Args:
+        chunks (iterable): Response text pieces, e.g. the .text of each
+            chunk of a streamed model response
+            
+    Yields:
+        The decoded array elements, in order
+    """
+    stream = JSONItemStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+        if stream.done:
+            return
 
-def map_answers(question_paper_text, answer_text, is_md_format=False, handle_noise=True):
+def map_answers(question_paper_text, answer_text, is_md_format=False, handle_noise=True, on_mapping=None):
     """
     Main function for mapping questions to answers using a single prompt approach.
     
+    Answer sheets too long for one prompt are split into overlapping windows
+    (see split_answer_windows) that are mapped concurrently and merged into
+    one result per question, instead of being truncated.
+    
     Args:
         question_paper_text (str): The text content of the question paper or markdown questions
         answer_text (str): The extracted text containing student answers
         is_md_format (bool): Whether the questions are in Markdown format
         handle_noise (bool): Whether to try handling noise in the extracted text
+        on_mapping (callable, optional): Called as on_mapping(item) for each
+            mapped question-answer pair as soon as it is available
         
     Returns:
         list: A list of dictionaries with the mapped questions and answers
@@ -122,139 +290,375 @@ def map_answers(question_paper_text, answer_text, is_md_format=False, handle_noi
         start_time = time.time()
         logger.info("Starting question-answer mapping with single prompt approach")
         
-        # Trim inputs if they're very long to avoid token limits
-        max_qp_chars = 8000
-        max_ans_chars = 16000
-        
-        if len(question_paper_text) > max_qp_chars:
-            logger.warning(f"Question paper text too long ({len(question_paper_text)} chars), trimming to {max_qp_chars}")
-            question_paper_text = question_paper_text[:max_qp_chars]
-            
-        if len(answer_text) > max_ans_chars:
-            logger.warning(f"Answer text too long ({len(answer_text)} chars), trimming to {max_ans_chars}")
-            answer_text = answer_text[:max_ans_chars]
+        # The questions go into every prompt, so they are still trimmed
+        if len(question_paper_text) > MAX_QP_CHARS:
+            logger.warning(f"Question paper text too long ({len(question_paper_text)} chars), trimming to {MAX_QP_CHARS}")
+            question_paper_text = question_paper_text[:MAX_QP_CHARS]
         
-        # Further reduce content if both items together are too large
-        total_chars = len(question_paper_text) + len(answer_text)
-        max_total_chars = 22000
+        window_chars = min(MAX_ANS_CHARS, MAX_TOTAL_CHARS - len(question_paper_text))
         
-        if total_chars > max_total_chars:
-            # Proportionally reduce both texts
-            reduction_ratio = max_total_chars / total_chars
-            new_qp_length = int(len(question_paper_text) * reduction_ratio)
-            new_ans_length = int(len(answer_text) * reduction_ratio)
-            
-            logger.warning(f"Combined text too long ({total_chars} chars), reducing to {max_total_chars}")
-            question_paper_text = question_paper_text[:new_qp_length]
-            answer_text = answer_text[:new_ans_length]
+        if len(answer_text) <= window_chars:
+            # One window: stream the response so callers see each mapping as it is parsed
+            valid_items = _map_window(question_paper_text, answer_text, is_md_format, handle_noise,
+                                      on_item=on_mapping)
+            on_mapping = None
+        elif MAPPER_CHUNKING:
+            windows = split_answer_windows(answer_text, window_chars, MAPPER_WINDOW_OVERLAP)
+            logger.info(f"Answer text is {len(answer_text)} chars, mapping it in {len(windows)} overlapping windows")
+            with ThreadPoolExecutor(max_workers=max(1, min(MAPPER_MAX_WORKERS, len(windows)))) as executor:
+                partial_mappings = list(executor.map(
+                    llm_backend.propagate_deadline(
+                        lambda numbered: _map_window(question_paper_text, numbered[1], is_md_format, handle_noise,
+                                                     part=(numbered[0] + 1, len(windows)))),
+                    enumerate(windows)
+                ))
+            valid_items = merge_partial_mappings(partial_mappings)
+        else:
+            # Legacy behaviour: map only what fits in one prompt
+            logger.warning(f"Answer text too long ({len(answer_text)} chars), trimming to {window_chars}")
+            valid_items = _map_window(question_paper_text, answer_text[:window_chars], is_md_format, handle_noise)
         
-        # Build the single unified prompt for Gemini
-        format_instruction = """
-        For Markdown format questions, they might appear as:
-        - "1. Question text [5]" (where 5 is the marks)
-        - "- Question text [10]" (where 10 is the marks)
-        - "## Question text [5]"
-        """
+        if valid_items:
+            if on_mapping is not None:
+                for item in valid_items:
+                    on_mapping(item)
+            processing_time = time.time() - start_time
+            logger.info(f"Successfully mapped {len(valid_items)} questions to answers in {processing_time:.2f} seconds")
+        return valid_items
         
-        noise_handling_instruction = """
-        The student answer text may contain noise from the OCR process, such as:
-        - Headers, footers, page numbers
-        - Irrelevant text or artifacts
-        - Formatting issues
-        Please use your understanding to filter out this noise and focus on extracting the actual answers.
-        """
-                
-        prompt = f"""
-        # Question-Answer Extraction Task
+    except llm_backend.DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error in answer mapping: {e}")
+        return []
 
-        ## Your Role
-        You are an AI expert in academic assessment, tasked with finding answers to specific questions in a student's answer sheet.
+def split_answer_windows(answer_text, window_chars, overlap_chars=0):
+    """
+    Split answer text into overlapping windows on page and paragraph boundaries.
+    
+    The text is cut into segments at the "--- Page N ---" markers written by
+    gemini_ocr.process_images and at blank lines; a segment longer than a
+    window is cut at line or word boundaries. Segments are packed greedily
+    into windows of at most ``window_chars``, and each window after the first
+    starts with up to ``overlap_chars`` of trailing segments from the one
+    before, so an answer running across a boundary is seen whole at least once.
+    
+    Args:
+        answer_text (str): The full answer text
+        window_chars (int): Maximum characters per window
+        overlap_chars (int): Characters repeated from the previous window
+        
+    Returns:
+        list: Window strings in document order
+    """
+    segments = []
+    for block in re.split(r"(?=^--- Page \d+ ---$)|\n\s*\n", answer_text, flags=re.MULTILINE):
+        block = block.strip()
+        while len(block) > window_chars:
+            cut = max(block.rfind("\n", 0, window_chars), block.rfind(" ", 0, window_chars))
+            if cut <= 0:
+                cut = window_chars
+            segments.append(block[:cut].strip())
+            block = block[cut:].strip()
+        if block:
+            segments.append(block)
+    
+    overlap_chars = min(overlap_chars, window_chars // 2)
+    windows = []
+    current = []
+    size = 0
+    for segment in segments:
+        if current and size + len(segment) + 2 > window_chars:
+            windows.append("\n\n".join(current))
+            # Carry trailing segments into the next window as overlap
+            carried = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + len(previous) + 2 > overlap_chars:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous) + 2
+            current = carried
+            size = carried_size
+        current.append(segment)
+        size += len(segment) + 2
+    if current:
+        windows.append("\n\n".join(current))
+    return windows
 
-        ## Questions
-        ```
-        {question_paper_text}
-        ```
+def _is_empty_answer(answer):
+    return not answer or not answer.strip() or answer.strip().lower() in EMPTY_ANSWERS
 
-        ## Student Answer Text (may contain noise or irrelevant text)
-        ```
-        {answer_text}
-        ```
+def _join_answer_parts(first, second):
+    """Join two pieces of one answer, removing text repeated by a window overlap."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    longest = min(len(first), len(second))
+    for size in range(longest, MIN_OVERLAP_MATCH - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
 
-        ## Your Task
-        1. First, identify all questions from the provided questions section.
-        2. Then, for each identified question, find the corresponding answer in the student's answer text.
-        3. You must intelligently handle any noise, irrelevant text, or potential OCR errors.
-        4. Use semantic understanding rather than just pattern matching to identify which text corresponds to which question.
+def merge_partial_mappings(partial_mappings):
+    """
+    Merge the mappings of several answer windows into one item per question.
+    
+    Conflicts are resolved in document order: empty or "No answer found"
+    answers lose to real ones; an answer seen whole in the overlap of two
+    windows is kept once; and distinct pieces from different windows (an
+    answer continued later in the script) are joined.
+    
+    Args:
+        partial_mappings (list): One list of mapped items per window, in window order
         
-        {format_instruction if is_md_format else ""}
-        {noise_handling_instruction if handle_noise else ""}
+    Returns:
+        list: Merged items, ordered by question number
+    """
+    merged = {}
+    order = []
+    for items in partial_mappings:
+        for item in items:
+            key = str(item["questionNumber"]).strip()
+            if key not in merged:
+                merged[key] = dict(item)
+                order.append(key)
+                continue
+            current = merged[key]
+            answer = str(item.get("answer") or "").strip()
+            if _is_empty_answer(answer):
+                continue
+            if _is_empty_answer(current.get("answer")):
+                current["answer"] = answer
+            else:
+                current["answer"] = _join_answer_parts(current["answer"].strip(), answer)
+    
+    def sort_key(key):
+        return (0, float(key), "") if re.fullmatch(r"\d+(?:\.\d+)?", key) else (1, order.index(key), key)
+    
+    return [merged[key] for key in sorted(order, key=sort_key)]
 
-        ## Response Format
-        Return a JSON array with this exact structure:
-        ```
-        [
-          {{
-            "questionNumber": <number>,
-            "question": "<question text>",
-            "maxMarks": <number>,
-            "answer": "<extracted answer text>"
-          }},
-          ...
-        ]
-        ```
+def _is_valid_mapping(item):
+    return (isinstance(item, dict) and
+            "questionNumber" in item and
+            "question" in item and
+            "maxMarks" in item and
+            "answer" in item)
 
-        Return only the JSON array with NO additional explanation or text.
-        """
-        
-        logger.info("Sending unified mapping request to Gemini")
-        
-        # Try multiple times with exponential backoff
-        max_retries = 3
-        retry_delay = 2  # Initial delay in seconds
+def _map_window(question_paper_text, answer_text, is_md_format=False, handle_noise=True, part=None, on_item=None):
+    """
+    Map questions to answers in one piece of answer text with a single prompt.
+    
+    Args:
+        question_paper_text (str): The question paper or markdown questions
+        answer_text (str): The answer text, or one window of it
+        is_md_format (bool): Whether the questions are in Markdown format
+        handle_noise (bool): Whether to try handling noise in the extracted text
+        part (tuple, optional): (window number, window count) when mapping one
+            window of a longer answer sheet
+        on_item (callable, optional): If given, the response is streamed and
+            on_item(item) is called for each valid item as soon as it is parsed
         
-        for attempt in range(max_retries):
-            try:
+    Returns:
+        list: Mapped question-answer dictionaries, empty if every attempt failed
+    """
+    # Build the single unified prompt for Gemini
+    part_instruction = ""
+    if part:
+        part_instruction = f"""
+    The student answer text above is part {part[0]} of {part[1]} of a longer answer sheet.
+    Extract only answers that appear in this part; use an empty string for any question whose answer is not in it.
+    """
+    
+    format_instruction = """
+    For Markdown format questions, they might appear as:
+    - "1. Question text [5]" (where 5 is the marks)
+    - "- Question text [10]" (where 10 is the marks)
+    - "## Question text [5]"
+    """
+    
+    noise_handling_instruction = """
+    The student answer text may contain noise from the OCR process, such as:
+    - Headers, footers, page numbers
+    - Irrelevant text or artifacts
+    - Formatting issues
+    Please use your understanding to filter out this noise and focus on extracting the actual answers.
+    """
+            
+    prompt = f"""
+    # Question-Answer Extraction Task
+
+    ## Your Role
+    You are an AI expert in academic assessment, tasked with finding answers to specific questions in a student's answer sheet.
+
+    ## Questions
+    ```
+    {question_paper_text}
+    ```
+
+    ## Student Answer Text (may contain noise or irrelevant text)
+    ```
+    {answer_text}
+    ```
+
+    ## Your Task
+    1. First, identify all questions from the provided questions section.
+    2. Then, for each identified question, find the corresponding answer in the student's answer text.
+    3. You must intelligently handle any noise, irrelevant text, or potential OCR errors.
+    4. Use semantic understanding rather than just pattern matching to identify which text corresponds to which question.
+    
+    {format_instruction if is_md_format else ""}
+    {noise_handling_instruction if handle_noise else ""}
+    {part_instruction}
+
+    ## Response Format
+    Return a JSON array with this exact structure:
+    ```
+    [
+      {{
+        "questionNumber": <number>,
+        "question": "<question text>",
+        "maxMarks": <number>,
+        "answer": "<extracted answer text>"
+      }},
+      ...
+    ]
+    ```
+
+    Return only the JSON array with NO additional explanation or text.
+    """
+    
+    logger.info(f"Sending unified mapping request to Gemini{f' (part {part[0]} of {part[1]})' if part else ''}")
+    
+    # Try multiple times with exponential backoff
+    max_retries = 3
+    retry_delay = 2  # Initial delay in seconds
+    
+    # Question numbers already passed to on_item, so a retry does not repeat them
+    reported = set()
+    
+    for attempt in range(max_retries):
+        try:
+            if on_item is not None:
+                # Stream the response and report each item as soon as its object closes
+                stream = JSONItemStream()
+                pieces = []
+                for chunk in get_gemini_model().generate_content(prompt, stream=True):
+                    pieces.append(chunk.text)
+                    for item in stream.feed(chunk.text):
+                        key = str(item.get("questionNumber")) if isinstance(item, dict) else None
+                        if _is_valid_mapping(item) and key not in reported:
+                            reported.add(key)
+                            on_item(item)
+                response_text = "".join(pieces)
+            else:
                 response = get_gemini_model().generate_content(prompt)
                 
                 # Extract the JSON part from the response
                 response_text = response.text
+            
+            # Try to extract JSON from the text
+            qa_mapping = extract_json_from_text(response_text)
+            
+            if qa_mapping and isinstance(qa_mapping, list):
+                # Validate the structure
+                valid_items = [item for item in qa_mapping if _is_valid_mapping(item)]
                 
-                # Try to extract JSON from the text
-                qa_mapping = extract_json_from_text(response_text)
-                
-                if qa_mapping and isinstance(qa_mapping, list):
-                    # Validate the structure
-                    valid_items = []
-                    for item in qa_mapping:
-                        if (isinstance(item, dict) and 
-                            "questionNumber" in item and 
-                            "question" in item and 
-                            "maxMarks" in item and 
-                            "answer" in item):
-                            valid_items.append(item)
-                    
-                    if valid_items:
-                        processing_time = time.time() - start_time
-                        logger.info(f"Successfully mapped {len(valid_items)} questions to answers in {processing_time:.2f} seconds")
-                        return valid_items
-                
-                logger.warning(f"Invalid response format on attempt {attempt + 1}, retrying...")
-                
-                # Exponential backoff
-                time.sleep(retry_delay)
-                retry_delay *= 2
-                
-            except Exception as e:
-                logger.error(f"Error on attempt {attempt + 1}: {e}")
-                time.sleep(retry_delay)
-                retry_delay *= 2
+                if valid_items:
+                    if on_item is not None:
+                        # Items the stream could not report (e.g. a response that was not a bare array)
+                        for item in valid_items:
+                            if str(item["questionNumber"]) not in reported:
+                                reported.add(str(item["questionNumber"]))
+                                on_item(item)
+                    return valid_items
+            
+            logger.warning(f"Invalid response format on attempt {attempt + 1}, retrying...")
+            
+            # Exponential backoff, given up if the retry could not finish before the deadline
+            llm_backend.backoff_sleep(retry_delay)
+            retry_delay *= 2
+            
+        except llm_backend.DeadlineExceeded:
+            logger.warning(f"Mapping abandoned on attempt {attempt + 1}: deadline exceeded")
+            raise
+        except Exception as e:
+            logger.error(f"Error on attempt {attempt + 1}: {e}")
+            llm_backend.backoff_sleep(retry_delay)
+            retry_delay *= 2
+    
+    logger.error("All mapping attempts failed, returning empty result")
+    return []
+
+def map_question_list(questions, answer_text, is_md_format=True, handle_noise=True, on_mapping=None):
+    """
+    Map a list of questions to answers, calling the model only where needed.
+    
+    Questions whose answers are clearly anchored in the text ("Answer 3:",
+    "Q3.", "3.") are mapped by local_mapper without a model call. The rest
+    are sent to map_answers together with only the answer text that the
+    resolved questions did not claim; if that is still too long for one
+    prompt, it is narrowed to the paragraphs lexical_index ranks highest
+    for the unresolved questions.
+    
+    Args:
+        questions (list): Question dictionaries with "id", "text" and "marks"
+        answer_text (str): The extracted text containing student answers
+        is_md_format (bool): Whether the questions are in Markdown format
+        handle_noise (bool): Whether to try handling noise in the extracted text
+        on_mapping (callable, optional): Called as on_mapping(item) for each
+            mapped question-answer pair as soon as it is available
         
-        logger.error("All mapping attempts failed, returning empty result")
-        return []
+    Returns:
+        list: Mapped question-answer dictionaries in question order; each has
+        "mappedBy" ("local" or "model") and local ones a "confidence"
+    """
+    def question_paper(subset):
+        return json.dumps({
+            "title": "Questions",
+            "totalMarks": sum(question.get("marks", 0) for question in subset),
+            "questions": subset,
+        })
+    
+    def model_mapped(item):
+        item["mappedBy"] = "model"
+        if on_mapping is not None:
+            on_mapping(item)
+    
+    if not LOCAL_MAPPER_ENABLED:
+        items = map_answers(question_paper(questions), answer_text, is_md_format, handle_noise, model_mapped)
+        # Streamed items are reported as parsed, but the list returned is parsed separately
+        for item in items:
+            item.setdefault("mappedBy", "model")
+        return items
+    
+    local = local_mapper.map_locally(questions, answer_text, LOCAL_MAPPER_MIN_CONFIDENCE)
+    mapped = {}
+    for item in local.resolved:
+        item["mappedBy"] = "local"
+        mapped[str(item["questionNumber"])] = item
+        if on_mapping is not None:
+            on_mapping(item)
+    
+    remaining_text = local.remaining_text
+    if local.unresolved and MAPPER_RETRIEVAL and len(remaining_text) > MAX_ANS_CHARS:
+        # Rather than mapping the whole text in windows, keep the paragraphs
+        # that share the most terms with the unresolved questions
+        remaining_text = lexical_index.narrow_text(local.unresolved, remaining_text, MAPPER_RETRIEVAL_TOP_K)
+    
+    if local.unresolved and remaining_text.strip():
+        logger.info(f"Mapping {len(local.unresolved)} unresolved questions with the model "
+                    f"over {len(remaining_text)} of {len(answer_text)} chars")
         
-    except Exception as e:
-        logger.error(f"Error in answer mapping: {e}")
-        return []
+        for item in map_answers(question_paper(local.unresolved), remaining_text,
+                                is_md_format, handle_noise, on_mapping=model_mapped):
+            # Streamed items are reported as parsed, but the list returned is parsed separately
+            item.setdefault("mappedBy", "model")
+            mapped.setdefault(str(item["questionNumber"]).strip(), item)
+    
+    return [mapped[key] for key in (str(question.get("id", index + 1)).strip()
+                                    for index, question in enumerate(questions)) if key in mapped]
 
 def find_answer_for_question(question, answer_text):
     """
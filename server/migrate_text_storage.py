@@ -0,0 +1,123 @@
+"""
+One-time migration: rewrite stored documents to the text_store layout.
+
+- extractedText / markdownContent values of at least TEXT_COMPRESS_MIN_BYTES
+  are compressed (or moved to GridFS) as text_store.pack_update does for new
+  documents.
+- extracted_texts documents that still carry a copied ``sections`` list get
+  ``sectionSpans`` offsets instead (see ocr.section_spans).
+
+Documents already migrated are skipped, so the script can be re-run or
+resumed after an interruption.
+
+Usage (from the server directory):
+    python migrate_text_storage.py [--dry-run] [--batch-size 100]
+"""
+
+import zlib
+import argparse
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+import text_store
+import ocr
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _flush(collection, pending):
+    """
+    Write a batch of updates, deleting the GridFS blobs of any that failed.
+
+    Only writes the server reports as failed are cleaned up; after other
+    errors some updates may have been applied, and deleting their blobs
+    would lose the text.
+
+    Args:
+        pending (list): (UpdateOne, blob ids it references) pairs
+    """
+    try:
+        collection.bulk_write([operation for operation, _ in pending], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            for blob_id in pending[error["index"]][1]:
+                text_store._gridfs().delete(blob_id)
+        raise
+
+
+def migrate_collection(collection, field, batch_size, dry_run):
+    """
+    Pack one text field across a collection.
+
+    Returns:
+        dict: Counters of documents seen and rewritten, and the bytes of
+        rewritten text before and after (compressed size, wherever it is stored)
+    """
+    stats = {"documents": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    with_sections = collection.name == "extracted_texts"
+    query = {"$or": [{field: {"$type": "string"}}]}
+    if with_sections:
+        query["$or"].append({"sections": {"$exists": True}})
+    projection = {"_id": 1, field: 1, "sections": 1}
+
+    pending = []
+    for doc in collection.find(query, projection, batch_size=batch_size):
+        stats["documents"] += 1
+        text = doc.get(field)
+        fields = {}
+        unset = {}
+        if isinstance(text, str) and len(text.encode("utf-8")) >= text_store.TEXT_COMPRESS_MIN_BYTES:
+            fields[field] = text
+        if with_sections and "sections" in doc:
+            if text is None:
+                # The text is already packed; unpack it to compute the offsets
+                text = text_store.unpack_field(collection.find_one({"_id": doc["_id"]}), field)
+            fields["sectionSpans"] = ocr.section_spans(text or "")
+            unset["sections"] = ""
+        if not fields:
+            continue
+
+        stats["rewritten"] += 1
+        stats["bytes_before"] += sum(
+            len(section.get("question", "")) + len(section.get("answer", "")) for section in doc.get("sections", []))
+        if field in fields:
+            raw = fields[field].encode("utf-8")
+            stats["bytes_before"] += len(raw)
+            stats["bytes_after"] += len(zlib.compress(raw, text_store.TEXT_COMPRESS_LEVEL))
+
+        if dry_run:
+            continue
+        update = text_store.pack_update(collection.name, fields)
+        if unset:
+            update.setdefault("$unset", {}).update(unset)
+        blob_ids = [value for name, value in update["$set"].items() if name.endswith(text_store.GRIDFS_SUFFIX)]
+        pending.append((UpdateOne({"_id": doc["_id"]}, update), blob_ids))
+        if len(pending) >= batch_size:
+            _flush(collection, pending)
+            pending = []
+    if pending:
+        _flush(collection, pending)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    database.init_db()
+    for collection_name, fields in text_store.PACKED_FIELDS.items():
+        collection = database.db[collection_name]
+        for field in fields:
+            stats = migrate_collection(collection, field, args.batch_size, args.dry_run)
+            logger.info(f"{collection_name}.{field}: {stats['rewritten']} of {stats['documents']} documents "
+                        f"{'would be ' if args.dry_run else ''}rewritten, "
+                        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes of text")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import os
+import re
 import json
+import time
 import logging
+from collections import namedtuple
 from PIL import Image
 from dotenv import load_dotenv
 import gemini_ocr
-from pdf_utils import pdf_to_images
+import image_prep
+import pdf_utils
+from pdf_utils import iter_pdf_pages, RenderedPage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -13,69 +18,138 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def parse_sections(text):
-    """Parse the extracted text into question/answer sections."""
-    sections = []
+# Lines that start a question ("Question 3 ...", "Q 3 ...") or an answer ("Answer: ...", "A ...")
+MARKER_LINE = re.compile(r"^[^\S\n]*(?:(?P<question>question|q )|(?P<answer>answer|a ))", re.IGNORECASE | re.MULTILINE)
+ANSWER_PREFIX = re.compile(r"answer:[^\S\n]*", re.IGNORECASE)
+NON_SPACE = re.compile(r"\S")
+PARAGRAPH_BREAK = re.compile(r"\n\n")
+# Shortest question and answer marker lines (e.g. "Q 1" alone is not a question)
+MIN_QUESTION_LINE = 11
+MIN_ANSWER_LINE = 9
+
+# A parsed section: offsets of the question and answer text in the source text.
+# number is set for sections guessed from paragraph pairs, whose question is
+# shown as "Question <number>: ..."
+Section = namedtuple("Section", ["question_start", "question_end", "answer_start", "answer_end", "number"])
+
+
+def _line_length(text, start):
+    """Length of the line starting at start, without trailing whitespace."""
+    end = text.find("\n", start)
+    return len(text[start:end if end != -1 else len(text)].rstrip())
+
+
+def _iter_marked_sections(text):
+    """
+    Yield sections delimited by "Question"/"Answer" lines.
     
-    # First try to match Question/Answer pairs with clear markers
-    question_matches = [m for m in text.split("\n") if m.strip().lower().startswith(("question", "q ")) and len(m) > 10]
+    Only the marker lines are visited; the text between them is never split
+    or copied.
+    """
+    question_start = question_end = answer_start = None
     
-    if question_matches:
-        current_question = ""
-        current_answer = ""
-        
-        lines = text.split("\n")
-        in_question = False
-        in_answer = False
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
+    for match in MARKER_LINE.finditer(text):
+        if match.group("question") is not None:
+            start = match.start("question")
+            if _line_length(text, start) < MIN_QUESTION_LINE:
+                continue
+            # Save previous Q&A if exists
+            if answer_start is not None and NON_SPACE.search(text, answer_start, match.start()):
+                yield Section(question_start, question_end, answer_start, match.start(), None)
+            question_start, answer_start = start, None
+        else:
+            start = match.start("answer")
+            if question_start is None or answer_start is not None or _line_length(text, start) < MIN_ANSWER_LINE:
                 continue
-                
-            if line.lower().startswith(("question", "q ")) and len(line) > 10:
-                # Save previous Q&A if exists
-                if current_question and current_answer:
-                    sections.append({
-                        "question": current_question.strip(),
-                        "answer": current_answer.strip()
-                    })
-                
-                current_question = line
-                current_answer = ""
-                in_question = True
-                in_answer = False
-            elif line.lower().startswith(("answer", "a ")) and len(line) > 8:
-                in_question = False
-                in_answer = True
-                current_answer += line.replace("Answer:", "").replace("answer:", "").strip() + " "
-            elif in_question:
-                current_question += " " + line
-            elif in_answer or current_question:  # If we have a question but no answer marker, assume it's the answer
-                current_answer += line + " "
+            question_end = match.start()
+            prefix = ANSWER_PREFIX.match(text, start)
+            answer_start = prefix.end() if prefix else start
+    
+    # Add the last Q&A pair
+    if answer_start is not None and NON_SPACE.search(text, answer_start):
+        yield Section(question_start, question_end, answer_start, len(text), None)
+
+
+def _iter_paragraph_sections(text):
+    """Yield sections from consecutive pairs of blank-line separated paragraphs."""
+    paragraphs = []
+    position = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        paragraphs.append((position, match.start()))
+        position = match.end()
+    paragraphs.append((position, len(text)))
+    
+    for i in range(0, len(paragraphs) - 1, 2):
+        (question_start, question_end), (answer_start, answer_end) = paragraphs[i], paragraphs[i + 1]
+        yield Section(question_start, question_end, answer_start, answer_end, i // 2 + 1)
+
+
+def iter_sections(text):
+    """
+    Parse the extracted text into question/answer sections, lazily.
+    
+    Sections start at "Question ..." / "Q ..." lines; the answer starts at an
+    "Answer ..." line and runs to the next question, and a question with no
+    answer line is dropped. If the text has no such sections, consecutive
+    paragraphs are paired up instead. Only offsets are produced; see
+    materialize_section for the text.
+    
+    Args:
+        text (str): The extracted text
         
-        # Add the last Q&A pair
-        if current_question and current_answer:
-            sections.append({
-                "question": current_question.strip(),
-                "answer": current_answer.strip()
-            })
+    Yields:
+        Section: Offsets into text, in order
+    """
+    found = False
+    for section in _iter_marked_sections(text):
+        found = True
+        yield section
     
     # If no proper Q&A structure was found, try a fallback approach
-    if not sections:
-        paragraphs = text.split("\n\n")
-        for i in range(0, len(paragraphs), 2):
-            if i + 1 < len(paragraphs):
-                sections.append({
-                    "question": f"Question {i//2 + 1}: {paragraphs[i].strip()}",
-                    "answer": paragraphs[i+1].strip()
-                })
+    if not found:
+        yield from _iter_paragraph_sections(text)
+
+
+def materialize_section(text, section):
+    """
+    Build the {"question", "answer"} dictionary of a section.
     
-    return sections
+    Args:
+        text (str): The text the section was parsed from
+        section (Section or sequence): A Section, or its stored list form
+        
+    Returns:
+        dict: The question and answer text
+    """
+    question_start, question_end, answer_start, answer_end, number = section
+    question = text[question_start:question_end].strip()
+    if number is not None:
+        question = f"Question {number}: {question}"
+    return {"question": question, "answer": text[answer_start:answer_end].strip()}
+
+
+def section_spans(text):
+    """Parse text into a list of sections in their compact stored form (lists of offsets)."""
+    return [list(section) for section in iter_sections(text)]
 
-def process_file(file_path):
+
+def materialize_sections(text, spans):
+    """Build the {"question", "answer"} dictionaries for stored section spans."""
+    return [materialize_section(text, span) for span in spans]
+
+
+def parse_sections(text):
+    """Parse the extracted text into question/answer sections."""
+    return [materialize_section(text, section) for section in iter_sections(text)]
+
+def process_file(file_path, on_page=None):
     """
     Process a file (PDF or image) with OCR.
+    
+    Args:
+        file_path (str): Path to a PDF or image file
+        on_page (callable, optional): Progress callback, called as
+            on_page(page_number, page_text, page_total) after each page
     """
     try:
         file_extension = os.path.splitext(file_path)[1].lower()
@@ -84,14 +158,41 @@ def process_file(file_path):
         
         logger.info(f"Processing file: {os.path.basename(file_path)} ({file_size_kb:.1f} KB)")
         
+        page_timings = []
+        text_layer_pages = 0
+        blank_pages = []
+        sparse_pages = []
+        
         if file_extension == '.pdf':
-            # Convert PDF to images
-            logger.info("Converting PDF to images...")
-            images = pdf_to_images(file_path)
+            # Render pages lazily so only one or two are held in memory at once;
+            # each page keeps the encoded bytes from the renderer for upload
+            logger.info("Converting PDF pages to images and processing with OCR...")
+            page_count = 0
+            
+            def counted_pages():
+                nonlocal page_count, text_layer_pages
+                for page in iter_pdf_pages(file_path, optimize=image_prep.OCR_IMAGE_PREP,
+                                           text_layer=pdf_utils.PDF_TEXT_LAYER,
+                                           detect_blank=image_prep.blank_detection_enabled()):
+                    page_count += 1
+                    if page.text is not None:
+                        text_layer_pages += 1
+                    elif page.is_blank:
+                        blank_pages.append(page.number)
+                    elif page.ink_class == image_prep.INK_SPARSE:
+                        sparse_pages.append(page.number)
+                    yield page
+            
+            page_total = pdf_utils.get_page_count(file_path)
+            report_page = None
+            if on_page is not None:
+                report_page = lambda page_number, page_text: on_page(page_number, page_text, page_total)
             
-            # Process images with Gemini OCR
-            logger.info(f"Processing {len(images)} pages with OCR...")
-            text_result = gemini_ocr.process_images(images)
+            # Process images with Gemini OCR; text-layer and blank pages make no request
+            text_result = gemini_ocr.process_images(counted_pages(), page_timings=page_timings,
+                                                    on_page=report_page)
+            logger.info(f"Processed {page_count} pages ({text_layer_pages} from the embedded text layer, "
+                        f"{len(blank_pages)} blank pages skipped)")
             
             # Estimate confidence based on text length (simple heuristic)
             confidence = min(95, 70 + len(text_result) // 1000)
@@ -99,20 +200,34 @@ def process_file(file_path):
             # Process a single image
             logger.info("Processing image with OCR...")
             img = Image.open(file_path)
+            if image_prep.OCR_IMAGE_PREP:
+                prepared = image_prep.prepare_image(img)
+                img = RenderedPage(1, prepared.data, prepared.mime_type,
+                                   prepared.width, prepared.height, prepared.metrics)
+            start_time = time.time()
             text_result = gemini_ocr.process_image(img)
+            page_timings.append({"page": 1, "seconds": round(time.time() - start_time, 2)})
+            page_count = 1
+            if on_page is not None:
+                on_page(1, text_result, 1)
             confidence = min(95, 70 + len(text_result) // 1000)
         
-        # Parse the text into sections
+        # Parse the text into sections, kept as offsets into the text
         logger.info("Parsing text sections...")
-        sections = parse_sections(text_result)
+        spans = section_spans(text_result)
         
-        logger.info(f"OCR processing complete: {len(text_result)} characters, {len(sections)} sections")
+        logger.info(f"OCR processing complete: {len(text_result)} characters, {len(spans)} sections")
         
         return {
             "text": text_result,
             "confidence": confidence,
-            "sections": sections,
-            "page_count": len(images) if file_extension == '.pdf' else 1
+            "section_spans": spans,
+            "page_count": page_count,
+            "text_layer_pages": text_layer_pages,
+            "skipped_pages": len(blank_pages),
+            "blank_pages": blank_pages,
+            "sparse_pages": sparse_pages,
+            "page_timings": page_timings
         }
     except Exception as e:
         logger.error(f"Error in OCR processing: {str(e)}")
@@ -0,0 +1,207 @@
+"""
+Pagination Module - Keyset-paginated, streamed listings of per-user documents
+
+Listings are ordered newest first by (timestamp, id) and paged with an
+opaque cursor holding the last (timestamp, id) returned, so each page is an
+index range scan on (userId, timestamp, id) however deep the client pages.
+Documents are serialised one at a time as they come off the MongoDB cursor,
+either as a JSON body or as NDJSON lines, so server memory does not grow
+with the size of the listing.
+"""
+
+import json
+import base64
+import binascii
+from pymongo import DESCENDING
+
+# Page size when the client asks for a page without a limit, and the largest allowed
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Documents fetched from MongoDB per round trip while streaming
+STREAM_BATCH_SIZE = 100
+
+SORT_ORDER = [("timestamp", DESCENDING), ("id", DESCENDING)]
+
+# Value types a cursor can hold, in MongoDB's cross-type sort order
+# (ascending), with the $type alias that matches each. Documents written by
+# clients may hold any of them in timestamp or id.
+CURSOR_TYPES = [("null", None), ("number", "number"), ("string", "string"), ("bool", "bool")]
+_TYPE_RANK = {name: rank for rank, (name, _) in enumerate(CURSOR_TYPES)}
+
+
+def _value_type(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+class CursorError(ValueError):
+    """Raised for a page cursor or limit the client sent that cannot be used."""
+
+
+def encode_cursor(doc):
+    """Build the cursor that continues a listing after this document."""
+    # A missing field sorts as null
+    raw = json.dumps([doc.get("timestamp"), doc.get("id")], default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Read a cursor made by encode_cursor.
+
+    Returns:
+        tuple: (timestamp, id)
+
+    Raises:
+        CursorError: If the cursor is malformed
+    """
+    try:
+        timestamp, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error, UnicodeEncodeError):
+        raise CursorError("Invalid cursor")
+    if _value_type(timestamp) is None or _value_type(doc_id) is None:
+        raise CursorError("Invalid cursor")
+    return timestamp, doc_id
+
+
+def parse_limit(value):
+    """Read a page size from a query parameter, defaulting and capping it."""
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise CursorError("limit must be an integer")
+    if limit < 1:
+        raise CursorError("limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _sorts_after(field, value):
+    """
+    Conditions matching the values of a field that sort after value in descending order.
+
+    Those are the smaller values of the same type and every value of a type
+    MongoDB sorts lower; a range query alone only matches the same type.
+
+    Returns:
+        list: Filter documents to combine with $or
+    """
+    value_type = _value_type(value)
+    conditions = [] if value_type == "null" else [{field: {"$lt": value}}]
+    for type_name, type_alias in CURSOR_TYPES[:_TYPE_RANK[value_type]]:
+        # {field: None} also matches documents without the field, which sort as null
+        conditions.append({field: None} if type_alias is None else {field: {"$type": type_alias}})
+    return conditions
+
+
+def page_filter(base_filter, cursor=None):
+    """
+    Restrict a filter to the documents after a cursor in SORT_ORDER.
+
+    Args:
+        base_filter (dict): The listing's filter, e.g. {"userId": ...}
+        cursor (str, optional): Cursor from the previous page
+
+    Returns:
+        dict: The MongoDB filter for the page
+    """
+    if not cursor:
+        return base_filter
+    timestamp, doc_id = decode_cursor(cursor)
+    conditions = _sorts_after("timestamp", timestamp)
+    id_conditions = _sorts_after("id", doc_id)
+    if id_conditions:
+        conditions.append({"timestamp": timestamp, "$or": id_conditions})
+    if not conditions:
+        # Nothing sorts after a null timestamp and id: match no document
+        return {"$and": [base_filter, {"_id": {"$exists": False}}]}
+    return {"$and": [base_filter, {"$or": conditions}]}
+
+
+class Page:
+    """
+    One page of a listing, read lazily from MongoDB.
+
+    Iterating yields the page's documents; afterwards ``next_cursor`` is the
+    cursor for the following page, or None on the last page. One document
+    more than the limit is requested, to tell whether there is a next page
+    without a count query.
+    """
+
+    def __init__(self, collection, base_filter, projection, limit, cursor=None):
+        """
+        Args:
+            collection (pymongo.collection.Collection): Collection to list
+            base_filter (dict): The listing's filter
+            projection (dict): Fields to return (an inclusion projection)
+            limit (int): Page size
+            cursor (str, optional): Cursor from the previous page
+
+        Raises:
+            CursorError: If the cursor is malformed
+        """
+        self.collection = collection
+        self.filter = page_filter(base_filter, cursor)
+        # The cursor is built from the last document's sort keys
+        self.projection = {**projection, "timestamp": 1, "id": 1}
+        self.limit = limit
+        self.next_cursor = None
+
+    def __iter__(self):
+        documents = self.collection.find(
+            self.filter, self.projection, sort=SORT_ORDER,
+            limit=self.limit + 1, batch_size=min(self.limit + 1, STREAM_BATCH_SIZE)
+        )
+        last = None
+        for count, doc in enumerate(documents):
+            if count == self.limit:
+                self.next_cursor = encode_cursor(last)
+                return
+            last = doc
+            yield doc
+
+
+def stream_json_array(documents, to_item):
+    """
+    Yield a JSON array of to_item(doc) for each document, piece by piece.
+
+    Values JSON has no type for (datetime or ObjectId in older documents)
+    are written as strings rather than failing the response midway.
+    """
+    yield "["
+    for count, doc in enumerate(documents):
+        yield ("," if count else "") + json.dumps(to_item(doc), default=str)
+    yield "]"
+
+
+def stream_page(page, to_item, ndjson=False):
+    """
+    Serialise a Page.
+
+    As JSON the body is {"items": [...], "next_cursor": ...}; as NDJSON it is
+    one item per line followed by a {"next_cursor": ...} line.
+
+    Args:
+        page (Page): The page to write
+        to_item (callable): Builds the response item for a document
+        ndjson (bool): Whether to write NDJSON
+
+    Yields:
+        str: Pieces of the response body
+    """
+    if ndjson:
+        for doc in page:
+            yield json.dumps(to_item(doc), default=str) + "\n"
+        yield json.dumps({"next_cursor": page.next_cursor}) + "\n"
+    else:
+        yield '{"items":'
+        yield from stream_json_array(page, to_item)
+        yield ',"next_cursor":' + json.dumps(page.next_cursor) + "}"
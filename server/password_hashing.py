@@ -0,0 +1,134 @@
+"""
+Password Hashing Module - bcrypt hashing off the request threads
+
+bcrypt is deliberately slow: one hash at the default cost of 12 rounds takes
+a few hundred milliseconds of CPU. Run inside the request handlers, a burst
+of logins at the start of an exam session ties up the gunicorn worker
+threads for that long each. Here hashing and checking run in a small process
+pool of PASSWORD_HASH_WORKERS processes, so a burst of logins uses at most
+that many cores and the request threads only wait on a future.
+
+The work factor is BCRYPT_ROUNDS. Hashes made with a different number of
+rounds still verify; check_password returns a new hash for them so the
+caller can store it (rehash on login), and stored hashes move to the current
+cost as users log in.
+
+This module is imported by the pool processes, so it must not import the
+Flask app or the database. Spawned processes also re-import the main script
+as ``__mp_main__`` (app.py under ``python app.py``), which therefore keeps
+its startup side effects behind a check of ``__name__``.
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt work factor (log2 of the iterations) for new hashes
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Hashing processes per server worker (0 hashes inline on the request thread)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+# Longest a request waits for a hash before failing
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", 30))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(password, hashed, rounds):
+    """Check a password and, if it matches a hash of another cost, rehash it."""
+    if not bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8")):
+        return False, None
+    if hash_rounds(hashed) != rounds:
+        return True, _hash(password, rounds)
+    return True, None
+
+
+def hash_rounds(hashed):
+    """
+    Read the work factor of a bcrypt hash.
+
+    Returns:
+        int or None: The rounds, or None if the hash is not a bcrypt hash
+    """
+    parts = hashed.split("$")
+    # "$2b$12$<salt and digest>" splits into ["", "2b", "12", ...]
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked: the server process has threads
+            # (request handlers, job workers) that a fork would copy mid-flight
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _run(function, *args):
+    """Run a hashing function in the pool, or inline when the pool is disabled or broken."""
+    if PASSWORD_HASH_WORKERS <= 0:
+        return function(*args)
+    global _executor
+    try:
+        return _get_executor().submit(function, *args).result(timeout=PASSWORD_HASH_TIMEOUT_SECONDS)
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory); start a new pool next time
+        logger.error("Password hashing pool is broken; hashing inline and restarting the pool")
+        with _executor_lock:
+            _executor = None
+        return function(*args)
+
+
+def hash_password(password, rounds=None):
+    """
+    Hash a password for storing.
+
+    Args:
+        password (str): The password
+        rounds (int, optional): Work factor; defaults to BCRYPT_ROUNDS
+
+    Returns:
+        str: The bcrypt hash
+    """
+    return _run(_hash, password, rounds or BCRYPT_ROUNDS)
+
+
+def check_password(password, hashed, rounds=None):
+    """
+    Check a password against a stored hash.
+
+    Args:
+        password (str): The password the user sent
+        hashed (str): The stored bcrypt hash
+        rounds (int, optional): Current work factor; defaults to BCRYPT_ROUNDS
+
+    Returns:
+        tuple: (matches, new_hash). new_hash is set when the password matches
+        a hash of another work factor and should replace the stored hash.
+    """
+    return _run(_check, password, hashed, rounds or BCRYPT_ROUNDS)
+
+
+def shutdown():
+    """Stop the hashing processes."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -2,36 +2,285 @@
 PDF Utilities Module - Handles PDF processing separately from OCR functionality
 """
 
+import os
 import fitz  # PyMuPDF
 from PIL import Image
 import io
+import queue
+import threading
+import image_prep
 
-def pdf_to_images(pdf_path, dpi=300):
+# Number of rendered pages that may wait ahead of the consumer
+DEFAULT_PREFETCH = 1
+
+# Use the embedded text of born-digital pages instead of rasterizing them for OCR
+PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "true").lower() == "true"
+# A page needs at least this much embedded text to skip OCR
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 40))
+# Pages where images cover more than this share of the area are treated as scans
+TEXT_LAYER_MAX_IMAGE_COVERAGE = 0.5
+
+_END = object()
+
+
+def get_page_count(pdf_path):
     """
-    Convert a PDF file to a list of PIL Image objects.
-    
+    Return the number of pages in a PDF without rendering anything.
+
     Args:
         pdf_path (str): Path to the PDF file
-        dpi (int): Resolution for the image conversion (higher = better quality but larger files)
-        
+
     Returns:
-        list: List of PIL Image objects, one per page
+        int: Number of pages
+    """
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def _page_range(page_count, first_page=None, last_page=None):
+    """Resolve 1-based inclusive page bounds against the document length."""
+    start = max(1, first_page or 1)
+    end = min(page_count, last_page or page_count)
+    return range(start - 1, end)
+
+
+def extract_text_layer(page):
+    """
+    Return the embedded text of a page if it is good enough to skip OCR.
+
+    Born-digital pages (typed answers exported to PDF) carry an exact text
+    layer. Scanned pages either have none, or an invisible layer added by the
+    scanner on top of a full-page image, which is rejected here because it is
+    useless for handwriting.
+
+    Args:
+        page (fitz.Page): Page to inspect
+
+    Returns:
+        str or None: The page text, or None if the page should be OCR'd
     """
-    images = []
+    text = page.get_text("text").strip()
+    if len(text) < TEXT_LAYER_MIN_CHARS:
+        return None
+
+    # Broken font encodings come out as replacement or control characters
+    visible = [c for c in text if not c.isspace()]
+    garbage = sum(1 for c in visible if c == "\ufffd" or not c.isprintable())
+    if garbage > 0.02 * len(visible):
+        return None
+    if sum(1 for c in visible if c.isalnum()) < 0.5 * len(visible):
+        return None
+
+    page_area = abs(page.rect)
+    if page_area:
+        image_area = 0.0
+        for info in page.get_image_info():
+            bbox = fitz.Rect(info["bbox"]) & page.rect
+            image_area += abs(bbox)
+        if image_area / page_area > TEXT_LAYER_MAX_IMAGE_COVERAGE:
+            return None
+
+    return text
+
+
+class RenderedPage:
+    """
+    A rendered PDF page carrying its already-encoded image bytes.
+
+    The bytes produced by PyMuPDF are passed straight to the OCR request, so
+    a page is encoded once and never decoded unless a caller explicitly asks
+    for a PIL image. Pages with a usable text layer carry ``text`` instead
+    and have no image data.
+    """
+
+    __slots__ = ("number", "data", "mime_type", "width", "height", "metrics", "text", "ink_class")
+
+    def __init__(self, number, data, mime_type="image/png", width=None, height=None, metrics=None, text=None,
+                 ink_class=None):
+        self.number = number
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        # image_prep.PageMetrics when the page went through image preparation
+        self.metrics = metrics
+        # Embedded text for born-digital pages, which need no OCR
+        self.text = text
+        # image_prep.INK_BLANK / INK_SPARSE / INK_CONTENT, or None if not checked
+        self.ink_class = ink_class
+
+    @property
+    def is_blank(self):
+        """True for pages classified as blank, which carry no image data."""
+        return self.ink_class == image_prep.INK_BLANK
+
+    def to_image(self):
+        """Decode the page into a PIL Image."""
+        return Image.open(io.BytesIO(self.data))
+
+    def __repr__(self):
+        if self.is_blank:
+            return f"RenderedPage(number={self.number}, blank)"
+        if self.text is not None:
+            return f"RenderedPage(number={self.number}, text layer, {len(self.text)} chars)"
+        return f"RenderedPage(number={self.number}, {self.width}x{self.height}, {len(self.data)} bytes)"
+
+
+def _render_page(page, dpi, detect_blank=False):
+    """Render a single PyMuPDF page to a RenderedPage holding PNG bytes."""
+    # Adjust the scale factor based on DPI (1.5 is approximately 144 DPI)
+    # For 300 DPI, use 3.125 (300/96)
+    scale_factor = dpi / 96
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor))
+    ink_class = None
+    if detect_blank:
+        ink_class, _ = image_prep.classify_pixmap(pix)
+        if ink_class == image_prep.INK_BLANK:
+            # Nothing to upload, so don't bother encoding it
+            return RenderedPage(page.number + 1, None, None, pix.width, pix.height, ink_class=ink_class)
+    return RenderedPage(page.number + 1, pix.tobytes("png"), "image/png", pix.width, pix.height,
+                        ink_class=ink_class)
+
+
+def _prepare_page(page, detect_blank=False):
+    """Render a single PyMuPDF page at an adaptive DPI in a compact encoding."""
+    metrics = image_prep.preview_page(page)
+    if detect_blank and metrics.ink_class == image_prep.INK_BLANK:
+        # The preview is enough to tell; skip the full-resolution render
+        return RenderedPage(page.number + 1, None, None, metrics=metrics, ink_class=metrics.ink_class)
+    prepared = image_prep.prepare_pdf_page(page, metrics)
+    return RenderedPage(page.number + 1, prepared.data, prepared.mime_type,
+                        prepared.width, prepared.height, prepared.metrics,
+                        ink_class=metrics.ink_class if detect_blank else None)
+
+
+def _render_pages(pdf_path, dpi, first_page, last_page, optimize=False, text_layer=False, detect_blank=False):
+    """Render pages one at a time, opening and closing the document around the loop."""
     try:
         doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            # Adjust the scale factor based on DPI (1.5 is approximately 144 DPI)
-            # For 300 DPI, use 3.125 (300/96)
-            scale_factor = dpi / 96
-            pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor))
-            img_bytes = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_bytes))
-            images.append(img)
-        doc.close()
     except Exception as e:
         print(f"Error converting PDF to images: {e}")
         raise Exception(f"Failed to convert PDF to images: {str(e)}")
-    
-    return images
+
+    try:
+        for page_num in _page_range(len(doc), first_page, last_page):
+            try:
+                page = doc.load_page(page_num)
+                text = extract_text_layer(page) if text_layer else None
+                if text is not None:
+                    rendered = RenderedPage(page_num + 1, None, None, text=text)
+                elif optimize:
+                    rendered = _prepare_page(page, detect_blank)
+                else:
+                    rendered = _render_page(page, dpi, detect_blank)
+            except Exception as e:
+                print(f"Error converting PDF page {page_num + 1} to image: {e}")
+                raise Exception(f"Failed to convert PDF to images: {str(e)}")
+            yield rendered
+    finally:
+        doc.close()
+
+
+def iter_pdf_pages(pdf_path, dpi=300, first_page=None, last_page=None, prefetch=DEFAULT_PREFETCH,
+                   optimize=False, text_layer=False, detect_blank=False):
+    """
+    Lazily render a PDF file page by page.
+
+    Pages are rendered on demand so that only the page being consumed (plus at
+    most ``prefetch`` pages rendered ahead on a background thread) is held in
+    memory, regardless of the page count.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        dpi (int): Resolution for the image conversion (higher = better quality but larger files)
+        first_page (int, optional): First page to render (1-based, inclusive)
+        last_page (int, optional): Last page to render (1-based, inclusive)
+        prefetch (int): Maximum number of pages rendered ahead of the consumer.
+            0 renders synchronously in the caller's thread.
+        optimize (bool): Pass each page through image_prep, which picks the
+            DPI and colour space per page, trims blank margins and encodes
+            under a byte budget. ``dpi`` is ignored when set.
+        text_layer (bool): Return pages with a usable embedded text layer as
+            text-only RenderedPages instead of rasterizing them.
+        detect_blank (bool): Classify each page's ink coverage with
+            image_prep.classify_ink; blank pages carry no image data.
+
+    Yields:
+        RenderedPage: One encoded page at a time, in page order
+    """
+    if prefetch <= 0:
+        yield from _render_pages(pdf_path, dpi, first_page, last_page, optimize, text_layer, detect_blank)
+        return
+
+    # The bounded queue is the look-ahead window: the renderer blocks once it
+    # is ``prefetch`` pages ahead of the consumer.
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def renderer():
+        try:
+            for rendered in _render_pages(pdf_path, dpi, first_page, last_page, optimize, text_layer,
+                                          detect_blank):
+                if not put(rendered):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=renderer, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = pages.get()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stop the renderer if the consumer bails out early
+        stop.set()
+        thread.join()
+
+
+def iter_pdf_images(pdf_path, dpi=300, first_page=None, last_page=None, prefetch=DEFAULT_PREFETCH):
+    """
+    Lazily convert a PDF file to PIL Image objects, one page at a time.
+
+    Same as :func:`iter_pdf_pages` but decodes each page; prefer
+    iter_pdf_pages when the bytes are only going to be uploaded.
+
+    Yields:
+        PIL.Image.Image: One image per page, in page order
+    """
+    for rendered in iter_pdf_pages(pdf_path, dpi, first_page, last_page, prefetch):
+        yield rendered.to_image()
+
+
+def pdf_to_images(pdf_path, dpi=300, first_page=None, last_page=None):
+    """
+    Convert a PDF file to a list of PIL Image objects.
+
+    Prefer :func:`iter_pdf_pages` for large documents; this materialises
+    every page in memory at once.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        dpi (int): Resolution for the image conversion (higher = better quality but larger files)
+        first_page (int, optional): First page to render (1-based, inclusive)
+        last_page (int, optional): Last page to render (1-based, inclusive)
+
+    Returns:
+        list: List of PIL Image objects, one per page
+    """
+    return list(iter_pdf_images(pdf_path, dpi, first_page, last_page, prefetch=0))
@@ -52,11 +52,18 @@ def get_professors(question_paper_text=None):
     
     Returns:
         dict: Dictionary containing professor personas with their system messages.
+            Each also has a ``title`` (who the professor is), a ``focus`` (one-line
+            instruction used by the single-call and batch prompts) and, for the
+            three evaluators, the ``perspective`` they grade from.
     """
+    title = "Professor Sharma, a supportive Assistant Professor in Computer Science"
     return {
         "Theoretical_Evaluator": {
             "name": "Theoretical_Evaluator",
-            "system_message": """You are Professor Sharma, a supportive Assistant Professor in Computer Science with 10 years of expertise, acting as a Theoretical Evaluator.
+            "title": title,
+            "perspective": "Theoretical",
+            "focus": "credit any attempt at the required theoretical concepts, even if imprecise.",
+            "system_message": f"""You are {title} with 10 years of expertise, acting as a Theoretical Evaluator.
 
 Your evaluation priorities:
 - Recognizing ATTEMPTS at addressing theoretical concepts, even if imperfect
@@ -71,7 +78,10 @@ Remember that you are only conducting the first step of a three-step evaluation
         },
         "Practical_Evaluator": {
             "name": "Practical_Evaluator",
-            "system_message": """You are Professor Sharma, a supportive Assistant Professor in Computer Science with 10 years of expertise, acting as a Practical Evaluator.
+            "title": title,
+            "perspective": "Practical",
+            "focus": "credit directionally correct examples and applications, even if flawed.",
+            "system_message": f"""You are {title} with 10 years of expertise, acting as a Practical Evaluator.
 
 Your evaluation priorities:
 - Recognizing ATTEMPTS at practical application, even if the execution is flawed
@@ -86,7 +96,10 @@ Remember that you are only conducting the first step of a three-step evaluation
         },
         "Holistic_Evaluator": {
             "name": "Holistic_Evaluator",
-            "system_message": """You are Professor Sharma, a supportive Assistant Professor in Computer Science with 10 years of expertise, acting as a Holistic Evaluator.
+            "title": title,
+            "perspective": "Holistic",
+            "focus": "credit overall effort, clarity and engagement with the material.",
+            "system_message": f"""You are {title} with 10 years of expertise, acting as a Holistic Evaluator.
 
 Your evaluation priorities:
 - Appreciating the OVERALL EFFORT demonstrated in the answer
@@ -101,7 +114,10 @@ Remember that you are only conducting the first step of a three-step evaluation
         },
         "Consensus_Evaluator": {
             "name": "Consensus_Evaluator",
-            "system_message": """You are Professor Sharma, a supportive Assistant Professor in Computer Science with 10 years of expertise, responsible for facilitating the final consensus after all three evaluators have provided their perspectives.
+            "title": title,
+            "focus": ("review the three perspectives and settle on a final grade that leans toward the highest "
+                      "proposed grade. Any genuine attempt receives at least 70% of the available marks."),
+            "system_message": f"""You are {title} with 10 years of expertise, responsible for facilitating the final consensus after all three evaluators have provided their perspectives.
 
 Your task is to:
 1. Review the evaluations from the Theoretical, Practical, and Holistic perspectives
@@ -117,3 +133,84 @@ Your task is to:
 In cases of doubt or disagreement between evaluators, ALWAYS default to the more generous interpretation. Ensure that any student who has made a genuine attempt receives at least 70% of the available marks. Your final evaluation should be encouraging and supportive, focusing on future improvement rather than current deficiencies."""
         }
     }
+
+def persona_fields(professors):
+    """
+    Describe the personas for the {persona} and {perspectives} placeholders
+    of SINGLE_CALL_EVALUATION_PROMPT and BATCH_EVALUATION_PROMPT.
+    
+    Args:
+        professors (dict): Personas from get_professors
+    
+    Returns:
+        dict: The persona and perspectives format arguments
+    """
+    evaluators = [professors[key] for key in ("Theoretical_Evaluator", "Practical_Evaluator", "Holistic_Evaluator")]
+    consensus = professors["Consensus_Evaluator"]
+    lines = [f"{number}. {evaluator['perspective']} perspective ({evaluator['name']}): {evaluator['focus']}"
+             for number, evaluator in enumerate(evaluators, 1)]
+    lines.append(f"{len(lines) + 1}. Consensus ({consensus['name']}): {consensus['focus']}")
+    return {"persona": consensus["title"], "perspectives": "\n".join(lines)}
+
+# Single-call evaluation prompt: all three perspectives and the consensus in one JSON response,
+# formatted with persona_fields(professors)
+SINGLE_CALL_EVALUATION_PROMPT = """You are {persona}, running a MULTI-PERSPECTIVE EVALUATION of a student's answer on Object-Oriented Programming.
+
+QUESTION {question_num} [{max_marks} marks]:
+{question_text}
+
+STUDENT'S ANSWER:
+{answer}
+
+EVALUATION INSTRUCTIONS:
+{perspectives}
+
+Return ONLY a JSON object with this exact structure and no other text:
+{{
+  "theoretical": {{"score": <number out of {max_marks}>, "rationale": "<one or two sentences>"}},
+  "practical": {{"score": <number out of {max_marks}>, "rationale": "<one or two sentences>"}},
+  "holistic": {{"score": <number out of {max_marks}>, "rationale": "<one or two sentences>"}},
+  "consensus": {{
+    "score": <number out of {max_marks}>,
+    "feedback": "<concise feedback addressing main points>",
+    "strengths": ["<strength>", ...],
+    "improvements": ["<area for improvement>", ...]
+  }}
+}}"""
+
+# Batched evaluation prompt: several questions, one JSON result per question,
+# formatted with persona_fields(professors)
+BATCH_EVALUATION_PROMPT = """You are {persona}, running a BATCH EVALUATION of a student's answers on Object-Oriented Programming.
+
+Evaluate EACH question below independently.
+
+EVALUATION INSTRUCTIONS:
+{perspectives}
+
+{questions}
+
+Return ONLY a JSON array with one object per question, in the order given, with this exact structure and no other text:
+[
+  {{
+    "item": <item number as given>,
+    "questionNumber": "<question number as given>",
+    "theoretical": {{"score": <number>, "rationale": "<one sentence>"}},
+    "practical": {{"score": <number>, "rationale": "<one sentence>"}},
+    "holistic": {{"score": <number>, "rationale": "<one sentence>"}},
+    "consensus": {{
+      "score": <number>,
+      "feedback": "<concise feedback>",
+      "strengths": ["<strength>", ...],
+      "improvements": ["<area for improvement>", ...]
+    }}
+  }},
+  ...
+]"""
+
+# One question inside BATCH_EVALUATION_PROMPT
+BATCH_QUESTION_TEMPLATE = """### ITEM {index} - QUESTION {question_num} [{max_marks} marks]:
+{question_text}
+
+STUDENT'S ANSWER:
+{answer}
+"""
@@ -0,0 +1,179 @@
+"""
+Result Cache Module - Persistent, size-bounded key/value cache for expensive model calls
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Default location for cache databases (shared by all gunicorn workers on a host)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+
+
+def make_key(*parts):
+    """
+    Build a cache key from an ordered list of parts.
+
+    Args:
+        *parts: str or bytes values; each part is length-prefixed so that
+            ("ab", "c") and ("a", "bc") produce different keys
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(str(len(part)).encode("ascii") + b":")
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A SQLite-backed cache with LRU and TTL eviction and hit/miss counters.
+
+    Each cache keeps its entries in the ``entries`` table of its own database
+    file (CACHE_DIR/<name>.sqlite3 unless a path is given); two caches must
+    not be given the same path, as their entries and limits would be mixed.
+    Lookups refresh the access time; writes evict expired rows
+    first and then the least recently used rows until both the entry and the
+    byte limits hold.
+    """
+
+    def __init__(self, name, path=None, max_entries=5000, max_bytes=200 * 1024 * 1024, ttl_seconds=30 * 86400):
+        self.name = name
+        self.path = path or os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            # WAL lets other worker processes read while one of them writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Args:
+            key (str): Cache key, usually from make_key
+
+        Returns:
+            str or None: The cached value, or None on a miss or expired entry
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row and (not self.ttl_seconds or now - row[1] <= self.ttl_seconds):
+                    conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    self.hits += 1
+                    return row[0]
+                self.misses += 1
+                return None
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.name}' lookup failed: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """
+        Store a value and evict entries beyond the TTL, entry and byte limits.
+
+        Args:
+            key (str): Cache key, usually from make_key
+            value (str): Value to store
+        """
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now),
+                )
+                self._evict(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.name}' write failed: {e}")
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+            return
+
+        # Walk from least to most recently used until both limits are satisfied
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return counters for this process and the current size of the store.
+
+        Returns:
+            dict: hits, misses, hit_ratio, entries and bytes
+        """
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": 0,
+            "bytes": 0,
+        }
+        try:
+            with self._lock:
+                count, total = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+                ).fetchone()
+            stats["entries"] = count
+            stats["bytes"] = total
+        except sqlite3.Error as e:
+            logger.error(f"Cache '{self.name}' stats failed: {e}")
+        return stats
@@ -0,0 +1,188 @@
+"""
+Text Store Module - Compressed and external storage of large text fields
+
+OCR text and evaluation markdown make up most of the bytes in the
+extracted_texts and evaluations collections. Values above
+TEXT_COMPRESS_MIN_BYTES are stored zlib-compressed in a sibling field
+(``extractedText`` -> ``extractedTextZ``), and compressed values above
+TEXT_GRIDFS_MIN_BYTES are moved to GridFS with only a reference kept in the
+document (``extractedTextRef``). Short values stay as plain strings.
+
+Listings project the text fields away, so nothing is decompressed there;
+unpack_field decompresses (and reads from GridFS) only when a route needs
+the text.
+"""
+
+import os
+import zlib
+import logging
+import gridfs
+from bson import Binary
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Store text fields compressed once their UTF-8 size reaches this many bytes (0 disables compression)
+TEXT_COMPRESS_MIN_BYTES = int(os.getenv("TEXT_COMPRESS_MIN_BYTES", 4096))
+# Move compressed text of at least this many bytes to GridFS (documents are limited to 16 MB)
+TEXT_GRIDFS_MIN_BYTES = int(os.getenv("TEXT_GRIDFS_MIN_BYTES", 4 * 1024 * 1024))
+TEXT_COMPRESS_LEVEL = 6
+GRIDFS_BUCKET = "text_blobs"
+
+# Large text fields, by collection
+PACKED_FIELDS = {
+    "extracted_texts": ("extractedText",),
+    "evaluations": ("markdownContent",),
+}
+COMPRESSED_SUFFIX = "Z"
+GRIDFS_SUFFIX = "Ref"
+
+
+def _gridfs():
+    return gridfs.GridFS(database.db, collection=GRIDFS_BUCKET)
+
+
+def pack_text(field, text):
+    """
+    Choose how to store one text value.
+
+    Args:
+        field (str): Field name, e.g. "extractedText"
+        text (str): The value
+
+    Returns:
+        dict: The fields to set; exactly one of field, fieldZ or fieldRef
+    """
+    if text is None or not isinstance(text, str):
+        return {field: text}
+    raw = text.encode("utf-8")
+    if not TEXT_COMPRESS_MIN_BYTES or len(raw) < TEXT_COMPRESS_MIN_BYTES:
+        return {field: text}
+    compressed = zlib.compress(raw, TEXT_COMPRESS_LEVEL)
+    if len(compressed) >= TEXT_GRIDFS_MIN_BYTES:
+        blob_id = _gridfs().put(compressed, field=field)
+        return {field + GRIDFS_SUFFIX: blob_id}
+    return {field + COMPRESSED_SUFFIX: Binary(compressed)}
+
+
+def pack_document(collection_name, doc):
+    """Return a copy of a document with its large text fields packed for storage."""
+    packed = dict(doc)
+    for field in PACKED_FIELDS.get(collection_name, ()):
+        if field in packed:
+            packed.update(pack_text(field, packed.pop(field)))
+    return packed
+
+
+def pack_update(collection_name, fields):
+    """
+    Build a $set/$unset update that stores fields with their text packed.
+
+    The storage variants not chosen are unset, so an overwritten document
+    never keeps a stale copy of the text in another form. The GridFS blobs
+    an unset reference pointed to are not deleted here; use update_document
+    to write the update and clean them up.
+
+    Returns:
+        dict: The update document
+    """
+    packed = pack_document(collection_name, fields)
+    unset = {}
+    for field in PACKED_FIELDS.get(collection_name, ()):
+        if field in fields:
+            for variant in (field, field + COMPRESSED_SUFFIX, field + GRIDFS_SUFFIX):
+                if variant not in packed:
+                    unset[variant] = ""
+    update = {"$set": packed}
+    if unset:
+        update["$unset"] = unset
+    return update
+
+
+def _blob_refs(doc, collection_name):
+    """The GridFS blob ids a stored document references."""
+    refs = [doc.get(field + GRIDFS_SUFFIX) for field in PACKED_FIELDS.get(collection_name, ())]
+    return [ref for ref in refs if ref is not None]
+
+
+def update_document(collection, query, fields, upsert=False):
+    """
+    Set fields on the document matching a query, with their text packed.
+
+    GridFS blobs the document referenced before the update are deleted once
+    the update has been written, as delete_documents does for deleted
+    documents; if the write fails, the blobs made for the new values are
+    deleted instead, so neither path leaves unreferenced blobs behind.
+
+    Args:
+        collection: The collection
+        query (dict): Filter of the document to update
+        fields (dict): Fields to set
+        upsert (bool): Insert the document if none matches
+
+    Returns:
+        dict or None: The GridFS references of the document before the
+        update, or None if no document matched
+    """
+    update = pack_update(collection.name, fields)
+    new_refs = _blob_refs(update["$set"], collection.name)
+    ref_fields = [field + GRIDFS_SUFFIX for field in PACKED_FIELDS.get(collection.name, ())]
+    try:
+        # Returns the document as it was, so the old references are those of
+        # exactly the document this update replaced
+        previous = collection.find_one_and_update(query, update, projection={ref: 1 for ref in ref_fields},
+                                                  upsert=upsert)
+    except Exception:
+        for blob_id in new_refs:
+            _gridfs().delete(blob_id)
+        raise
+    if previous is not None:
+        for blob_id in _blob_refs(previous, collection.name):
+            if blob_id not in new_refs:
+                _gridfs().delete(blob_id)
+    return previous
+
+
+def unpack_field(doc, field, default=""):
+    """
+    Read a text field of a stored document, whichever way it was stored.
+
+    Args:
+        doc (dict): The document (its projection must include the packed variants)
+        field (str): Field name, e.g. "extractedText"
+        default: Returned if the document has no such field
+
+    Returns:
+        str: The text
+    """
+    if field in doc:
+        return doc[field]
+    if field + COMPRESSED_SUFFIX in doc:
+        return zlib.decompress(doc[field + COMPRESSED_SUFFIX]).decode("utf-8")
+    if field + GRIDFS_SUFFIX in doc:
+        return zlib.decompress(_gridfs().get(doc[field + GRIDFS_SUFFIX]).read()).decode("utf-8")
+    return default
+
+
+def projection_fields(field):
+    """The stored field names a projection needs to read a text field."""
+    return (field, field + COMPRESSED_SUFFIX, field + GRIDFS_SUFFIX)
+
+
+def delete_documents(collection, query):
+    """
+    Delete the documents matching a query together with their GridFS blobs.
+
+    Returns:
+        int: Number of documents deleted
+    """
+    ref_fields = [field + GRIDFS_SUFFIX for field in PACKED_FIELDS.get(collection.name, ())]
+    if ref_fields:
+        blobs = collection.find({"$and": [query, {"$or": [{ref: {"$exists": True}} for ref in ref_fields]}]},
+                                {ref: 1 for ref in ref_fields})
+        for doc in blobs:
+            for ref in ref_fields:
+                if ref in doc:
+                    _gridfs().delete(doc[ref])
+    return collection.delete_many(query).deleted_count